@@ -0,0 +1,69 @@
+"""Compare Octree queries with cKDTree on uniform random points.
+
+Not run by the test suite. Usage:
+
+    python benchmarks/octree_queries.py [n_points ...]
+
+Default sizes are 10M, 50M and 100M points. 50M points peak at about
+4.5 GB of RAM and 100M at about 9 GB. Each index is built and queried alone, so only one of them is in memory
+at a time.
+"""
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pyntcloud.structures import Octree
+
+N_QUERIES = 100000
+K = 8
+BOX = [0.1, 0.2, 0.3], [0.6, 0.5, 0.9]
+
+
+def timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return result, time.time() - start
+
+
+def build_octree(points):
+    octree = Octree(points=points, max_level=10)
+    octree.compute()
+    return octree
+
+
+def run(n, seed=0):
+    rng = np.random.RandomState(seed)
+    points = rng.rand(n, 3)
+    queries = points[rng.choice(n, N_QUERIES, replace=False)]
+    # about K points inside each ball
+    r = (K / n * 3 / (4 * np.pi)) ** (1 / 3)
+
+    times = {}
+    octree, times["octree build"] = timed(build_octree, points)
+    # the first call compiles the numba kernels
+    octree.query_knn(queries[:10], K)
+    octree.query_radius(queries[:10], r)
+    times["octree knn"] = timed(octree.query_knn, queries, K)[1]
+    times["octree radius"] = timed(octree.query_radius, queries, r)[1]
+    times["octree box"] = timed(octree.query_box, *BOX)[1]
+    del octree
+
+    kdtree, times["cKDTree build"] = timed(cKDTree, points)
+    times["cKDTree knn"] = timed(kdtree.query, queries, K)[1]
+    times["cKDTree radius"] = timed(kdtree.query_ball_point, queries, r)[1]
+    del kdtree
+
+    lo, hi = BOX
+    times["box linear scan"] = timed(lambda: np.flatnonzero(np.all((points > lo) & (points < hi), 1)))[1]
+    return times
+
+
+if __name__ == "__main__":
+    sizes = [int(float(x)) for x in sys.argv[1:]] or [10 ** 7, 5 * 10 ** 7, 10 ** 8]
+    for n in sizes:
+        times = run(n)
+        print("{} points, {} queries".format(n, N_QUERIES))
+        for name, seconds in times.items():
+            print("    {:<16} {:8.3f} s".format(name, seconds))
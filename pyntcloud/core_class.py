@@ -7,6 +7,7 @@ from .structures.base import StructuresDict
 from .filters import ALL_FILTERS
 from .io import FROM, TO
 from .neighbors import k_neighbors, r_neighbors
+from .pipeline import Pipeline
 from .plot import DESCRIPTION
 from .plot.matplotlib_backend import plot_with_matplotlib
 from .plot.threejs_backend import plot_with_threejs
@@ -14,12 +15,17 @@ from .plot.pythreejs_backend import plot_with_pythreejs
 from .samplers import ALL_SAMPLERS
 from .scalar_fields import ALL_SF
 from .structures import ALL_STRUCTURES
+from .structures import cache
 from .utils.dataframe import convert_columns_dtype
+from .utils.shared import SharedPyntCloudHandle
 
 
 class PyntCloud(object):
     """A Pythonic Point Cloud."""
 
+    #: optional scalar_fields.ScalarFieldCache used by add_scalar_field
+    sf_cache = None
+
     def __init__(self, points, mesh=None, structures={}, **kwargs):
         """Create PyntCloud.
 
@@ -39,6 +45,7 @@ class PyntCloud(object):
 
         kwargs: custom attributes
         """
+        self._selection = None
         self.points = points
         self.mesh = mesh
         self.structures = StructuresDict()
@@ -54,6 +61,9 @@ class PyntCloud(object):
         default = [
             "_PyntCloud__points",
             "_PyntCloud__mesh",
+            "_selection",
+            "_sf_memo",
+            "_shared",
             "structures",
             "xyz",
             "centroid"
@@ -67,7 +77,7 @@ class PyntCloud(object):
             n_faces = len(self.mesh)
 
         return DESCRIPTION.format(
-            len(self.points), len(self.points.columns) - 3,
+            len(self.xyz), len(self.__points.columns) - 3,
             n_faces,
             self.structures.n_kdtrees,
             self.structures.n_voxelgrids,
@@ -76,6 +86,8 @@ class PyntCloud(object):
 
     @property
     def points(self):
+        if self._selection is not None:
+            self._compact_points()
         return self.__points
 
     @points.setter
@@ -105,7 +117,7 @@ class PyntCloud(object):
             self.__mesh = None
 
     @classmethod
-    def from_file(cls, filename, **kwargs):
+    def from_file(cls, filename, structures_dir=None, load_structures=False, **kwargs):
         """Extract data from file and construct a PyntCloud with it.
 
         Parameters
@@ -113,6 +125,16 @@ class PyntCloud(object):
         filename: str
             Path to the file from which the data will be read
 
+        structures_dir: str, optional
+            Default: None
+            Path of a structures cache directory (see PyntCloud.to_file).
+            Structures saved there for the same xyz values are loaded instead
+            of being rebuilt. They are unpickled, so only use trusted directories.
+
+        load_structures: bool, optional
+            Default: False
+            If True and structures_dir is None, "{filename}.structures" is used.
+
         kwargs: only usable in some formats
 
         Returns
@@ -124,8 +146,64 @@ class PyntCloud(object):
         if ext not in FROM:
             raise ValueError(
                 "Unsupported file format; supported formats are: {}".format(list(FROM)))
-        else:
-            return cls(**FROM[ext](filename, **kwargs))
+
+        cloud = cls(**FROM[ext](filename, **kwargs))
+
+        if structures_dir is None and load_structures:
+            structures_dir = filename + ".structures"
+        if structures_dir is not None and os.path.isdir(structures_dir):
+            structures, requests = cache.load_structures(cloud.xyz, structures_dir)
+            for key, val in structures.items():
+                cloud.structures[key] = val
+                cloud.structures.set_requests(key, requests[key])
+
+        return cloud
+
+    @classmethod
+    def from_shared(cls, handle):
+        """Construct a PyntCloud using the data placed in shared memory by PyntCloud.to_shared.
+
+        Points, xyz, mesh and VoxelGrid arrays are not copied: they are read-only
+        views of the shared memory. KDTrees are rebuilt over the shared xyz
+        the first time they are accessed.
+
+        Parameters
+        ----------
+        handle: pyntcloud.utils.shared.SharedPyntCloudHandle
+            Returned by PyntCloud.to_shared.
+
+        Returns
+        -------
+        PyntCloud: object
+        """
+        xyz, points = handle.get_points()
+        cloud = cls.__new__(cls)
+        cloud._selection = None
+        cloud._update_points(points, xyz=xyz)
+        cloud.mesh = handle.get_mesh()
+        for key, val in handle.get_structures(xyz).items():
+            cloud.structures[key] = val
+        cloud._shared = handle
+        return cloud
+
+    def to_shared(self):
+        """Copy PyntCloud data to shared memory, so multiple processes can use it without copies.
+
+        Points, mesh, VoxelGrids and KDTrees (as parameters only) are shared.
+        Other structures and custom attributes are not.
+
+        Returns
+        -------
+        handle: pyntcloud.utils.shared.SharedPyntCloudHandle
+            Picklable object to be sent to other processes and given to
+            PyntCloud.from_shared. The creator process must call handle.unlink()
+            when the shared data is no longer needed.
+
+        Notes
+        -----
+        Requires Python >= 3.8 (multiprocessing.shared_memory).
+        """
+        return SharedPyntCloudHandle(self)
 
     def to_file(self, filename, also_save=None, **kwargs):
         """Save PyntCloud data to file.
@@ -139,22 +217,37 @@ class PyntCloud(object):
             Default: None
             Names of the attributes that will be extracted from the PyntCloud
             to be saved in addition to points. Usually also_save=["mesh"]
+            If "structures" is included, KDTrees and VoxelGrids are saved in a
+            cache directory, keyed by the content of xyz, so PyntCloud.from_file
+            can load them instead of rebuilding them, if the xyz values read
+            back from the file are the same.
 
         kwargs: only usable in some formats
+
+            structures_dir: str, optional
+                Default: "{filename}.structures"
+                Path of the structures cache directory.
         """
         convert_columns_dtype(self.points, np.float64, np.float32)
         ext = filename.split(".")[-1].upper()
         if ext not in TO:
             raise ValueError(
                 "Unsupported file format; supported formats are: {}".format(list(TO)))
+        structures_dir = kwargs.pop("structures_dir", filename + ".structures")
         kwargs["filename"] = filename
         kwargs["points"] = self.points
         if also_save is not None:
             for x in also_save:
+                if x == "structures":
+                    continue
                 kwargs[x] = getattr(self, x)
 
         TO[ext](**kwargs)
 
+        if also_save is not None and "structures" in also_save:
+            # keyed by the values the structures were built from
+            cache.save_structures(self.structures, self.xyz, structures_dir)
+
     def add_scalar_field(self, name, **kwargs):
         """Add one or multiple columns to PyntCloud.points.
 
@@ -174,6 +267,14 @@ class PyntCloud(object):
         Notes
         -----
 
+        Results are memoized by name, kwargs and the content of the inputs
+        (columns, structures, neighbors) each scalar field reads. Requesting
+        again a scalar field whose columns are still present returns them
+        without recomputing. Columns modified by hand are not detected.
+
+        If sf_cache is a scalar_fields.ScalarFieldCache, results are also
+        stored on disk and reused across processes.
+
         Available scalar fields are:
 
         **REQUIRE EIGENVALUES**
@@ -244,10 +345,35 @@ class PyntCloud(object):
             voxel_z
 
             euclidean_clusters
+                connectivity: int, optional
+                    Default: 26
+                    Neighbor voxels share a face (6), a face or an edge (18),
+                    or a face, an edge or a corner (26).
 
 
         **ONLY REQUIRE XYZ**
 
+            convex_hull
+                incremental: bool, optional
+                    Default: False
+                    If True, new points can be added to the hull. See
+                    add_points.
+                qhull_options: str, optional
+                    Default: None
+                    Additional options to pass to Qhull.
+
+            delanuay3D
+                furthest_site: bool, optional
+                    Default: False
+                    Whether to compute a furthest-site Delaunay triangulation.
+                incremental: bool, optional
+                    Default: False
+                    If True, new points can be added to the triangulation.
+                    See add_points.
+                qhull_options: str, optional
+                    Default: None
+                    Additional options to pass to Qhull.
+
             plane_fit
                 max_dist: float, optional
                     Default: 1e-4
@@ -285,9 +411,32 @@ class PyntCloud(object):
         if name in ALL_SF:
             scalar_field = ALL_SF[name](pyntcloud=self, **kwargs)
             scalar_field.extract_info()
-            scalar_field.compute()
+            key = scalar_field.memo_key(name, kwargs)
+
+            if key is not None and key in self._sf_memo:
+                sf_added = self._sf_memo[key]
+                if set(sf_added).issubset(self.points.columns):
+                    return sf_added[0] if len(sf_added) == 1 else list(sf_added)
+
+            cached = None
+            if key is not None and self.sf_cache is not None:
+                cached = self.sf_cache.get(key)
+            if cached is not None and all(len(x) == len(self.xyz) for x in cached.values()):
+                scalar_field.to_be_added = cached
+            else:
+                scalar_field.compute()
+                if key is not None and self.sf_cache is not None:
+                    self.sf_cache.put(key, scalar_field.to_be_added)
             scalar_fields_added = scalar_field.get_and_set()
 
+            # values of the overwritten columns are no longer valid for other keys
+            sf_added = list(scalar_field.to_be_added)
+            for other in list(self._sf_memo):
+                if set(self._sf_memo[other]).intersection(sf_added):
+                    del self._sf_memo[other]
+            if key is not None:
+                self._sf_memo[key] = sf_added
+
         else:
             raise ValueError("Unsupported scalar field. Check docstring")
 
@@ -339,23 +488,99 @@ class PyntCloud(object):
                     Default: True
                     If True, the bounding box of the point cloud will be adjusted
                     in order to have all the dimensions of equal length.
+                sparse: bool, optional
+                    Default: False
+                    If True, only occupied voxels are stored. Use it for fine
+                    resolutions over large extents.
 
             octree
-                TODO
+                max_level: int, optional
+                    Default: 2
+                    Number of times the bounding box is subdivided. At most 21.
+
+            voxelpyramid
+                max_level: int, optional
+                    Default: 6
+                    The finest grid has 2 ** max_level voxels per axis.
+                    Every coarser level is derived from it. At most 21.
+
+            occupancy_grid
+                voxel_size: float
+                    Side of the voxels.
+                origin: (3,) array-like, optional
+                    Default: None
+                    Sensor position. If origin or pose is given, the points
+                    are integrated as the first scan.
+                pose: (4, 4) array-like, optional
+                    Default: None
+                    Sensor to cloud transformation.
+                p_hit, p_miss: float, optional
+                    Default: 0.7, 0.4
+                    Probability of occupancy of the voxel of a point and of
+                    the voxels crossed by its ray.
+                p_min, p_max: float, optional
+                    Default: 0.12, 0.97
+                    Clamping of the probabilities.
+                max_range: float, optional
+                    Default: None
+                    Rays are cut at max_range from the sensor.
+                block_size: int, optional
+                    Default: 8
+                    Voxels are allocated in blocks of block_size ** 3.
+
+            tsdf
+                voxel_size: float
+                    Side of the voxels.
+                truncation: float, optional
+                    Default: None
+                    Truncation distance of the signed distance. If None,
+                    3 * voxel_size.
+                block_size: int, optional
+                    Default: 8
+                    Voxels are allocated in blocks of block_size ** 3.
+                origin: (3,) array-like, optional
+                    Default: None
+                    Sensor position. If origin or pose is given, the points
+                    are integrated as the first scan.
+                pose: (4, 4) array-like, optional
+                    Default: None
+                    Sensor to cloud transformation.
+
+        **REQUIRE MESH**
+
+            bvh
+                leaf_size: int, optional
+                    Default: 4
+                    Maximum number of triangles in each leaf.
 
+        If a structure with the same name and kwargs is already in
+        self.structures, it is reused instead of being built again, except
+        for tsdf and occupancy_grid, which are changed by integrating scans.
+
+        self.structures.max_bytes can be set to limit the memory used by
+        all the structures; least recently used ones are removed when it is
+        exceeded. See structures.base.StructuresDict.
         """
         if name in ALL_STRUCTURES:
+            cacheable = ALL_STRUCTURES[name].cacheable
+            if cacheable:
+                structure_added = self.structures.find(name, kwargs)
+                if structure_added is not None:
+                    return structure_added
+
             info = ALL_STRUCTURES[name].extract_info(pyntcloud=self)
             structure = ALL_STRUCTURES[name](**info, **kwargs)
             structure.compute()
             structure_added = structure.get_and_set(self)
+            if cacheable:
+                self.structures.remember(name, kwargs, structure_added)
 
         else:
             raise ValueError("Unsupported structure. Check docstring")
 
         return structure_added
 
-    def get_filter(self, name, and_apply=False, **kwargs):
+    def get_filter(self, name, and_apply=False, lazy=False, **kwargs):
         """Compute filter over PyntCloud's points and return it.
 
         Parameters
@@ -367,6 +592,10 @@ class PyntCloud(object):
             Default: False
             If True, filter will be applied to self.points
 
+        lazy: boolean, optional
+            Default: False
+            Only used if and_apply is True. See PyntCloud.apply_filter.
+
         kwargs
             Vary for each name. See below.
 
@@ -385,8 +614,8 @@ class PyntCloud(object):
         **REQUIRE KDTREE**
 
             ARGS
-                kdtree : KDTree.id
-                    kdtree = self.add_structure("kdtree", ...)
+                kdtree_id : KDTree.id or Octree.id
+                    kdtree_id = self.add_structure("kdtree", ...)
 
             ROR    (Radius Outlier Removal)
                 k: int
@@ -407,6 +636,8 @@ class PyntCloud(object):
                 min_i, max_i: float
                     The bounding box limits for each coordinate. If some limits are missing,
                     the default values are -infinite for the min_i and infinite for the max_i.
+                octree_id: Octree.id, optional
+                    If given, the Octree is used to find the points inside.
 
         """
         if name in ALL_FILTERS:
@@ -415,7 +646,7 @@ class PyntCloud(object):
             boolean_array = pointcloud_filter.compute()
 
             if and_apply:
-                self.apply_filter(boolean_array)
+                self.apply_filter(boolean_array, lazy=lazy)
 
             return boolean_array
 
@@ -514,7 +745,7 @@ class PyntCloud(object):
 
         kdtree: str, optional
             Default: None
-            KDTree.id in self.structures.
+            KDTree.id in self.structures. An Octree.id can be used instead.
 
             - If **kdtree** is None:
 
@@ -548,6 +779,19 @@ class PyntCloud(object):
         else:
             raise ValueError("You must supply 'k' or 'r' values.")
 
+    def pipeline(self):
+        """Return a Pipeline to record operations over this PyntCloud.
+
+        The recorded operations are only computed when Pipeline.execute is
+        called, dropping unused intermediates and sharing neighbor queries.
+        See pyntcloud.pipeline.Pipeline.
+
+        Returns
+        -------
+        pipeline: pyntcloud.pipeline.Pipeline
+        """
+        return Pipeline(self)
+
     def get_mesh_vertices(self, rgb=False, normals=False):
         """Decompose triangles of self.mesh from vertices in self.points.
 
@@ -564,21 +808,87 @@ class PyntCloud(object):
 
         points = self.points[use_columns].values
 
-        v1 = points[[self.mesh["v1"]]]
-        v2 = points[[self.mesh["v2"]]]
-        v3 = points[[self.mesh["v3"]]]
+        v1 = points[self.mesh["v1"].values]
+        v2 = points[self.mesh["v2"].values]
+        v3 = points[self.mesh["v3"].values]
 
         return v1, v2, v3
 
-    def apply_filter(self, boolean_array):
+    def apply_filter(self, boolean_array, lazy=False):
         """Update self.points removing points where filter is False.
 
         Parameters
         ----------
         boolean_array: ndarray, dtype bool
             len(boolean array) must be equal to len(self.points)
+
+        lazy: boolean, optional
+            Default: False
+            If True, self.points will not be copied. Only the indices of the
+            kept points are stored (composed with any previous lazy filter)
+            and self.xyz and self.centroid are updated, so that chained filters
+            don't need to touch the other columns.
+            The selection is compacted once, the next time self.points is read.
+
+        Notes
+        -----
+        Instead of being removed, structures are derived for the kept points
+        where that is cheap (see structures.base.Structure.subset):
+        VoxelGrids keep their geometry and KDTrees are rebuilt the next time
+        they are accessed. Other structures are removed.
+        As the geometry of the kept VoxelGrids is the one of the original
+        points, add_structure builds new ones instead of reusing them.
         """
-        self.points = self.points.loc[boolean_array].reset_index(drop=True)
+        boolean_array = np.asarray(boolean_array, dtype=bool)
+        if len(boolean_array) != len(self.xyz):
+            raise ValueError("len(boolean_array) must be equal to the number of points")
+
+        structures = self.structures
+
+        if not lazy:
+            self.points = self.points.loc[boolean_array].reset_index(drop=True)
+        else:
+            if self._selection is None:
+                self._selection = np.flatnonzero(boolean_array)
+            else:
+                self._selection = self._selection[boolean_array]
+
+            self.mesh = None
+            self.xyz = self.xyz[boolean_array]
+            self.centroid = self.xyz.mean(0)
+
+        self.structures = structures.subset(self.xyz, boolean_array)
+
+    def add_points(self, points):
+        """Append new points to self.points.
+
+        Parameters
+        ----------
+        points: pd.DataFrame
+            Must have the same columns as self.points.
+
+        Notes
+        -----
+        Structures are extended where that is cheap (see
+        structures.base.Structure.extend): ConvexHulls and Delaunay3Ds built
+        with incremental=True add the new points to the existing hull or
+        triangulation and KDTrees are rebuilt the next time they are
+        accessed. Other structures are removed.
+
+        The mesh is kept, as the indices of the existing points don't change.
+        """
+        if not isinstance(points, pd.DataFrame):
+            raise TypeError("Points argument must be a DataFrame")
+        if set(points.columns) != set(self.points.columns):
+            raise ValueError("Points must have the same columns as self.points")
+
+        structures = self.structures
+        mesh = self.mesh
+        new_xyz = points[["x", "y", "z"]].values
+
+        self.points = pd.concat([self.points, points[self.points.columns]], ignore_index=True)
+        self.mesh = mesh
+        self.structures = structures.extend(self.xyz, new_xyz)
 
     def split_on(self, scalar_field, and_return=False, save_format="ply", save_path=os.getcwd()):
         """Divide the PyntCloud using unique values in given sf.
@@ -617,12 +927,22 @@ class PyntCloud(object):
         if and_return:
             return splits
 
-    def _update_points(self, df):
+    def _compact_points(self):
+        """Utility function. Apply the pending lazy selection to self.points."""
+        self.__points = self.__points.take(self._selection).reset_index(drop=True)
+        self._selection = None
+
+    def _update_points(self, df, xyz=None):
         """Utility function. Implicitly called when self.points is assigned."""
         self.mesh = None
-        self.structures = StructuresDict()
+        structures = getattr(self, "structures", None)
+        self.structures = StructuresDict() if structures is None else structures.empty_like()
+        self._selection = None
+        self._sf_memo = {}
         self.__points = df
-        self.xyz = self.__points[["x", "y", "z"]].values
+        if xyz is None:
+            xyz = self.__points[["x", "y", "z"]].values
+        self.xyz = xyz
         self.centroid = self.xyz.mean(0)
 
     def plot(
@@ -15,6 +15,7 @@ class KDTreeFilter(Filter):
         kdtree_id: pyntcloud.structures.KDTree.id
             Usually returned from PyntCloud.add_structure("kdtree"):
             kdtree_id = my_cloud.add_structure("kdtree")
+            An Octree.id can be used instead.
         """
         super().__init__(pyntcloud=pyntcloud)
         self.kdtree_id = kdtree_id
@@ -58,7 +59,7 @@ class RadiusOutlierRemovalFilter(KDTreeFilter):
         self.r = r
 
     def compute(self):
-        distances = self.kdtree.query(self.points, k=self.k, n_jobs=-1)[0]
+        distances = self.kdtree.query(self.points, k=self.k, workers=-1)[0]
         print(distances)
         ror_filter = np.all(distances < self.r, axis=1)
 
@@ -98,7 +99,7 @@ class StatisticalOutlierRemovalFilter(KDTreeFilter):
         self.z_max = z_max
 
     def compute(self):
-        distances = self.kdtree.query(self.points, k=self.k, n_jobs=-1)[0]
+        distances = self.kdtree.query(self.points, k=self.k, workers=-1)[0]
         z_distances = zscore(np.mean(distances, axis=1), ddof=1)
         print(z_distances)
         sor_filter = abs(z_distances) < self.z_max
@@ -19,16 +19,33 @@ class BoundingBoxFilter(XYZFilter):
         If some limits are missing, the default values are -infinite
         for the min_i and infinite for the max_i.
 
+    octree_id: pyntcloud.structures.Octree.id, optional
+        Default: None
+        If given, the Octree is used to only check the points near
+        the faces of the box.
+
     """
 
     def __init__(self, *, pyntcloud, min_x=-np.inf, max_x=np.inf, min_y=-np.inf,
-                 max_y=np.inf, min_z=-np.inf, max_z=np.inf):
+                 max_y=np.inf, min_z=-np.inf, max_z=np.inf, octree_id=None):
         super().__init__(pyntcloud=pyntcloud)
         self.min_x, self.max_x = min_x, max_x
         self.min_y, self.max_y = min_y, max_y
         self.min_z, self.max_z = min_z, max_z
+        self.octree_id = octree_id
+
+    def extract_info(self):
+        super().extract_info()
+        if self.octree_id is not None:
+            self.octree = self.pyntcloud.structures[self.octree_id]
 
     def compute(self):
+        if self.octree_id is not None:
+            bb_filter = np.zeros(len(self.points), dtype=bool)
+            bb_filter[self.octree.query_box(
+                [self.min_x, self.min_y, self.min_z],
+                [self.max_x, self.max_y, self.max_z])] = True
+            return bb_filter
 
         bound_x = np.logical_and(self.points[:, 0] > self.min_x,
                                  self.points[:, 0] < self.max_x)
@@ -0,0 +1,410 @@
+from collections import OrderedDict
+
+import numpy as np
+
+#: number of columns added by the scalar fields that add more than one
+SF_N_COLUMNS = {
+    "eigen_decomposition": 12,
+    "eigen_values": 3,
+    "normals": 3,
+    "hsv": 3,
+    "rgb_intensity": 3,
+    "spherical_coords": 3,
+    "cylindrical_coords": 2
+}
+
+#: steps that can be merged with an identical previous step
+PURE_METHODS = ("add_structure", "add_scalar_field", "get_neighbors")
+
+
+class PipelineNode(object):
+    """Placeholder for the result of a step recorded in a Pipeline.
+
+    Can be used as argument of the following steps, where it will be
+    replaced by the actual result when the Pipeline is executed.
+    """
+
+    def __init__(self, n, method, name, kwargs):
+        self.n = n
+        self.method = method
+        self.name = name
+        self.kwargs = kwargs
+        self.deps = sorted(set(x.n for x in _iter_nodes(kwargs.values())))
+        self.result = None
+
+    @property
+    def is_applied_filter(self):
+        return self.method == "get_filter" and self.kwargs.get("and_apply", False)
+
+    def __repr__(self):
+        return "<PipelineNode {}: {}({})>".format(self.n, self.method, self.name)
+
+
+def _iter_nodes(values):
+    for value in values:
+        if isinstance(value, PipelineNode):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            for x in _iter_nodes(value):
+                yield x
+
+
+def _resolve(value):
+    if isinstance(value, PipelineNode):
+        return value.result
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_resolve(x) for x in value)
+    return value
+
+
+def _freeze(value, alias):
+    if isinstance(value, PipelineNode):
+        return ("node", alias.get(value.n, value.n))
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze(x, alias) for x in value)
+    elif isinstance(value, np.ndarray):
+        return ("array", id(value))
+    try:
+        hash(value)
+    except TypeError:
+        return ("object", id(value))
+    return value
+
+
+def _format_bytes(n_bytes):
+    if n_bytes is None:
+        return "?"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n_bytes < 1024:
+            return "{:.1f} {}".format(n_bytes, unit)
+        n_bytes /= 1024
+    return "{:.1f} TB".format(n_bytes)
+
+
+class Pipeline(object):
+    """Record PyntCloud operations and execute them with minimal materialization.
+
+    Usually created with PyntCloud.pipeline().
+
+    Each recorded step returns a PipelineNode that can be passed as argument
+    to the following steps. Nothing is computed until execute is called:
+
+        pipeline = cloud.pipeline()
+        kdtree = pipeline.add_structure("kdtree")
+        k_neighbors = pipeline.get_neighbors(k=10, kdtree=kdtree)
+        ev = pipeline.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+        planarity = pipeline.add_scalar_field("planarity", ev=ev)
+        print(pipeline.explain(planarity))
+        pipeline.execute(planarity)
+
+    When executed:
+
+    - Steps that are not needed by the outputs are not computed.
+      Filters with and_apply=True are always computed.
+
+    - Identical add_structure, add_scalar_field and get_neighbors steps are
+      computed once.
+
+    - All the k-neighbors queries over the same KDTree (and the same points)
+      are answered with a single query using the maximum k.
+
+    - Filters are applied lazily (see PyntCloud.apply_filter).
+
+    - Intermediate structures, scalar fields and arrays that are not outputs
+      are removed right after their last use.
+    """
+
+    def __init__(self, pyntcloud):
+        self.pyntcloud = pyntcloud
+        self.steps = []
+
+    def _record(self, method, name, kwargs):
+        node = PipelineNode(len(self.steps), method, name, kwargs)
+        self.steps.append(node)
+        return node
+
+    def add_structure(self, name, **kwargs):
+        """Record PyntCloud.add_structure. Result is the structure id."""
+        return self._record("add_structure", name, kwargs)
+
+    def add_scalar_field(self, name, **kwargs):
+        """Record PyntCloud.add_scalar_field. Result is the name(s) of the scalar field(s)."""
+        return self._record("add_scalar_field", name, kwargs)
+
+    def get_filter(self, name, and_apply=False, **kwargs):
+        """Record PyntCloud.get_filter. Result is the boolean array."""
+        kwargs["and_apply"] = and_apply
+        return self._record("get_filter", name, kwargs)
+
+    def get_sample(self, name, **kwargs):
+        """Record PyntCloud.get_sample. Result is the sample."""
+        return self._record("get_sample", name, kwargs)
+
+    def get_neighbors(self, k=None, r=None, kdtree=None):
+        """Record PyntCloud.get_neighbors. Result is the neighbors array."""
+        if k is None and r is None:
+            raise ValueError("You must supply 'k' or 'r' values.")
+        return self._record("get_neighbors", "k" if k is not None else "r", {"k": k, "r": r, "kdtree": kdtree})
+
+    def _default_outputs(self):
+        consumed = set()
+        for node in self.steps:
+            consumed.update(node.deps)
+        return [x for x in self.steps if x.n not in consumed and not x.is_applied_filter]
+
+    def _plan(self, outputs):
+        """Build the execution plan.
+
+        Returns
+        -------
+        plan: dict
+            "order": list of int, steps to be computed, in execution order.
+            "alias": dict, maps merged steps to the step that computes them.
+            "shared_k": dict, maps k-neighbors steps to (step doing the query, maximum k).
+            "release": dict, maps steps to the list of steps released after it.
+            "outputs": list of int.
+        """
+        # epoch: number of filters applied before each step
+        epoch = []
+        n_applied = 0
+        for node in self.steps:
+            epoch.append(n_applied)
+            if node.is_applied_filter:
+                n_applied += 1
+
+        # merge identical steps
+        alias = {}
+        seen = {}
+        for node in self.steps:
+            if node.method not in PURE_METHODS:
+                continue
+            key = (
+                node.method,
+                node.name,
+                epoch[node.n],
+                tuple(sorted((k, _freeze(v, alias)) for k, v in node.kwargs.items())))
+            if key in seen:
+                alias[node.n] = seen[key]
+            else:
+                seen[key] = node.n
+
+        def canonical(n):
+            return alias.get(n, n)
+
+        outputs = [canonical(x.n) for x in outputs]
+
+        # keep only the steps needed by outputs and applied filters
+        live = set()
+        to_visit = list(outputs) + [x.n for x in self.steps if x.is_applied_filter]
+        while to_visit:
+            n = canonical(to_visit.pop())
+            if n in live:
+                continue
+            live.add(n)
+            to_visit.extend(self.steps[n].deps)
+        order = sorted(live)
+
+        # share k-neighbors queries
+        shared_k = {}
+        groups = OrderedDict()
+        for n in order:
+            node = self.steps[n]
+            if node.method == "get_neighbors" and node.kwargs["k"] is not None:
+                key = (epoch[n], _freeze(node.kwargs["kdtree"], alias))
+                groups.setdefault(key, []).append(n)
+        for group in groups.values():
+            k_max = max(self.steps[n].kwargs["k"] for n in group)
+            for n in group:
+                shared_k[n] = (group[0], k_max)
+
+        # release each step after its last use
+        last_use = {n: n for n in order}
+        for n in order:
+            for dep in self.steps[n].deps:
+                dep = canonical(dep)
+                last_use[dep] = max(last_use[dep], n)
+        for n, (leader, k_max) in shared_k.items():
+            last_use[leader] = max(last_use[leader], last_use[n])
+        release = {}
+        for n, last in last_use.items():
+            if n not in outputs:
+                release.setdefault(last, []).append(n)
+
+        return {
+            "order": order,
+            "alias": alias,
+            "shared_k": shared_k,
+            "release": release,
+            "outputs": outputs
+        }
+
+    def _estimate(self, node, k=None):
+        """Rough estimation of the bytes needed to store the result of node.
+
+        Uses the current number of points, so it is an upper bound if some
+        filter is applied before node.
+        """
+        N = len(self.pyntcloud.xyz)
+        if node.method == "add_structure":
+            if node.name == "kdtree":
+                # float64 copy of the points + indices
+                return N * 8 * 4
+            elif node.name == "voxelgrid":
+                x_y_z = [node.kwargs.get(x, 1) for x in ["n_x", "n_y", "n_z"]]
+                ptp = np.ptp(self.pyntcloud.xyz, 0)
+                for i, size in enumerate(node.kwargs.get(x) for x in ["size_x", "size_y", "size_z"]):
+                    if size is not None:
+                        x_y_z[i] = int(ptp[i] // size) + 1
+                if node.kwargs.get("sparse", False):
+                    # voxel_x, voxel_y, voxel_z, voxel_n, voxel_inverse + voxel_occupied
+                    return N * 8 * 6
+                # voxel_x, voxel_y, voxel_z, voxel_n + float32 voxel_centers
+                return N * 8 * 4 + int(np.prod(x_y_z)) * 3 * 4
+            return None
+        elif node.method == "add_scalar_field":
+            return N * 8 * SF_N_COLUMNS.get(node.name, 1)
+        elif node.method == "get_filter":
+            return N
+        elif node.method == "get_neighbors":
+            if k is None:
+                return None
+            return N * 8 * k
+        elif node.method == "get_sample":
+            if "n" in node.kwargs and node.name in ["points_random", "mesh_random"]:
+                return node.kwargs["n"] * 8 * len(self.pyntcloud.points.columns)
+            return None
+
+    def explain(self, *outputs):
+        """Describe the execution plan and its estimated memory usage.
+
+        Parameters
+        ----------
+        outputs: PipelineNode, optional
+            Steps whose results are wanted.
+            By default, the steps that are not used by any other step.
+
+        Returns
+        -------
+        explanation: str
+        """
+        outputs = list(outputs) or self._default_outputs()
+        plan = self._plan(outputs)
+
+        estimates = {}
+        for n in plan["order"]:
+            k = self.steps[n].kwargs.get("k")
+            if n in plan["shared_k"]:
+                leader, k_max = plan["shared_k"][n]
+                # followers are views of the leader's query
+                k = k_max if leader == n else 0
+            estimates[n] = self._estimate(self.steps[n], k=k)
+
+        lines = ["Pipeline: {} steps, {} computed".format(len(self.steps), len(plan["order"]))]
+        current = 0
+        peak = 0
+        for node in self.steps:
+            n = node.n
+            description = "{:>3} {}({})".format(n, node.method, node.name)
+            if n in plan["alias"]:
+                lines.append("{} -> same as step {}".format(description, plan["alias"][n]))
+                continue
+            if n not in plan["order"]:
+                lines.append("{} -> skipped, not needed".format(description))
+                continue
+
+            note = ""
+            if n in plan["shared_k"]:
+                leader, k_max = plan["shared_k"][n]
+                if leader == n:
+                    if any(l == n and m != n for m, (l, _) in plan["shared_k"].items()):
+                        note = " (shared query with k={})".format(k_max)
+                else:
+                    note = " (view of step {})".format(leader)
+            if n in plan["outputs"]:
+                note += " [output]"
+            released = plan["release"].get(n, [])
+            if released:
+                note += "; release {}".format(", ".join(str(x) for x in sorted(released)))
+
+            current += estimates[n] or 0
+            peak = max(peak, current)
+            current -= sum(estimates[x] or 0 for x in released)
+
+            lines.append("{} -> +{}{}".format(description, _format_bytes(estimates[n]), note))
+
+        unknown = any(x is None for x in estimates.values())
+        lines.append("Estimated peak memory: {}{}".format(
+            _format_bytes(peak), " + unknown" if unknown else ""))
+        return "\n".join(lines)
+
+    def execute(self, *outputs):
+        """Run the recorded steps over the PyntCloud.
+
+        Parameters
+        ----------
+        outputs: PipelineNode, optional
+            Steps whose results are wanted.
+            By default, the steps that are not used by any other step.
+
+        Returns
+        -------
+        results: list or object
+            The result of each output. If there is only one, it is returned alone.
+        """
+        outputs = list(outputs) or self._default_outputs()
+        plan = self._plan(outputs)
+        cloud = self.pyntcloud
+
+        existing_structures = set(cloud.structures.keys())
+        existing_columns = set(cloud.points.columns)
+        shared = {}
+
+        for n in plan["order"]:
+            node = self.steps[n]
+            kwargs = {k: _resolve(v) for k, v in node.kwargs.items()}
+
+            if node.method == "add_structure":
+                node.result = cloud.add_structure(node.name, **kwargs)
+
+            elif node.method == "add_scalar_field":
+                node.result = cloud.add_scalar_field(node.name, **kwargs)
+
+            elif node.method == "get_filter":
+                node.result = cloud.get_filter(node.name, lazy=True, **kwargs)
+
+            elif node.method == "get_sample":
+                node.result = cloud.get_sample(node.name, **kwargs)
+
+            elif node.method == "get_neighbors":
+                if n in plan["shared_k"]:
+                    leader, k_max = plan["shared_k"][n]
+                    if leader == n:
+                        shared[n] = cloud.get_neighbors(k=k_max, kdtree=kwargs["kdtree"])
+                    node.result = shared[leader][:, :kwargs["k"]]
+                else:
+                    node.result = cloud.get_neighbors(**kwargs)
+
+            for x in plan["release"].get(n, []):
+                self._release(self.steps[x], existing_structures, existing_columns)
+                shared.pop(x, None)
+
+        for node in self.steps:
+            if node.n in plan["alias"]:
+                node.result = self.steps[plan["alias"][node.n]].result
+
+        results = [x.result for x in outputs]
+        if len(results) == 1:
+            return results[0]
+        return results
+
+    def _release(self, node, existing_structures, existing_columns):
+        cloud = self.pyntcloud
+        if node.method == "add_structure":
+            if node.result not in existing_structures and node.result in cloud.structures:
+                del cloud.structures[node.result]
+        elif node.method == "add_scalar_field":
+            names = node.result if isinstance(node.result, list) else [node.result]
+            names = [x for x in names if x not in existing_columns]
+            cloud.points.drop(columns=names, inplace=True)
+        else:
+            node.result = None
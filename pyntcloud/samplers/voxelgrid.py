@@ -19,7 +19,7 @@ class VoxelgridCentersSampler(VoxelgridSampler):
     """Returns the points that represent each occupied voxel's center."""
     def compute(self):
         return pd.DataFrame(
-            self.voxelgrid.voxel_centers[np.unique(self.voxelgrid.voxel_n)],
+            self.voxelgrid.get_voxel_centers(),
             columns=["x", "y", "z"])
 
 
@@ -44,7 +44,7 @@ class VoxelgridNearestSampler(VoxelgridSampler):
         nearests = []
         for voxel_n, x in self.pyntcloud.points.groupby(voxel_n_id, sort=False):
             xyz = x.loc[:, ["x", "y", "z"]].values
-            center = self.voxelgrid.voxel_centers[voxel_n]
+            center = self.voxelgrid.get_voxel_centers([voxel_n])[0]
             voxel_nearest = cdist([center], xyz)[0].argsort()[:self.n]
             nearests.extend(x.index.values[voxel_nearest])
         return self.pyntcloud.points.iloc[nearests].reset_index(drop=True)
@@ -1,3 +1,4 @@
+from .cache import ScalarFieldCache
 from .eigenvalues import (
     Anisotropy,
     Curvature,
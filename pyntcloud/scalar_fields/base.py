@@ -1,14 +1,59 @@
+import hashlib
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 
+import numpy as np
+
+from ..structures.base import Structure
+
+
+def _update_digest(digest, val):
+    if isinstance(val, np.ndarray):
+        val = np.ascontiguousarray(val)
+        digest.update("{}{}".format(val.dtype.str, val.shape).encode())
+        digest.update(val.data)
+    elif isinstance(val, Structure):
+        digest.update(repr(getattr(val, "id", None)).encode())
+        for key in sorted(val.__dict__):
+            if key != "_points" and isinstance(val.__dict__[key], np.ndarray):
+                _update_digest(digest, val.__dict__[key])
+    else:
+        digest.update(repr(val).encode())
+
 
 class ScalarField(ABC):
     """Base class for scalar fields."""
 
+    #: set to False if the values don't only depend on the inputs (e.g. random fits)
+    memoize = True
+
     def __init__(self, *, pyntcloud):
         self.pyntcloud = pyntcloud
         self.to_be_added = OrderedDict()
 
+    def memo_key(self, name, kwargs):
+        """Return a hex digest identifying the values this scalar field would add.
+
+        Must be called after extract_info. The digest covers the name, the
+        kwargs and the content of the inputs read by extract_info.
+
+        Returns
+        -------
+        key: str or None
+            None if the scalar field can't be memoized.
+        """
+        if not self.memoize:
+            return None
+        digest = hashlib.sha1(name.encode())
+        for key in sorted(kwargs):
+            digest.update(key.encode())
+            _update_digest(digest, kwargs[key])
+        for key in sorted(self.__dict__):
+            if key not in ["pyntcloud", "to_be_added"]:
+                digest.update(key.encode())
+                _update_digest(digest, self.__dict__[key])
+        return digest.hexdigest()
+
     def get_and_set(self):
         sf_added = []
         for k, v in self.to_be_added.items():
@@ -0,0 +1,85 @@
+import os
+from collections import OrderedDict
+from glob import glob
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+
+class ScalarFieldCache(object):
+    """On-disk cache of scalar field values, keyed by ScalarField.memo_key.
+
+    Each entry is stored as one .npz file inside cache_dir. When the total
+    size of the entries exceeds max_bytes, the least recently used ones
+    are deleted.
+
+    Assign an instance to PyntCloud.sf_cache to use it for every cloud, or
+    pass sf_cache=... when creating a single PyntCloud.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 ** 30):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            Path of the cache directory. Created if it doesn't exist.
+        max_bytes: int, optional
+            Default: 1 GiB
+            Maximum total size of the cached entries.
+        """
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key):
+        """Return an OrderedDict mapping column name to values, or None if key is not cached."""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                values = OrderedDict((x, f[x]) for x in f.files)
+            # mark as recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return values
+
+    def put(self, key, values):
+        """Store values (mapping column name to 1D array) under key."""
+        values = OrderedDict((k, np.asarray(v)) for k, v in values.items())
+        if any(v.dtype.hasobject for v in values.values()):
+            return
+        # write to a temporary file first so readers never see partial entries
+        with NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+            np.savez(f, **values)
+        os.replace(f.name, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the size is below max_bytes."""
+        entries = []
+        for path in glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(x[1] for x in entries)
+        # the most recent entry is always kept
+        for mtime, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path in glob(os.path.join(self.cache_dir, "*.npz")):
+            os.remove(path)
@@ -1,4 +1,8 @@
 import numpy as np
+
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
 from .base import ScalarField
 
 
@@ -44,28 +48,35 @@ class VoxelN(VoxelgridScalarField):
 
 
 class EuclideanClusters(VoxelgridScalarField):
-    """Assing corresponding cluster to each point inside each voxel."""
+    """Assing corresponding cluster to each point inside each voxel.
+
+    Clusters are the connected components of the graph of occupied voxels,
+    where neighbor voxels are connected. They are labeled 0, 1, ... in
+    ascending order of their lowest voxel index, so labels are deterministic.
+
+    Parameters
+    ----------
+    connectivity: int in [6, 18, 26], optional
+        Default: 26
+        See VoxelGrid.get_voxel_neighbors_batch.
+    """
+
+    def __init__(self, *, pyntcloud, voxelgrid_id, connectivity=26):
+        super().__init__(pyntcloud=pyntcloud, voxelgrid_id=voxelgrid_id)
+        self.connectivity = connectivity
+
     def compute(self):
         name = "{}({})".format("clusters", self.voxelgrid_id)
 
-        to_be_processed = np.zeros(self.voxelgrid.n_voxels, dtype=bool)
-        to_be_processed[np.unique(self.voxelgrid.voxel_n)] = True
-
-        clusters = np.zeros(self.voxelgrid.voxel_n.shape[0])
+        voxels, inverse = np.unique(self.voxelgrid.voxel_n, return_inverse=True)
+        neighbors = self.voxelgrid.get_voxel_neighbors_batch(voxels, connectivity=self.connectivity)
 
-        C = 0
-        while np.any(to_be_processed):
-            Q = []
-            Q.append(np.random.choice(np.where(to_be_processed)[0]))
+        rows, cols = np.nonzero(neighbors >= 0)
+        # neighbors are occupied voxels, so they are found in voxels
+        cols = np.searchsorted(voxels, neighbors[rows, cols])
+        graph = coo_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(len(voxels), len(voxels)))
 
-            for voxel in Q:
-                clusters[np.where(self.voxelgrid.voxel_n == voxel)[0]] = C
-                to_be_processed[voxel] = False
-                neighbors = self.voxelgrid.get_voxel_neighbors(voxel)
-                for neighbor in neighbors:
-                    if to_be_processed[neighbor]:
-                        Q.append(neighbor)
-                        to_be_processed[neighbor] = False
-            C += 1
+        # labels are assigned in order of the first node found of each component
+        n_clusters, labels = connected_components(graph, directed=False)
 
-        self.to_be_added[name] = clusters
+        self.to_be_added[name] = labels[inverse]
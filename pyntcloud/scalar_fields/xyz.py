@@ -19,6 +19,7 @@ class PlaneFit(XYZScalarField):
     """
     Get inliers of the best RansacPlane found.
     """
+    memoize = False
 
     def __init__(self, *, pyntcloud, max_dist=1e-4, max_iterations=100, n_inliers_to_stop=None):
         self.model = RANSAC_MODELS["plane"]
@@ -42,6 +43,7 @@ class SphereFit(XYZScalarField):
     """
     Get inliers of the best RansacSphere found.
     """
+    memoize = False
 
     def __init__(self, *, pyntcloud, max_dist=1e-4, max_iterations=100, n_inliers_to_stop=None):
         super().__init__(pyntcloud=pyntcloud)
@@ -64,6 +66,7 @@ class CustomFit(XYZScalarField):
     """
     Get inliers of the best custom model found.
     """
+    memoize = False
 
     def __init__(self, pyntcloud, model, sampler, name, model_kwargs={},
                  sampler_kwargs={}, max_iterations=100, n_inliers_to_stop=None):
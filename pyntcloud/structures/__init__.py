@@ -2,14 +2,24 @@
 """
 HAKUNA MATATA
 """
+from .bvh import BVH
 from .convex_hull import ConvexHull
 from .delanuay import Delaunay3D
 from .kdtree import KDTree
-from .voxelgrid import VoxelGrid
+from .occupancy_grid import OccupancyGrid
+from .octree import Octree
+from .tsdf import TSDFVolume
+from .voxelgrid import VoxelGrid, VoxelGridSpec, query_voxelgrid
+from .voxelpyramid import VoxelPyramid
 
 ALL_STRUCTURES = {
+    'bvh': BVH,
     'convex_hull': ConvexHull,
     'delanuay3D': Delaunay3D,
     'kdtree': KDTree,
-    'voxelgrid': VoxelGrid
+    'occupancy_grid': OccupancyGrid,
+    'octree': Octree,
+    'tsdf': TSDFVolume,
+    'voxelgrid': VoxelGrid,
+    'voxelpyramid': VoxelPyramid
 }
@@ -1,16 +1,77 @@
+import hashlib
 from abc import ABC, abstractmethod, abstractclassmethod
+from collections import OrderedDict
+
+import numpy as np
 
 
 class Structure(ABC):
     """Base class for structures."""
 
+    #: if False, the structure is changed after compute (e.g. by integrating
+    #: new scans), so add_structure always builds a new one instead of
+    #: reusing it. See PyntCloud.add_structure.
+    cacheable = True
+
+    #: if False, the structures derived by subset and extend differ from the
+    #: ones built from scratch for the new points (e.g. they keep the old
+    #: bounding box), so add_structure builds a new one instead of reusing them.
+    derives_exactly = True
+
     def __init__(self, *, points):
         self._points = points
+        #: if True, compute will be called the next time the structure is
+        #: accessed through StructuresDict
+        self._deferred = False
 
     def get_and_set(self, pyntcloud):
         pyntcloud.structures[self.id] = self
         return self.id
 
+    def subset(self, points, boolean_array):
+        """Derive the structure corresponding to a subset of the points.
+
+        Parameters
+        ----------
+        points: (M, 3) ndarray
+            The points kept, i.e. original_points[boolean_array].
+        boolean_array: (N,) ndarray, dtype bool
+            Mask used to select the kept points.
+
+        Returns
+        -------
+        structure: Structure or None
+            None if the structure can't be cheaply derived from self.
+        """
+        return None
+
+    def extend(self, points, new_points):
+        """Derive the structure corresponding to the points with new points appended.
+
+        Parameters
+        ----------
+        points: (N + M, 3) ndarray
+            All the points, i.e. the original points followed by new_points.
+        new_points: (M, 3) ndarray
+
+        Returns
+        -------
+        structure: Structure or None
+            None if the structure can't be cheaply derived from self.
+        """
+        return None
+
+    @property
+    def nbytes(self):
+        """Approximate memory footprint, in bytes.
+
+        The points the structure is built on are shared with PyntCloud.xyz,
+        so they are not counted.
+        """
+        return sum(
+            val.nbytes for key, val in self.__dict__.items()
+            if key != "_points" and isinstance(val, np.ndarray))
+
     @classmethod
     def extract_info(cls, pyntcloud):
         """ABC API"""
@@ -25,28 +86,227 @@ class Structure(ABC):
 
 
 class StructuresDict(dict):
-    """Custom class to restrict PyntCloud.structures assigment."""
+    """Custom class to restrict PyntCloud.structures assigment.
+
+    Also works as a cache of structures:
 
-    def __init__(self, *args):
+    - PyntCloud.add_structure reuses a structure already built with the same
+      arguments instead of rebuilding it. See find and remember.
+
+    - If max_bytes is not None, the least recently used structures are
+      removed when the memory footprint of all the structures exceeds it.
+
+    Every method adding or removing structures goes through __setitem__ and
+    __delitem__, which keep the counters, the LRU order and nbytes updated.
+
+    Parameters
+    ----------
+    max_bytes: int, optional
+        Default: None
+        Memory budget for all the structures. None for no limit.
+    """
+
+    def __init__(self, *args, max_bytes=None):
         self.n_voxelgrids = 0
         self.n_kdtrees = 0
         self.n_delanuays = 0
         self.n_convex_hulls = 0
-        super().__init__(*args)
+        self.n_octrees = 0
+        self.n_bvhs = 0
+        self.n_voxelpyramids = 0
+        self.n_tsdfs = 0
+        self.n_occupancy_grids = 0
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._nbytes = {}
+        self._requests = {}
+        self._lru = OrderedDict()
+        super().__init__()
+        for key, val in dict(*args).items():
+            self[key] = val
 
     def __setitem__(self, key, val):
         if not issubclass(val.__class__, Structure):
             raise TypeError("{} must be base.Structure subclass".format(key))
 
+        if key in self:
+            del self[key]
+        self._count(key, 1)
+        super().__setitem__(key, val)
+        self._lru[key] = None
+        self._update_nbytes(key, val)
+        self._evict()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._count(key, -1)
+        del self._lru[key]
+        self.nbytes -= self._nbytes.pop(key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        val = dict.__getitem__(self, key)
+        del self[key]
+        return val
+
+    def popitem(self):
+        """Remove and return the least recently used (key, structure) pair."""
+        if not self:
+            raise KeyError("popitem(): StructuresDict is empty")
+        key = next(iter(self._lru))
+        return key, self.pop(key)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def update(self, *args, **kwargs):
+        for key, val in dict(*args, **kwargs).items():
+            self[key] = val
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def _count(self, key, increment):
         # TODO better structure.id check
-        if key.startswith("V"):
-            self.n_voxelgrids += 1
+        if key.startswith("VP"):
+            self.n_voxelpyramids += increment
+        elif key.startswith("V"):
+            self.n_voxelgrids += increment
         elif key.startswith("K"):
-            self.n_kdtrees += 1
+            self.n_kdtrees += increment
         elif key.startswith("D"):
-            self.n_delanuays += 1
+            self.n_delanuays += increment
         elif key.startswith("CH"):
-            self.n_convex_hulls += 1
+            self.n_convex_hulls += increment
+        elif key.startswith("OG"):
+            self.n_occupancy_grids += increment
+        elif key.startswith("O"):
+            self.n_octrees += increment
+        elif key.startswith("B"):
+            self.n_bvhs += increment
+        elif key.startswith("T"):
+            self.n_tsdfs += increment
         else:
             raise ValueError("{} is not a valid structure.id".format(key))
-        super().__setitem__(key, val)
+
+    def __getitem__(self, key):
+        return self._get(key)
+
+    def _get(self, key, touch=True):
+        """Return the structure key, computing it first if it is deferred.
+
+        If touch, it becomes the most recently used structure.
+        """
+        val = super().__getitem__(key)
+        if touch:
+            self._lru.move_to_end(key)
+        if val._deferred:
+            val.compute()
+            val._deferred = False
+            self._update_nbytes(key, val)
+            self._evict()
+        return val
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        """List of the structures, computing the deferred ones. The LRU order is not changed."""
+        return [self._get(key, touch=False) for key in list(self) if key in self]
+
+    def items(self):
+        """List of (key, structure) pairs, computing the deferred ones. The LRU order is not changed."""
+        return [(key, self._get(key, touch=False)) for key in list(self) if key in self]
+
+    def _update_nbytes(self, key, val):
+        self.nbytes += val.nbytes - self._nbytes.get(key, 0)
+        self._nbytes[key] = val.nbytes
+
+    def _evict(self):
+        """Remove least recently used structures until the budget is met.
+
+        The most recently used structure is never removed.
+        """
+        if self.max_bytes is None:
+            return
+        while self.nbytes > self.max_bytes and len(self._lru) > 1:
+            del self[next(iter(self._lru))]
+            self.evictions += 1
+
+    @staticmethod
+    def _request_key(name, kwargs):
+        items = []
+        for key, val in sorted(kwargs.items()):
+            if isinstance(val, np.ndarray):
+                # the repr of large arrays is abbreviated, so use their content
+                val = np.ascontiguousarray(val)
+                val = "ndarray({},{},{})".format(
+                    val.dtype.str, val.shape, hashlib.sha1(val.data).hexdigest())
+            items.append((key, val))
+        return name, repr(items)
+
+    def find(self, name, kwargs):
+        """Return the id of the structure previously built with name and kwargs.
+
+        None if there is no such structure (i.e. it has not been built or it
+        has been removed). Updates the hits and misses counters.
+        """
+        key = self._requests.get(self._request_key(name, kwargs))
+        if key is not None and key in self:
+            self.hits += 1
+            self._lru.move_to_end(key)
+            return key
+        self.misses += 1
+        return None
+
+    def remember(self, name, kwargs, key):
+        """Record that the structure key was built with name and kwargs."""
+        self._requests[self._request_key(name, kwargs)] = key
+
+    def get_requests(self, key):
+        """Return the requests recorded for the structure key, to be restored with set_requests."""
+        return [request for request, val in self._requests.items() if val == key]
+
+    def set_requests(self, key, requests):
+        """Record that the structure key was built for each request returned by get_requests."""
+        for request in requests:
+            self._requests[tuple(request)] = key
+
+    def empty_like(self):
+        """Return an empty StructuresDict with the same budget."""
+        return StructuresDict(max_bytes=self.max_bytes)
+
+    def subset(self, points, boolean_array):
+        """Return a new StructuresDict with the structures derived for a subset of points.
+
+        Structures that can't be derived are dropped. See Structure.subset.
+        """
+        return self._derive("subset", points, boolean_array)
+
+    def extend(self, points, new_points):
+        """Return a new StructuresDict with the structures derived for the points with new points appended.
+
+        Structures that can't be derived are dropped. See Structure.extend.
+        """
+        return self._derive("extend", points, new_points)
+
+    def _derive(self, method, *args):
+        structures = self.empty_like()
+        for key in self._lru:
+            derived = getattr(dict.__getitem__(self, key), method)(*args)
+            if derived is not None:
+                structures[key] = derived
+        # only reuse the derived structures that match a fresh build
+        structures._requests = {
+            request: key for request, key in self._requests.items()
+            if key in structures and dict.__getitem__(structures, key).derives_exactly}
+        return structures
@@ -0,0 +1,328 @@
+import numpy as np
+
+from .base import Structure
+from .octree import _expand_ranges, morton_encode
+
+try:
+    from ..utils.numba import bvh_closest_point, bvh_raycast
+    is_numba_avaliable = True
+except ImportError:
+    is_numba_avaliable = False
+
+
+def _dot(a, b):
+    return np.einsum("ij,ij->i", a, b)
+
+
+def closest_point_on_segments(p, a, b):
+    """Return the point of each segment (a[i], b[i]) closest to p[i]."""
+    ab = b - a
+    length2 = _dot(ab, ab)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.clip(_dot(p - a, ab) / length2, 0, 1)
+    t[length2 == 0] = 0
+    return a + ab * t[:, None]
+
+
+def closest_point_on_triangles(p, a, b, c):
+    """Return the point of each triangle (a[i], b[i], c[i]) closest to p[i].
+
+    Vectorized version of the algorithm in Ericson, Real-Time Collision
+    Detection, 5.1.5. For degenerate (zero area) triangles, the closest
+    point of their edges.
+    """
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+    d1, d2 = _dot(ab, ap), _dot(ac, ap)
+    d3, d4 = _dot(ab, bp), _dot(ac, bp)
+    d5, d6 = _dot(ab, cp), _dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = 1 / (va + vb + vc)
+        closest = a + ab * (vb * denom)[:, None] + ac * (vc * denom)[:, None]
+        # the regions are checked from the last to the first, so the first match wins
+        regions = [
+            (d1 <= 0) & (d2 <= 0),
+            (d3 >= 0) & (d4 <= d3),
+            (vc <= 0) & (d1 >= 0) & (d3 <= 0),
+            (d6 >= 0) & (d5 <= d6),
+            (vb <= 0) & (d2 >= 0) & (d6 <= 0),
+            (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)]
+        points = [
+            a,
+            b,
+            a + ab * (d1 / (d1 - d3))[:, None],
+            c,
+            a + ac * (d2 / (d2 - d6))[:, None],
+            b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None]]
+    for region, point in zip(regions[::-1], points[::-1]):
+        closest = np.where(region[:, None], point, closest)
+
+    normal = np.cross(ab, ac)
+    degenerate = np.flatnonzero(_dot(normal, normal) == 0)
+    if len(degenerate):
+        p, a, b, c = p[degenerate], a[degenerate], b[degenerate], c[degenerate]
+        edges = np.stack([
+            closest_point_on_segments(p, a, b),
+            closest_point_on_segments(p, b, c),
+            closest_point_on_segments(p, c, a)])
+        nearest = np.argmin(np.linalg.norm(edges - p, axis=2), axis=0)
+        closest[degenerate] = edges[nearest, np.arange(len(degenerate))]
+    return closest
+
+
+def ray_triangle_intersection(origins, directions, a, b, c):
+    """Return the distance along each ray to each triangle, inf for misses.
+
+    Vectorized Moller-Trumbore. Distances are in units of the length of
+    the directions.
+    """
+    e1 = b - a
+    e2 = c - a
+    pvec = np.cross(directions, e2)
+    det = _dot(e1, pvec)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_det = 1 / det
+        tvec = origins - a
+        u = _dot(tvec, pvec) * inv_det
+        qvec = np.cross(tvec, e1)
+        v = _dot(directions, qvec) * inv_det
+        t = _dot(e2, qvec) * inv_det
+    hit = (det != 0) & (u >= 0) & (u <= 1) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(hit, t, np.inf)
+
+
+class BVH(Structure):
+
+    def __init__(self, *, points, triangles, leaf_size=4):
+        """Bounding volume hierarchy over the triangles of a mesh.
+
+        Parameters
+        ----------
+        points: (N, 3) numpy.array
+        triangles: (M, 3, 3) numpy.array
+            Vertices of each triangle, as returned by
+            PyntCloud.get_mesh_vertices.
+        leaf_size: int, optional
+            Default: 4
+            Maximum number of triangles in each leaf.
+
+        Notes
+        -----
+        Triangles are sorted by the Morton key of their centroids and spread
+        evenly over a power of 2 number of leaves, with at most leaf_size
+        consecutive triangles each. The tree is a complete binary tree over
+        the leaves, stored as flat arrays in heap order: the children of
+        node i are 2 * i + 1 and 2 * i + 2, and each node is split at the
+        median of its triangles in Morton order.
+        """
+        super().__init__(points=points)
+        self.triangles = np.asarray(triangles, dtype=np.float64)
+        self.leaf_size = leaf_size
+
+    @classmethod
+    def extract_info(cls, pyntcloud):
+        """ABC API"""
+        if pyntcloud.mesh is None:
+            raise ValueError("PyntCloud must have a mesh to build a BVH")
+        info = {
+            "points": pyntcloud.xyz,
+            "triangles": np.stack(pyntcloud.get_mesh_vertices(), axis=1)
+        }
+        return info
+
+    def compute(self):
+        """ABC API"""
+        self.id = "B({})".format(self.leaf_size)
+
+        centroids = self.triangles.mean(1)
+        xyzmin = centroids.min(0)
+        side = max(centroids.max(0) - xyzmin)
+        if side > 0:
+            ijk = np.floor((centroids - xyzmin) / side * (2 ** 21 - 1)).astype(np.int64)
+        else:
+            ijk = np.zeros(centroids.shape, dtype=np.int64)
+        #: original index of each triangle in self.triangles
+        self.order = np.argsort(morton_encode(ijk), kind="mergesort")
+        self.triangles = self.triangles[self.order]
+
+        n_leaves = 2 ** int(np.ceil(np.log2(max(len(self.triangles) / self.leaf_size, 1))))
+        self.n_internal = n_leaves - 1
+        #: the triangles of leaf j are self.triangles[leaf_starts[j]:leaf_starts[j + 1]];
+        #: they are spread evenly, so each node is split at the median
+        self.leaf_starts = (np.arange(n_leaves + 1) * len(self.triangles)) // n_leaves
+
+        # empty leaves have min > max
+        leaf_min = np.full((n_leaves, 3), np.inf)
+        leaf_max = np.full((n_leaves, 3), -np.inf)
+        full = self.leaf_starts[1:] > self.leaf_starts[:-1]
+        if len(self.triangles):
+            starts = self.leaf_starts[:-1][full]
+            leaf_min[full] = np.minimum.reduceat(self.triangles.min(1), starts, axis=0)
+            leaf_max[full] = np.maximum.reduceat(self.triangles.max(1), starts, axis=0)
+
+        node_min = [leaf_min]
+        node_max = [leaf_max]
+        for level in range(self.depth):
+            node_min.append(node_min[-1].reshape(-1, 2, 3).min(1))
+            node_max.append(node_max[-1].reshape(-1, 2, 3).max(1))
+        self.node_min = np.concatenate(node_min[::-1])
+        self.node_max = np.concatenate(node_max[::-1])
+
+    @property
+    def depth(self):
+        return int(np.log2(self.n_internal + 1))
+
+    def _leaf_triangles(self, leaves):
+        """Return the leaf of each candidate and the index (in sorted order) of its triangles."""
+        start = self.leaf_starts[leaves - self.n_internal]
+        end = self.leaf_starts[leaves - self.n_internal + 1]
+        return np.repeat(np.arange(len(leaves)), end - start), _expand_ranges(start, end)
+
+    def _box_distance2(self, p, nodes):
+        """Return the squared distance from each p to the closest and to the farthest point of each node."""
+        node_min = self.node_min[nodes]
+        node_max = self.node_max[nodes]
+        closest = np.maximum(np.maximum(node_min - p, p - node_max), 0)
+        farthest = np.maximum(np.abs(node_min - p), np.abs(p - node_max))
+        return np.sum(closest * closest, axis=1), np.sum(farthest * farthest, axis=1)
+
+    def _closest_point(self, points):
+        """numpy version of utils.numba.bvh_closest_point."""
+        n = len(points)
+        query = np.arange(n)
+        nodes = np.zeros(n, dtype=np.int64)
+
+        # every node holds at least one whole triangle, so no triangle is
+        # closer than the farthest point of the best node. Nodes whose
+        # closest point is beyond that are discarded, level by level
+        for level in range(self.depth):
+            query = np.repeat(query, 2)
+            nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+            lower, upper = self._box_distance2(points[query], nodes)
+            best = np.full(n, np.inf)
+            np.minimum.at(best, query, upper)
+            keep = lower <= best[query]
+            query, nodes = query[keep], nodes[keep]
+
+        pair, triangles = self._leaf_triangles(nodes)
+        query = query[pair]
+        closest = closest_point_on_triangles(points[query], *self.triangles[triangles].transpose(1, 0, 2))
+        d2 = np.sum((closest - points[query]) ** 2, axis=1)
+
+        order = np.lexsort((d2, query))
+        first = order[np.r_[True, query[order][1:] != query[order][:-1]]]
+        return np.sqrt(d2[first]), triangles[first], closest[first]
+
+    def closest_point(self, points, chunk_size=100000):
+        """Find the closest point of the mesh to each point.
+
+        Parameters
+        ----------
+        points: (M, 3) ndarray
+        chunk_size: int, optional
+            Default: 100000
+            Number of points processed at once, to bound memory.
+
+        Returns
+        -------
+        distances: (M,) ndarray
+        triangles: (M,) ndarray of int
+            Index (i.e. row of PyntCloud.mesh) of the closest triangle.
+        closest: (M, 3) ndarray
+            Closest point on the closest triangle.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        distances = np.empty(len(points))
+        triangles = np.empty(len(points), dtype=np.int64)
+        closest = np.empty((len(points), 3))
+
+        for first in range(0, len(points), chunk_size):
+            rows = slice(first, first + chunk_size)
+            if is_numba_avaliable:
+                bvh_closest_point(self.node_min, self.node_max, self.n_internal, self.leaf_starts,
+                                  self.triangles, points[rows], distances[rows], triangles[rows], closest[rows])
+            else:
+                distances[rows], triangles[rows], closest[rows] = self._closest_point(points[rows])
+
+        return distances, self.order[triangles], closest
+
+    def _raycast(self, origins, directions, inv_directions):
+        """numpy version of utils.numba.bvh_raycast."""
+        n = len(origins)
+        query = np.arange(n)
+        nodes = np.zeros(n, dtype=np.int64)
+        for level in range(self.depth + 1):
+            o = origins[query]
+            with np.errstate(invalid="ignore"):
+                t1 = (self.node_min[nodes] - o) * inv_directions[query]
+                t2 = (self.node_max[nodes] - o) * inv_directions[query]
+            # fmin / fmax ignore nan (origin on the slab, parallel ray)
+            t_near = np.fmax(np.fmax.reduce(np.fmin(t1, t2), axis=1), 0)
+            t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            empty = np.any(self.node_min[nodes] > self.node_max[nodes], axis=1)
+            keep = ~empty & (t_near <= t_far)
+            query, nodes = query[keep], nodes[keep]
+            if level < self.depth:
+                query = np.repeat(query, 2)
+                nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+
+        pair, triangles = self._leaf_triangles(nodes)
+        query = query[pair]
+        t = ray_triangle_intersection(origins[query], directions[query],
+                                      *self.triangles[triangles].transpose(1, 0, 2))
+        hit_t = np.full(n, np.inf)
+        hit_triangle = np.full(n, -1, dtype=np.int64)
+        order = np.lexsort((t, query))
+        first = order[np.r_[True, query[order][1:] != query[order][:-1]]] if len(order) else order
+        first = first[np.isfinite(t[first])]
+        hit_t[query[first]] = t[first]
+        hit_triangle[query[first]] = triangles[first]
+        return hit_t, hit_triangle
+
+    def raycast(self, origins, directions, chunk_size=100000):
+        """Find the first triangle hit by each ray.
+
+        Parameters
+        ----------
+        origins: (M, 3) ndarray
+        directions: (M, 3) ndarray
+            Need not be normalized.
+        chunk_size: int, optional
+            Default: 100000
+            Number of rays processed at once, to bound memory.
+
+        Returns
+        -------
+        t: (M,) ndarray
+            The hit point is origins + t * directions. Infinite for rays
+            that don't hit any triangle.
+        triangles: (M,) ndarray of int
+            Index (i.e. row of PyntCloud.mesh) of the triangle hit, -1 for
+            rays that don't hit any triangle.
+        """
+        origins, directions = np.broadcast_arrays(
+            np.asarray(origins, dtype=np.float64), np.asarray(directions, dtype=np.float64))
+        with np.errstate(divide="ignore"):
+            inv_directions = 1 / directions
+        hit_t = np.full(len(origins), np.inf)
+        hit_triangle = np.full(len(origins), -1, dtype=np.int64)
+
+        for first in range(0, len(origins), chunk_size):
+            rows = slice(first, first + chunk_size)
+            if is_numba_avaliable:
+                bvh_raycast(self.node_min, self.node_max, self.n_internal, self.leaf_starts, self.triangles,
+                            origins[rows], directions[rows], inv_directions[rows], hit_t[rows], hit_triangle[rows])
+            else:
+                hit_t[rows], hit_triangle[rows] = self._raycast(
+                    origins[rows], directions[rows], inv_directions[rows])
+
+        hit = hit_triangle >= 0
+        hit_triangle[hit] = self.order[hit_triangle[hit]]
+        return hit_t, hit_triangle
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from copy import copy
+from glob import glob
+
+import numpy as np
+
+from .kdtree import KDTree
+from .voxelgrid import VoxelGrid
+
+
+def xyz_hash(xyz):
+    """Return a hex digest identifying the values of xyz.
+
+    Values are compared as float64, so the same points stored as float32
+    and float64 have the same digest, while any rounding changes it.
+    """
+    xyz = np.ascontiguousarray(xyz, dtype=np.float64)
+    digest = hashlib.sha1()
+    digest.update("{}{}".format(xyz.dtype.str, xyz.shape).encode())
+    digest.update(xyz.data)
+    return digest.hexdigest()
+
+
+def _structure_filename(structures_dir, key):
+    return os.path.join(structures_dir, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+
+def save_structures(structures, xyz, structures_dir):
+    """Save structures inside structures_dir, keyed by the content hash of xyz.
+
+    Parameters
+    ----------
+    structures: StructuresDict
+        Only KDTrees and VoxelGrids are saved, with the requests (see
+        StructuresDict.remember) that built them.
+    xyz: (N, 3) ndarray
+        The points used to build the structures. They can only be loaded
+        back for points with exactly the same values.
+    structures_dir: str
+        Path of the cache directory. Created if it doesn't exist.
+
+    Returns
+    -------
+    saved: list of str
+        The id of each structure saved.
+    """
+    structures_dir = os.path.join(structures_dir, xyz_hash(xyz))
+    if not os.path.exists(structures_dir):
+        os.makedirs(structures_dir)
+
+    saved = []
+    for key, structure in structures.items():
+        filename = _structure_filename(structures_dir, key)
+        if isinstance(structure, VoxelGrid):
+            # arrays are saved as .npy so they can be memory-mapped
+            shell = copy(structure)
+            shell._points = None
+            for attr in VoxelGrid.SHARED_ARRAYS:
+                if getattr(structure, attr, None) is not None:
+                    np.save("{}.{}.npy".format(filename, attr), getattr(structure, attr))
+                setattr(shell, attr, None)
+        elif isinstance(structure, KDTree):
+            shell = structure
+        else:
+            continue
+        with open(filename + ".pkl", "wb") as f:
+            pickle.dump((key, structures.get_requests(key), shell), f, protocol=pickle.HIGHEST_PROTOCOL)
+        saved.append(key)
+
+    return saved
+
+
+def load_structures(xyz, structures_dir, mmap_mode="r"):
+    """Load the structures saved with save_structures for the given xyz.
+
+    The structures are unpickled, so only load directories you trust.
+
+    Parameters
+    ----------
+    xyz: (N, 3) ndarray
+        Only structures saved for points with the same content are loaded.
+    structures_dir: str
+        Path of the cache directory.
+    mmap_mode: str or None, optional
+        Default: "r"
+        Passed to numpy.load for the VoxelGrid arrays.
+
+    Returns
+    -------
+    structures: OrderedDict
+        Map Structure.id to Structure. Empty if nothing was saved for xyz.
+    requests: dict
+        Map Structure.id to the requests that built it, for
+        StructuresDict.set_requests.
+    """
+    structures = OrderedDict()
+    requests = {}
+    structures_dir = os.path.join(structures_dir, xyz_hash(xyz))
+
+    for path in sorted(glob(os.path.join(structures_dir, "*.pkl"))):
+        filename = path[:-len(".pkl")]
+        with open(path, "rb") as f:
+            key, requests[key], structure = pickle.load(f)
+        if isinstance(structure, VoxelGrid):
+            for attr in VoxelGrid.SHARED_ARRAYS:
+                if os.path.exists("{}.{}.npy".format(filename, attr)):
+                    setattr(structure, attr, np.load("{}.{}.npy".format(filename, attr), mmap_mode=mmap_mode))
+        structure._points = xyz
+        structures[key] = structure
+
+    return structures, requests
@@ -16,12 +16,40 @@ class ConvexHull(scipy_ConvexHull, Structure):
 
     def compute(self):
         """ABC API"""
-        self.id = "CH({})".format(self._qhull_options)
+        self.id = "CH({},{})".format(self._incremental, self._qhull_options)
         scipy_ConvexHull.__init__(self,
                                   self._points,
                                   self._incremental,
                                   self._qhull_options)
 
+    def add_points(self, points, restart=False):
+        """
+        Add new points to the hull, using qhull's incremental mode.
+
+        Parameters
+        ----------
+        points: (M, 3) ndarray
+        restart: bool, optional
+            Default: False
+            If True, the hull is computed again from scratch.
+
+        Notes
+        -----
+        Requires incremental=True.
+        """
+        if not self._incremental:
+            raise ValueError("add_points requires a ConvexHull built with incremental=True")
+        scipy_ConvexHull.add_points(self, points, restart)
+        self._points = self.points
+
+    def extend(self, points, new_points):
+        """The hull is updated in place if it was built with incremental=True."""
+        if not self._incremental:
+            return None
+        self.add_points(new_points)
+        self._points = points
+        return self
+
     def get_mesh(self):
         """
         Use convex hull simplices to build mesh.
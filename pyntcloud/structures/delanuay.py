@@ -1,9 +1,88 @@
+import numpy as np
 import pandas as pd
 from scipy.spatial import Delaunay
-from itertools import combinations
 
 from .base import Structure
 
+#: vertices of the 4 faces of a tetrahedron; face i is opposite to vertex 3 - i
+TETRAHEDRON_FACES = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+
+
+def tetrahedra_faces(simplices, points=None, boundary=False):
+    """Return the unique triangular faces of a set of tetrahedra.
+
+    Parameters
+    ----------
+    simplices: (M, 4) ndarray of int
+        Vertex indices of each tetrahedron.
+    points: (N, 3) ndarray, optional
+        Default: None
+        If given, faces are oriented so their normal (right hand rule)
+        points away from the tetrahedron they were taken from. For
+        boundary faces, that is outwards.
+    boundary: bool, optional
+        Default: False
+        If True, only the faces belonging to a single tetrahedron are kept.
+
+    Returns
+    -------
+    faces: (F, 3) ndarray of int
+        Sorted by their vertex indices.
+    """
+    simplices = np.asarray(simplices)
+    faces = simplices[:, TETRAHEDRON_FACES].reshape(-1, 3)
+
+    # the same face has the same sorted vertices in both tetrahedra
+    sorted_faces = np.sort(faces, axis=1)
+    n = int(simplices.max()) + 1 if len(simplices) else 0
+    if n < 2 ** 21:
+        # one int64 key per face is faster to sort than 3 columns
+        keys = sorted_faces.astype(np.int64)
+        keys = (keys[:, 0] * n + keys[:, 1]) * n + keys[:, 2]
+        order = np.argsort(keys)
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    else:
+        order = np.lexsort(sorted_faces.T[::-1])
+        sorted_faces = sorted_faces[order]
+        starts = np.flatnonzero(np.r_[True, np.any(sorted_faces[1:] != sorted_faces[:-1], axis=1)])
+    if boundary:
+        counts = np.diff(np.r_[starts, len(faces)])
+        starts = starts[counts == 1]
+
+    chosen = order[starts]
+    faces = faces[chosen]
+    if points is not None and len(faces):
+        opposite = simplices[chosen // 4, 3 - chosen % 4]
+        a, b, c = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]]
+        inwards = np.einsum("ij,ij->i", np.cross(b - a, c - a), points[opposite] - a) > 0
+        faces[inwards] = faces[inwards][:, [0, 2, 1]]
+
+    return faces
+
+
+def tetrahedra_circumradii(points, simplices):
+    """Return the radius of the circumscribed sphere of each tetrahedron.
+
+    Degenerate (flat) tetrahedra have infinite radius.
+    """
+    a = points[simplices[:, 0]]
+    u = points[simplices[:, 1]] - a
+    v = points[simplices[:, 2]] - a
+    w = points[simplices[:, 3]] - a
+    vw = np.cross(v, w)
+    wu = np.cross(w, u)
+    uv = np.cross(u, v)
+    # circumcenter relative to a
+    center = np.sum(u * u, 1)[:, None] * vw
+    center += np.sum(v * v, 1)[:, None] * wu
+    center += np.sum(w * w, 1)[:, None] * uv
+    denominator = 2 * np.sum(u * vw, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        radii = np.linalg.norm(center, axis=1) / np.abs(denominator)
+    radii[~np.isfinite(radii)] = np.inf
+    return radii
+
 
 class Delaunay3D(Delaunay, Structure):
 
@@ -11,31 +90,115 @@ class Delaunay3D(Delaunay, Structure):
                  furthest_site=False,
                  incremental=False,
                  qhull_options=None):
-        Structure.__init__(self, points)
+        Structure.__init__(self, points=points)
         self._furthest_site = furthest_site
         self._incremental = incremental
         self._qhull_options = qhull_options
 
     def compute(self):
         """ABC API"""
-        self.id = "D({},{})".format(self._furthest_site, self._qhull_options)
+        self.id = "D({},{},{})".format(self._furthest_site, self._incremental, self._qhull_options)
         Delaunay.__init__(self,
                           self._points,
                           self._furthest_site,
                           self._incremental,
                           self._qhull_options)
 
-    def get_mesh(self):
+    def add_points(self, points, restart=False):
+        """
+        Add new points to the triangulation, using qhull's incremental mode.
+
+        Parameters
+        ----------
+        points: (M, 3) ndarray
+        restart: bool, optional
+            Default: False
+            If True, the triangulation is computed again from scratch.
+
+        Notes
+        -----
+        Requires incremental=True.
+        """
+        if not self._incremental:
+            raise ValueError("add_points requires a Delaunay3D built with incremental=True")
+        Delaunay.add_points(self, points, restart)
+        self._points = self.points
+        self._radius_order = None
+
+    def extend(self, points, new_points):
+        """The triangulation is updated in place if it was built with incremental=True."""
+        if not self._incremental:
+            return None
+        self.add_points(new_points)
+        self._points = points
+        return self
+
+    def get_mesh(self, boundary=False):
         """
         Decompose the tetrahedrons into triangles to build mesh.
 
+        Faces shared by two tetrahedrons are included once, oriented
+        outwards of one of them. See tetrahedra_faces.
+
         The returned mesh is in mesh-vertex format, suitable for
         been assigned to PyntCloud.mesh.
+
+        Parameters
+        ----------
+        boundary: bool, optional
+            Default: False
+            If True, only the faces on the boundary of the triangulation
+            (i.e. the convex hull) are included.
+        """
+        faces = tetrahedra_faces(self.simplices, self.points, boundary=boundary)
+        mesh = pd.DataFrame(faces, columns=["v1", "v2", "v3"])
+
+        return mesh
+
+    def _sort_by_circumradius(self):
+        if getattr(self, "_radius_order", None) is None:
+            radii = tetrahedra_circumradii(self.points, self.simplices)
+            self._radius_order = np.argsort(radii)
+            self._sorted_radii = radii[self._radius_order]
+        return self._radius_order, self._sorted_radii
+
+    def get_alpha_shape(self, alpha):
+        """
+        Build the alpha shape mesh of the points.
+
+        The tetrahedrons with circumradius lower or equal than alpha are
+        kept and the faces on the boundary of their union, oriented
+        outwards, are returned in mesh-vertex format, suitable for been
+        assigned to PyntCloud.mesh.
+
+        Circumradii are computed once and reused by later calls.
+
+        Parameters
+        ----------
+        alpha: float
+            Radius of the alpha sphere. Use np.inf for the convex hull.
         """
-        triangles = []
-        for tetra in self.simplices:
-            for tri in combinations(tetra, 3):
-                triangles.append([tri[0], tri[1], tri[2]])
-        mesh = pd.DataFrame(triangles, columns=["v1", "v2", "v3"])
+        order, sorted_radii = self._sort_by_circumradius()
+        kept = order[:np.searchsorted(sorted_radii, alpha, side="right")]
+        faces = tetrahedra_faces(self.simplices[kept], self.points, boundary=True)
+        mesh = pd.DataFrame(faces, columns=["v1", "v2", "v3"])
 
         return mesh
+
+    def iter_alpha_shapes(self, alphas):
+        """
+        Build the alpha shape mesh for several values of alpha, reusing
+        the same triangulation and circumradii.
+
+        Parameters
+        ----------
+        alphas: iterable of float
+
+        Yields
+        ------
+        alpha: float
+        mesh: pd.DataFrame
+            As returned by get_alpha_shape.
+        """
+        for alpha in alphas:
+            yield alpha, self.get_alpha_shape(alpha)
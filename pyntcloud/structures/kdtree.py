@@ -2,6 +2,9 @@ from scipy.spatial import cKDTree
 
 from .base import Structure
 
+#: approximate size in bytes of each node of the tree
+NODE_SIZE = 72
+
 
 class KDTree(cKDTree, Structure):
 
@@ -19,3 +22,38 @@ class KDTree(cKDTree, Structure):
             leafsize=self._leafsize,
             compact_nodes=self._compact_nodes,
             balanced_tree=self._balanced_tree)
+
+    @property
+    def nbytes(self):
+        if self._deferred:
+            return 0
+        return self.data.nbytes + self.indices.nbytes + getattr(self, "size", 0) * NODE_SIZE
+
+    def __getstate__(self):
+        if self._deferred:
+            self.compute()
+            self._deferred = False
+        # the tree keeps its own copy of the points, so _points is not pickled
+        state = self.__dict__.copy()
+        state.pop("_points", None)
+        return cKDTree.__getstate__(self), state
+
+    def __setstate__(self, state):
+        cKDTree.__setstate__(self, state[0])
+        self.__dict__.update(state[1])
+        self._points = self.data
+
+    def subset(self, points, boolean_array):
+        """The KDTree is rebuilt over the new points the next time it is accessed."""
+        kdtree = KDTree(
+            points=points,
+            leafsize=self._leafsize,
+            compact_nodes=self._compact_nodes,
+            balanced_tree=self._balanced_tree)
+        kdtree.id = self.id
+        kdtree._deferred = True
+        return kdtree
+
+    def extend(self, points, new_points):
+        """The KDTree is rebuilt over the new points the next time it is accessed."""
+        return self.subset(points, None)
@@ -1,101 +1,588 @@
-#  HAKUNA MATATA
+import numpy as np
 
-"""
-VoxelGrid Class
-"""
+from .base import Structure
 
-import numpy as np
-import pandas as pd
+try:
+    from ..utils.numba import ranges_count_within, ranges_knn, ranges_within
+    is_numba_avaliable = True
+except ImportError:
+    is_numba_avaliable = False
+
+#: bits per axis available in a 64-bit Morton key
+MAX_LEVEL = 21
+
+
+def _part1by2(x):
+    """Spread the lowest 21 bits of x so there are 2 zero bits between each of them."""
+    x = x.astype(np.uint64) & np.uint64(0x1fffff)
+    x = (x | (x << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return x
+
+
+def _compact1by2(x):
+    """Inverse of _part1by2."""
+    x = x & np.uint64(0x1249249249249249)
+    x = (x | (x >> np.uint64(2))) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | (x >> np.uint64(4))) & np.uint64(0x100f00f00f00f00f)
+    x = (x | (x >> np.uint64(8))) & np.uint64(0x1f0000ff0000ff)
+    x = (x | (x >> np.uint64(16))) & np.uint64(0x1f00000000ffff)
+    x = (x | (x >> np.uint64(32))) & np.uint64(0x1fffff)
+    return x.astype(np.int64)
+
+
+def _expand_ranges(start, end):
+    """Concatenate arange(start[i], end[i]) for every i."""
+    counts = end - start
+    offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+    return np.arange(counts.sum()) + offsets
+
+
+def morton_encode(ijk):
+    """Interleave the bits of integer coordinates into Morton keys.
+
+    Parameters
+    ----------
+    ijk: (N, 3) ndarray of int
+        Integer coordinates, lower than 2 ** 21.
 
+    Returns
+    -------
+    keys: (N,) ndarray of uint64
+        The bit of i goes before the bits of j and k at each level, so the
+        3 bits of each level are i + 2 * j + 4 * k.
+    """
+    return _part1by2(ijk[:, 0]) | (_part1by2(ijk[:, 1]) << np.uint64(1)) | (_part1by2(ijk[:, 2]) << np.uint64(2))
 
-class Octree(object):
 
-    def __init__(self, points, max_level=2):
-        self.points = points
+def morton_decode(keys):
+    """Inverse of morton_encode.
+
+    Returns
+    -------
+    ijk: (N, 3) ndarray of int64
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    return np.column_stack([_compact1by2(keys >> np.uint64(i)) for i in range(3)])
+
+
+#: offsets to the 27 nodes around (and including) each node
+BLOCK_OFFSETS = np.array([[i, j, k] for i in [-1, 0, 1] for j in [-1, 0, 1] for k in [-1, 0, 1]])
+
+
+class Octree(Structure):
+
+    #: subset keeps the bounding box of the original points
+    derives_exactly = False
+
+    def __init__(self, *, points, max_level=2):
+        """Octree with the points sorted by their Morton key.
+
+        Parameters
+        ----------
+        points: (N, 3) numpy.array
+        max_level: int, optional
+            Default: 2
+            Number of times the bounding box is subdivided. At most 21.
+
+        Notes
+        -----
+        Each point gets a 64-bit Morton key of its cell at max_level. The
+        key of the node containing the point at any level is obtained by
+        a bit shift (see get_level), and as points are sorted by key, the
+        points of each node are a contiguous range of the sorted order
+        (see get_node_range).
+        """
+        super().__init__(points=points)
+        if not 0 < max_level <= MAX_LEVEL:
+            raise ValueError("max_level must be between 1 and {}".format(MAX_LEVEL))
         self.max_level = max_level
-        self.structure = pd.DataFrame(
-            np.zeros((self.points.shape[0], self.max_level), dtype=np.uint8))
-        xyzmin = points.min(0)
-        xyzmax = points.max(0)
+
+    def compute(self):
+        """ABC API."""
+        xyzmin = self._points.min(0)
+        xyzmax = self._points.max(0)
         #: adjust to obtain a  minimum bounding box with all sides of equal length
         diff = max(xyzmax - xyzmin) - (xyzmax - xyzmin)
-        xyzmin = xyzmin - diff / 2
-        xyzmax = xyzmax + diff / 2
-        self.xyzmin = xyzmin
-        self.xyzmax = xyzmax
-        self.id = "O({})".format(max_level)
-        self.build()
-
-    def build(self):
-        self.sizes = np.zeros(self.max_level)
-        level_ptp = max(self.xyzmax - self.xyzmin) / 2
-        mid_points = np.zeros_like(self.points)
-        mid_points[:] = (self.xyzmin + self.xyzmax) / 2
-
-        for i in range(self.max_level):
-            self.sizes[i] = level_ptp
-            level_ptp /= 2
-            bigger = self.points > mid_points
-
-            if i != self.max_level - 1:
-                mid_points = np.where(
-                    bigger, mid_points + level_ptp, mid_points - level_ptp)
-
-            bigger = bigger.astype(np.uint8)
-            self.structure.loc[:, i] = (
-                (bigger[:, 1] * 2) + bigger[:, 0]) + (bigger[:, 2] * (2 * 2))
+        self.xyzmin = xyzmin - diff / 2
+        self.xyzmax = xyzmax + diff / 2
+        self.id = "O({})".format(self.max_level)
 
-    def get_centroids(self, level):
-        st = self.structure.loc[:, range(level)]
+        side = max(self.xyzmax - self.xyzmin)
+        #: side of the nodes at each level, starting at level 1
+        self.sizes = side / 2 ** np.arange(1, self.max_level + 1)
 
-        for n, i in enumerate(["x", "y", "z"]):
-            st[i] = self.points[:, n]
+        n_cells = 2 ** self.max_level
+        if side > 0:
+            ijk = np.floor((self._points - self.xyzmin) / self.sizes[-1]).astype(np.int64)
+        else:
+            ijk = np.zeros(self._points.shape, dtype=np.int64)
+        np.clip(ijk, 0, n_cells - 1, out=ijk)
 
-        return st.groupby([x for x in range(level)], sort=False).mean().values
+        self.keys = morton_encode(ijk)
+        self.order = np.argsort(self.keys, kind="mergesort")
+        self.sorted_keys = self.keys[self.order]
+
+    def subset(self, points, boolean_array):
+        """Keep the bounding box and the keys of the kept points; no sort is needed."""
+        octree = Octree(points=points, max_level=self.max_level)
+        for attr in ["id", "xyzmin", "xyzmax", "sizes"]:
+            setattr(octree, attr, getattr(self, attr))
+        octree.keys = self.keys[boolean_array]
+        new_index = np.cumsum(boolean_array) - 1
+        octree.order = new_index[self.order[boolean_array[self.order]]]
+        octree.sorted_keys = octree.keys[octree.order]
+        return octree
+
+    def _shift(self, level):
+        if not 0 <= level <= self.max_level:
+            raise ValueError("level must be between 0 and {}".format(self.max_level))
+        return np.uint64(3 * (self.max_level - level))
+
+    def get_level(self, level, ordered=False):
+        """Return the key of the node containing each point at the given level.
+
+        Parameters
+        ----------
+        level: int
+            Between 0 (the root) and max_level.
+        ordered: bool, optional
+            Default: False
+            If True, keys are returned in the sorted order of the points
+            (i.e. for points[self.order]), so they are in ascending order.
+
+        Returns
+        -------
+        keys: (N,) ndarray of uint64
+        """
+        keys = self.sorted_keys if ordered else self.keys
+        return keys >> self._shift(level)
 
     def get_level_as_sf(self, level):
-        sf = np.zeros((self.points.shape[0], level), dtype=str)
-
-        for k, v in self.structure.groupby([x for x in range(level)]).indices.items():
-            sf[v] = k
-
-        return [int("".join(sf[i])) for i in range(len(sf))]
-
-    def eigen_decomposition(self, level):
-        st = self.structure.loc[:, range(level)]
-
-        for n, i in enumerate(["x", "y", "z"]):
-            st[i] = self.points[:, n]
-
-        e_out = np.zeros((st.shape[0], 3))
-        ev1_out = np.zeros((st.shape[0], 3))
-        ev2_out = np.zeros((st.shape[0], 3))
-        ev3_out = np.zeros((st.shape[0], 3))
-
-        this_level = st.groupby([x for x in range(level)], sort=False)
-
-        # to use when groups in current level have less than 3 points
-        prev_level = st.groupby([x for x in range(level - 1)], sort=False)
-        min_level = prev_level
-        min_i = 1
-        # find the minimum level where there is no group with less than 3
-        while min_level.size().min() < 3:
-            min_i += 1
-            min_level = st.groupby([x for x in range(level - min_i)])
-
-        for n, g in this_level:
-            if g.shape[0] < 3:
-                g = prev_level.get_group(n[:-1])
-                if g.shape[0] < 3:
-                    g = min_level.get_group(n[:-min_i])
-
-            eig_val, eig_vec = np.linalg.eig(np.cov(g.values[:, level:].T))
-            idx = eig_val.argsort()[::-1]
-            eig_val = eig_val[idx]
-            eig_vec = eig_vec[:, idx]
-            e_out[g.index.values] = eig_val
-            ev1_out[g.index.values] = eig_vec[:, 0]
-            ev2_out[g.index.values] = eig_vec[:, 1]
-            ev3_out[g.index.values] = eig_vec[:, 2]
-
-        return e_out[:, 0], e_out[:, 1], e_out[:, 2], ev1_out, ev2_out, ev3_out
+        """Return the node key of each point at the given level, as int64."""
+        return self.get_level(level).astype(np.int64)
+
+    def get_nodes(self, level):
+        """Return the occupied nodes at the given level.
+
+        Returns
+        -------
+        nodes: (M,) ndarray of uint64
+            Keys of the nodes, in ascending order.
+        starts: (M,) ndarray of int
+            Position in self.order of the first point of each node.
+        counts: (M,) ndarray of int
+            Number of points in each node.
+        """
+        keys = self.get_level(level, ordered=True)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        return keys[starts], starts, counts
+
+    def get_node_range(self, level, nodes):
+        """Find the range of self.order holding the points of each node.
+
+        Parameters
+        ----------
+        level: int
+        nodes: int or ndarray of int
+            Keys of the nodes at the given level.
+
+        Returns
+        -------
+        start, end: int or ndarray of int
+            Points of each node are self.order[start:end]. Empty for
+            nodes without points.
+        """
+        shift = self._shift(level)
+        nodes = np.asarray(nodes, dtype=np.uint64)
+        start = np.searchsorted(self.sorted_keys, nodes << shift, side="left")
+        end = np.searchsorted(self.sorted_keys, (nodes + np.uint64(1)) << shift, side="left")
+        return start, end
+
+    def get_node_points(self, level, node):
+        """Return the indices of the points inside one node."""
+        start, end = self.get_node_range(level, node)
+        return self.order[start:end]
+
+    def get_centroids(self, level):
+        """Return the centroid of the points of each occupied node, in ascending key order."""
+        nodes, starts, counts = self.get_nodes(level)
+        return np.add.reduceat(self._points[self.order], starts, axis=0) / counts[:, None]
+
+    def get_lod(self, level, representative="centroid"):
+        """Return one point per occupied node at the given level.
+
+        Parameters
+        ----------
+        level: int
+        representative: {"centroid", "first", "random"}, optional
+            Default: "centroid"
+            centroid: the mean of the points of each node.
+            first: the first point of each node in Morton order.
+            random: a random point of each node.
+
+        Returns
+        -------
+        nodes: (M,) ndarray of uint64
+            Keys of the occupied nodes, in ascending order.
+        xyz: (M, 3) ndarray
+        """
+        return next(self.iter_lod(representative=representative, levels=[level]))[1:]
+
+    def iter_lod(self, representative="centroid", levels=None):
+        """Yield the levels of detail from coarse to fine.
+
+        The nodes of the finest level are grouped once; each coarser level
+        is built from them, so the points are only traversed once.
+
+        Parameters
+        ----------
+        representative: {"centroid", "first", "random"}, optional
+            Default: "centroid"
+            See get_lod.
+        levels: list of int, optional
+            Default: None
+            The levels to yield. If None, from 0 to max_level.
+
+        Yields
+        ------
+        level: int
+        nodes: (M,) ndarray of uint64
+        xyz: (M, 3) ndarray
+            As returned by get_lod.
+        """
+        if representative not in ["centroid", "first", "random"]:
+            raise ValueError("Unsupported representative. Check docstring")
+        levels = sorted(range(self.max_level + 1) if levels is None else levels)
+        if not levels:
+            return
+
+        finest = levels[-1]
+        fine_nodes, fine_starts, fine_counts = self.get_nodes(finest)
+        if representative == "centroid":
+            fine_sums = np.add.reduceat(self.sorted_points, fine_starts, axis=0)
+
+        for level in levels:
+            nodes = fine_nodes >> self._shift(self.max_level - finest + level)
+            first = np.flatnonzero(np.r_[True, nodes[1:] != nodes[:-1]])
+            counts = np.add.reduceat(fine_counts, first)
+            starts = fine_starts[first]
+
+            if representative == "centroid":
+                xyz = np.add.reduceat(fine_sums, first, axis=0) / counts[:, None]
+            elif representative == "first":
+                xyz = self.sorted_points[starts]
+            else:
+                xyz = self.sorted_points[starts + np.floor(np.random.rand(len(starts)) * counts).astype(np.int64)]
+
+            yield level, nodes[first], xyz
+
+    def eigen_decomposition(self, level, min_points=3):
+        """Eigen decomposition of the covariance matrix of the points of each node.
+
+        Parameters
+        ----------
+        level: int
+        min_points: int, optional
+            Default: 3
+            Nodes with less points use the points of their closest ancestor
+            with at least min_points points.
+
+        Returns
+        -------
+        e1, e2, e3: (N,) ndarray
+            Eigenvalues of the node of each point, in descending order.
+        ev1, ev2, ev3: (N, 3) ndarray
+            Corresponding eigenvectors.
+        """
+        # centered to reduce the loss of precision of the sums of squares
+        xyz = self._points[self.order] - self._points.mean(0)
+        i, j = np.triu_indices(3)
+        # count, x, y, z, xx, xy, xz, yy, yz, zz
+        moments = np.column_stack([np.ones(len(xyz)), xyz, xyz[:, i] * xyz[:, j]])
+
+        # sums of each node, from level up to the root; parents are
+        # contiguous groups of children, so their sums come from the children
+        nodes, starts, counts = self.get_nodes(level)
+        sums = [np.add.reduceat(moments, starts, axis=0)]
+        parents = []
+        for parent_level in range(level - 1, -1, -1):
+            parent_starts = self.get_nodes(parent_level)[1]
+            parents.append(np.searchsorted(parent_starts, starts, side="right") - 1)
+            sums.append(np.add.reduceat(sums[-1], np.searchsorted(starts, parent_starts), axis=0))
+            starts = parent_starts
+
+        # climb from each node at level until there are enough points
+        offsets = np.cumsum([0] + [len(x) for x in sums])
+        sums = np.concatenate(sums)
+        node = np.arange(len(nodes))
+        chosen = node.copy()
+        pending = sums[chosen, 0] < min_points
+        for depth, parent in enumerate(parents):
+            if not np.any(pending):
+                break
+            node = parent[node]
+            chosen[pending] = offsets[depth + 1] + node[pending]
+            pending = sums[chosen, 0] < min_points
+
+        # small nodes share the decomposition of their ancestor
+        unique_chosen, node_decomposition = np.unique(chosen, return_inverse=True)
+        node_sums = sums[unique_chosen]
+
+        n = node_sums[:, :1]
+        mean = node_sums[:, 1:4] / n
+        cov = np.empty((len(node_sums), 3, 3))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # same as np.cov, with n - 1 degrees of freedom
+            upper = (node_sums[:, 4:] - n * mean[:, i] * mean[:, j]) / (n - 1)
+        cov[:, i, j] = upper
+        cov[:, j, i] = upper
+        # only if the whole cloud has less than 2 points
+        cov[~np.isfinite(cov)] = 0
+
+        eig_val, eig_vec = np.linalg.eigh(cov)
+        # descending order
+        eig_val = eig_val[:, ::-1]
+        eig_vec = eig_vec[:, :, ::-1]
+
+        point_node = np.empty(len(xyz), dtype=np.int64)
+        point_node[self.order] = np.repeat(node_decomposition, counts)
+        eig_val = eig_val[point_node]
+        eig_vec = eig_vec[point_node]
+        return (eig_val[:, 0], eig_val[:, 1], eig_val[:, 2],
+                eig_vec[:, :, 0], eig_vec[:, :, 1], eig_vec[:, :, 2])
+
+    @property
+    def data(self):
+        """The points, as in KDTree.data."""
+        return self._points
+
+    def _node_side(self, level):
+        return max(self.xyzmax - self.xyzmin) / 2 ** level
+
+    def _level_for_count(self, count):
+        """Return the deepest level whose occupied nodes hold at least count points on average."""
+        for level in range(self.max_level, 0, -1):
+            keys = self.get_level(level, ordered=True)
+            n_nodes = np.count_nonzero(keys[1:] != keys[:-1]) + 1
+            if len(keys) >= count * n_nodes:
+                return level
+        return 0
+
+    def query_box(self, min_xyz, max_xyz):
+        """Find the points strictly inside an axis aligned box.
+
+        Nodes fully inside the box are taken whole and nodes outside are
+        discarded, so only the points of the nodes crossing the faces of
+        the box are checked.
+
+        Parameters
+        ----------
+        min_xyz, max_xyz: array-like of 3 float
+            Limits of the box. Use -np.inf / np.inf for unbounded sides.
+
+        Returns
+        -------
+        indices: (M,) ndarray of int
+            Indices of the points inside, in ascending order.
+        """
+        min_xyz = np.asarray(min_xyz, dtype=np.float64)
+        max_xyz = np.asarray(max_xyz, dtype=np.float64)
+
+        inside_ranges = []
+        nodes = np.zeros(1, dtype=np.uint64)
+        for level in range(self.max_level + 1):
+            side = self._node_side(level)
+            node_min = self.xyzmin + morton_decode(nodes) * side
+            node_max = node_min + side
+
+            outside = np.any((node_min >= max_xyz) | (node_max <= min_xyz), axis=1)
+            inside = np.all((node_min > min_xyz) & (node_max < max_xyz), axis=1)
+            inside_ranges.append(self.get_node_range(level, nodes[inside]))
+
+            nodes = nodes[~(outside | inside)]
+            if level == self.max_level or not len(nodes):
+                break
+            children = (nodes[:, None] * np.uint64(8) + np.arange(8, dtype=np.uint64)).ravel()
+            start, end = self.get_node_range(level + 1, children)
+            nodes = children[end > start]
+
+        positions = [_expand_ranges(*x) for x in inside_ranges]
+        if len(nodes):
+            candidates = self.order[_expand_ranges(*self.get_node_range(self.max_level, nodes))]
+            xyz = self._points[candidates]
+            candidates = candidates[np.all((xyz > min_xyz) & (xyz < max_xyz), axis=1)]
+        else:
+            candidates = np.array([], dtype=np.int64)
+
+        return np.sort(np.concatenate([self.order[x] for x in positions] + [candidates]))
+
+    @property
+    def sorted_points(self):
+        """The points in Morton order, built on first use. Queries read them."""
+        if getattr(self, "_sorted_points", None) is None:
+            self._sorted_points = self._points[self.order]
+        return self._sorted_points
+
+    def _block_ranges(self, x, level):
+        """Find the points in the 27 nodes around each query point at level.
+
+        Returns
+        -------
+        start, end: (len(x), 27) ndarray of int
+            The points of each node are sorted_points[start:end].
+        margin: (len(x),) ndarray
+            Distance from each query point to the closest face of its block
+            of nodes. Faces on the bounds of the octree are not considered,
+            as there are no points beyond them.
+        """
+        side = self._node_side(level)
+        n_nodes = 2 ** level
+        ijk = np.clip(np.floor((x - self.xyzmin) / side).astype(np.int64), 0, n_nodes - 1)
+
+        block_min = np.where(ijk > 0, self.xyzmin + (ijk - 1) * side, -np.inf)
+        block_max = np.where(ijk < n_nodes - 1, self.xyzmin + (ijk + 2) * side, np.inf)
+        margin = np.minimum(x - block_min, block_max - x).min(1)
+
+        neighbors = ijk[:, None, :] + BLOCK_OFFSETS[None, :, :]
+        valid = np.all((neighbors >= 0) & (neighbors < n_nodes), axis=2)
+        start = np.zeros(valid.shape, dtype=np.int64)
+        end = np.zeros(valid.shape, dtype=np.int64)
+        start[valid], end[valid] = self.get_node_range(level, morton_encode(neighbors[valid]))
+        return start, end, margin
+
+    @staticmethod
+    def _expand_block_ranges(start, end):
+        """Return the index of the query point and the position in sorted_points of each candidate."""
+        counts = end - start
+        query = np.repeat(np.arange(len(start)), counts.sum(1))
+        return query, _expand_ranges(start.ravel(), end.ravel())
+
+    def query_radius(self, x, r, chunk_size=100000):
+        """Find the points within distance r of each point in x.
+
+        Parameters
+        ----------
+        x: (M, 3) ndarray
+        r: float
+        chunk_size: int, optional
+            Default: 100000
+            Number of query points processed at once, to bound memory.
+
+        Returns
+        -------
+        neighbors: list of M ndarray
+            Indices of the points at distance <= r, in ascending order.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        # deepest level whose nodes are at least as big as r
+        level = int(np.clip(np.floor(np.log2(self._node_side(0) / r)), 0, self.max_level)) if r > 0 else self.max_level
+
+        neighbors = []
+        for first in range(0, len(x), chunk_size):
+            chunk = x[first:first + chunk_size]
+            start, end, margin = self._block_ranges(chunk, level)
+            if is_numba_avaliable:
+                counts = np.zeros(len(chunk), dtype=np.int64)
+                ranges_count_within(self.sorted_points, chunk, start, end, r * r, counts)
+                offsets = np.r_[0, np.cumsum(counts)]
+                found = ranges_within(self.sorted_points, chunk, start, end, r * r, offsets,
+                                      np.empty(offsets[-1], dtype=np.int64))
+                query = np.repeat(np.arange(len(chunk)), counts)
+            else:
+                query, found = self._expand_block_ranges(start, end)
+                inside = np.sum((chunk[query] - self.sorted_points[found]) ** 2, axis=1) <= r * r
+                query, found = query[inside], found[inside]
+            found = self.order[found]
+            order = np.lexsort((found, query))
+            splits = np.searchsorted(query[order], np.arange(1, len(chunk)))
+            neighbors.extend(np.split(found[order], splits))
+        return neighbors
+
+    def query_knn(self, x, k, chunk_size=100000):
+        """Find the k nearest points to each point in x.
+
+        Candidates are taken from the 27 nodes around each query point, at
+        a level where nodes hold about k / 4 points. Query points whose k-th
+        nearest candidate is farther than the faces of that block are
+        processed again at the parent level, so results are exact.
+
+        Parameters
+        ----------
+        x: (M, 3) ndarray
+        k: int
+        chunk_size: int, optional
+            Default: 100000
+            Number of query points processed at once, to bound memory.
+
+        Returns
+        -------
+        distances: (M, k) ndarray
+        indices: (M, k) ndarray of int
+            As in cKDTree.query, missing neighbors have infinite distance and
+            index equal to the number of points.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        n = len(self._points)
+        distances = np.full((len(x), k), np.inf)
+        indices = np.full((len(x), k), n, dtype=np.int64)
+
+        # the k-th neighbor is usually inside the node of the query point or
+        # the adjacent ones if nodes hold k / 4 points
+        start_level = self._level_for_count(k / 4)
+        for first in range(0, len(x), chunk_size):
+            pending = np.arange(first, min(first + chunk_size, len(x)))
+            for level in range(start_level, -1, -1):
+                start, end, margin = self._block_ranges(x[pending], level)
+
+                if is_numba_avaliable:
+                    d = np.full((len(pending), k), np.inf)
+                    found = np.full((len(pending), k), -1, dtype=np.int64)
+                    ranges_knn(self.sorted_points, x[pending], start, end, d, found)
+                    d = np.sqrt(d)
+                    # at the root all the points are candidates
+                    done = (d[:, -1] <= margin) | (level == 0)
+                    rows = pending[done]
+                    distances[rows] = d[done]
+                    indices[rows] = np.where(found[done] >= 0, self.order[found[done]], n)
+                else:
+                    query, found = self._expand_block_ranges(start, end)
+                    d = np.sqrt(np.sum((x[pending][query] - self.sorted_points[found]) ** 2, axis=1))
+                    order = np.lexsort((d, query))
+                    query, found, d = query[order], found[order], d[order]
+                    rank = np.arange(len(query)) - np.searchsorted(query, query, side="left")
+                    keep = rank < k
+                    query, found, d, rank = query[keep], found[keep], d[keep], rank[keep]
+
+                    kth = np.full(len(pending), np.inf)
+                    kth[query[rank == k - 1]] = d[rank == k - 1]
+                    done = (kth <= margin) | (level == 0)
+                    valid = done[query]
+                    rows = pending[query[valid]]
+                    distances[rows, rank[valid]] = d[valid]
+                    indices[rows, rank[valid]] = self.order[found[valid]]
+
+                pending = pending[~done]
+                if not len(pending):
+                    break
+
+        return distances, indices
+
+    def query(self, x, k=1, workers=None):
+        """Same as query_knn, with the signature of cKDTree.query.
+
+        Allows the Octree to be used where a KDTree is expected.
+        workers is ignored.
+        """
+        distances, indices = self.query_knn(np.atleast_2d(x), k)
+        if k == 1:
+            return distances[:, 0], indices[:, 0]
+        return distances, indices
+
+    def query_ball_tree(self, other, r):
+        """Same as query_radius(other.data, r), with the signature of cKDTree.query_ball_tree."""
+        return [list(x) for x in self.query_radius(other.data, r)]
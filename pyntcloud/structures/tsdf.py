@@ -0,0 +1,353 @@
+import numpy as np
+import pandas as pd
+
+from .base import Structure
+
+#: voxel coordinates are packed in 21 bits per axis, centered on 0
+_OFFSET = 2 ** 20
+_MASK = 2 ** 21 - 1
+
+#: corners of a voxel cube, numbered x + 2 * y + 4 * z
+CUBE_CORNERS = np.array([[x, y, z] for z in [0, 1] for y in [0, 1] for x in [0, 1]])
+
+#: the 6 tetrahedra of a cube around its 0-7 diagonal
+CUBE_TETRAHEDRA = np.array([[0, 1, 3, 7], [0, 3, 2, 7], [0, 2, 6, 7], [0, 6, 4, 7], [0, 4, 5, 7], [0, 5, 1, 7]])
+
+
+def check_voxels(ijk):
+    """Raise ValueError if any of the (N, 3) integer voxel coordinates can't be packed with pack_voxels."""
+    if len(ijk) and (ijk.min() < -_OFFSET or ijk.max() >= _OFFSET):
+        raise ValueError("Voxel coordinates must be in [-2 ** 20, 2 ** 20), use a bigger voxel_size")
+
+
+def pack_voxels(ijk):
+    """Pack (N, 3) integer voxel coordinates, each in [-2 ** 20, 2 ** 20), into (N,) int64 keys."""
+    check_voxels(ijk)
+    ijk = ijk + _OFFSET
+    return (ijk[:, 0] << 42) | (ijk[:, 1] << 21) | ijk[:, 2]
+
+
+def unpack_voxels(keys):
+    """Inverse of pack_voxels."""
+    return np.column_stack([(keys >> 42) & _MASK, (keys >> 21) & _MASK, keys & _MASK]) - _OFFSET
+
+
+class VoxelBlocks(object):
+    """Sparse storage of per-voxel values, allocated in blocks of block_size ** 3 voxels.
+
+    Blocks are found through their packed keys, sorted by _block_order.
+    Subclasses list their per-voxel arrays in BLOCK_ARRAYS, each stored as
+    an (allocated blocks, block_size ** 3) float32 array with a fill value
+    for the voxels never written.
+    """
+
+    #: (attribute name, fill value) of each per-voxel array
+    BLOCK_ARRAYS = []
+
+    def _init_blocks(self):
+        self.n_blocks = 0
+        #: keys of the allocated blocks, in allocation order
+        self.block_keys = np.zeros(0, dtype=np.int64)
+        self._block_order = np.zeros(0, dtype=np.int64)
+        for name, fill in self.BLOCK_ARRAYS:
+            setattr(self, name, np.full((0, self.block_size ** 3), fill, dtype=np.float32))
+
+    def _find_blocks(self, keys):
+        """Return the slot of each block key, -1 for blocks not allocated."""
+        slots = np.full(len(keys), -1, dtype=np.int64)
+        if self.n_blocks:
+            sorted_keys = self.block_keys[:self.n_blocks][self._block_order]
+            position = np.minimum(np.searchsorted(sorted_keys, keys), self.n_blocks - 1)
+            found = sorted_keys[position] == keys
+            slots[found] = self._block_order[position[found]]
+        return slots
+
+    def _allocate_blocks(self, keys):
+        """Allocate the blocks not allocated yet and return the slot of every key."""
+        slots = self._find_blocks(keys)
+        new = np.unique(keys[slots < 0])
+        if len(new):
+            n = self.n_blocks + len(new)
+            if n > len(self.block_keys):
+                # grow geometrically, so allocation is amortized O(1) per block
+                capacity = max(n, 2 * len(self.block_keys))
+                extra = capacity - len(self.block_keys)
+                self.block_keys = np.concatenate([self.block_keys, np.zeros(extra, dtype=np.int64)])
+                for name, fill in self.BLOCK_ARRAYS:
+                    setattr(self, name, np.concatenate([
+                        getattr(self, name), np.full((extra, self.block_size ** 3), fill, dtype=np.float32)]))
+            self.block_keys[self.n_blocks:n] = new
+            self.n_blocks = n
+            self._block_order = np.argsort(self.block_keys[:n], kind="mergesort")
+            slots = self._find_blocks(keys)
+        return slots
+
+    def _locate(self, ijk, allocate=False):
+        """Return the block slot and the position inside the block of each voxel."""
+        block = ijk // self.block_size
+        local = ijk - block * self.block_size
+        keys = pack_voxels(block)
+        slots = self._allocate_blocks(keys) if allocate else self._find_blocks(keys)
+        return slots, (local[:, 0] * self.block_size + local[:, 1]) * self.block_size + local[:, 2]
+
+    def _voxels_ijk(self, slots, local):
+        """Inverse of _locate."""
+        block = unpack_voxels(self.block_keys[slots])
+        return block * self.block_size + np.column_stack(np.unravel_index(local, [self.block_size] * 3))
+
+
+class TSDFVolume(VoxelBlocks, Structure):
+
+    #: changed by integrate
+    cacheable = False
+
+    BLOCK_ARRAYS = [("tsdf", 1), ("weight", 0)]
+
+    def __init__(self, *, points, voxel_size, truncation=None, block_size=8, origin=None, pose=None):
+        """Truncated signed distance function fused from many scans.
+
+        Parameters
+        ----------
+        points: (N, 3) numpy.array
+        voxel_size: float
+            Side of the voxels.
+        truncation: float, optional
+            Default: None
+            Distance to the surface beyond which the signed distance is
+            truncated. If None, 3 * voxel_size.
+        block_size: int, optional
+            Default: 8
+            Voxels are allocated in blocks of block_size ** 3, only where
+            scans pass close to a surface.
+        origin: (3,) array-like, optional
+            Default: None
+            Sensor position for points. If origin or pose is given, points
+            are integrated as the first scan. See integrate.
+        pose: (4, 4) array-like, optional
+            Default: None
+            See integrate.
+
+        Notes
+        -----
+        The voxels are the cells of a regular grid of side voxel_size with a
+        corner at (0, 0, 0), so the volume is not bounded by the points.
+        The geometry of VoxelGrid is not used on purpose: its bounding box
+        is fixed by the points it is built from, while the volume grows to
+        cover every scan integrated, so later scans would be cut.
+        Each voxel stores the truncated signed distance, normalized to
+        [-1, 1] (positive in front of the surface, as seen from the sensor)
+        and the weight (number of scans that observed it) used to average it.
+        """
+        super().__init__(points=points)
+        self.voxel_size = float(voxel_size)
+        self.truncation = 3 * self.voxel_size if truncation is None else float(truncation)
+        self.block_size = block_size
+        self._origin = origin
+        self._pose = pose
+
+    def compute(self):
+        """ABC API."""
+        self.id = "T({},{},{})".format(self.voxel_size, self.truncation, self.block_size)
+        if self._pose is not None:
+            self.id = "{}({})".format(self.id, np.asarray(self._pose, dtype=np.float64).ravel().tolist())
+        elif self._origin is not None:
+            self.id = "{}({})".format(self.id, np.asarray(self._origin, dtype=np.float64).tolist())
+        self._init_blocks()
+        if self._origin is not None or self._pose is not None:
+            self.integrate(self._points, origin=self._origin, pose=self._pose)
+
+    def get_values(self, ijk):
+        """Return the TSDF and weight of the given voxels.
+
+        Parameters
+        ----------
+        ijk: (M, 3) ndarray of int
+            Integer coordinates of the voxels.
+
+        Returns
+        -------
+        tsdf, weight: (M,) ndarray
+            Voxels never observed have tsdf 1 and weight 0.
+        """
+        slots, local = self._locate(np.asarray(ijk, dtype=np.int64))
+        tsdf = np.ones(len(slots), dtype=np.float32)
+        weight = np.zeros(len(slots), dtype=np.float32)
+        found = slots >= 0
+        tsdf[found] = self.tsdf[slots[found], local[found]]
+        weight[found] = self.weight[slots[found], local[found]]
+        return tsdf, weight
+
+    def integrate(self, scan, origin=None, pose=None, chunk_size=100000):
+        """Fuse a scan into the volume.
+
+        For each point, the ray from the sensor is sampled every voxel_size
+        within truncation of the point. Each voxel sampled by the scan is
+        updated once, with the mean of its samples and weight 1, so its
+        weight is the number of scans that observed it.
+
+        Parameters
+        ----------
+        scan: PyntCloud or (N, 3) ndarray
+        origin: (3,) array-like, optional
+            Default: None
+            Position of the sensor, in the same frame as the scan points.
+        pose: (4, 4) array-like, optional
+            Default: None
+            Transformation from the sensor frame (where the scan points
+            are given and the sensor is at (0, 0, 0)) to the volume frame.
+            Ignores origin.
+        chunk_size: int, optional
+            Default: 100000
+            Number of points processed at once, to bound memory. It does
+            not change the result.
+        """
+        xyz = scan.xyz if hasattr(scan, "xyz") else np.asarray(scan, dtype=np.float64)
+        if pose is not None:
+            pose = np.asarray(pose, dtype=np.float64)
+            xyz = xyz @ pose[:3, :3].T + pose[:3, 3]
+            origin = pose[:3, 3]
+        elif origin is None:
+            raise ValueError("Either origin or pose must be given")
+        origin = np.asarray(origin, dtype=np.float64)
+
+        # sample the ray every voxel_size inside the truncation band
+        steps = np.arange(-self.truncation, self.truncation + self.voxel_size / 2, self.voxel_size)
+        scan_keys, scan_sums, scan_counts = [], [], []
+        for start in range(0, len(xyz), chunk_size):
+            points = xyz[start:start + chunk_size]
+            rays = points - origin
+            depth = np.linalg.norm(rays, axis=1)
+            valid = depth > 0
+            points, rays, depth = points[valid], rays[valid], depth[valid]
+            rays /= depth[:, None]
+
+            samples = points[:, None, :] + rays[:, None, :] * steps[None, :, None]
+            ijk = np.floor(samples / self.voxel_size).astype(np.int64)
+            # signed distance from the voxel centers to the point, along the ray
+            along = np.einsum("ijk,ik->ij", (ijk + 0.5) * self.voxel_size - origin, rays)
+            sdf = (depth[:, None] - along).ravel()
+            ijk = ijk.reshape(-1, 3)
+            # voxels far behind the surface are not observed
+            observed = sdf >= -self.truncation
+            tsdf = np.clip(sdf[observed] / self.truncation, -1, 1)
+
+            keys, inverse = np.unique(pack_voxels(ijk[observed]), return_inverse=True)
+            scan_keys.append(keys)
+            scan_sums.append(np.bincount(inverse, tsdf))
+            scan_counts.append(np.bincount(inverse))
+
+        if not scan_keys:
+            return
+        # average the samples falling in the same voxel, over all the chunks
+        keys, inverse = np.unique(np.concatenate(scan_keys), return_inverse=True)
+        mean = np.bincount(inverse, np.concatenate(scan_sums)) / np.bincount(inverse, np.concatenate(scan_counts))
+
+        slots, local = self._locate(unpack_voxels(keys), allocate=True)
+        old_tsdf = self.tsdf[slots, local]
+        old_weight = self.weight[slots, local]
+        new_weight = old_weight + 1
+        self.tsdf[slots, local] = (old_tsdf * old_weight + mean) / new_weight
+        self.weight[slots, local] = new_weight
+
+    def get_voxels(self):
+        """Return the observed voxels.
+
+        Returns
+        -------
+        ijk: (M, 3) ndarray of int
+        tsdf, weight: (M,) ndarray
+        """
+        slots, local = np.nonzero(self.weight[:self.n_blocks] > 0)
+        return self._voxels_ijk(slots, local), self.tsdf[slots, local], self.weight[slots, local]
+
+    def extract_points(self):
+        """Return the points where the TSDF crosses zero between adjacent voxels.
+
+        Returns
+        -------
+        points: pd.DataFrame
+            x, y, z columns, suitable for PyntCloud.
+        """
+        ijk, tsdf, weight = self.get_voxels()
+        points = []
+        for axis in range(3):
+            step = np.zeros(3, dtype=np.int64)
+            step[axis] = 1
+            other_tsdf, other_weight = self.get_values(ijk + step)
+            crossing = (other_weight > 0) & ((tsdf >= 0) != (other_tsdf >= 0))
+            crossing &= np.minimum(abs(tsdf), abs(other_tsdf)) < 1
+            t = tsdf[crossing] / (tsdf[crossing] - other_tsdf[crossing])
+            xyz = (ijk[crossing] + 0.5) * self.voxel_size
+            xyz[:, axis] += t * self.voxel_size
+            points.append(xyz)
+        return pd.DataFrame(np.concatenate(points), columns=["x", "y", "z"])
+
+    def extract_mesh(self):
+        """Return a triangle mesh of the zero crossing of the TSDF.
+
+        Uses marching tetrahedra over the cubes formed by the centers of 8
+        observed voxels. Triangles are oriented towards the front of the
+        surface and vertices are shared between adjacent triangles.
+
+        Returns
+        -------
+        points: pd.DataFrame
+            x, y, z columns.
+        mesh: pd.DataFrame
+            v1, v2, v3 columns. Use PyntCloud(points, mesh=mesh).
+        """
+        ijk = self.get_voxels()[0]
+        corners = (ijk[:, None, :] + CUBE_CORNERS[None, :, :]).reshape(-1, 3)
+        values, weight = self.get_values(corners)
+        values = values.reshape(-1, 8)
+        observed = np.all(weight.reshape(-1, 8) > 0, axis=1)
+        crossing = (values.min(1) < 0) & (values.max(1) >= 0) & (np.abs(values).min(1) < 1)
+        cubes = np.flatnonzero(observed & crossing)
+
+        # corners of every tetrahedron of the cubes with a crossing
+        tetra_corners = (cubes[:, None, None] * 8 + CUBE_TETRAHEDRA[None, :, :]).reshape(-1, 4)
+        tetra_values = values.ravel()[tetra_corners]
+        inside = tetra_values < 0
+        n_inside = inside.sum(1)
+        # inside corners first
+        order = np.argsort(~inside, axis=1, kind="mergesort")
+        tetra_corners = np.take_along_axis(tetra_corners, order, axis=1)
+
+        # edges of each triangle as pairs of positions in tetra_corners
+        one = n_inside == 1
+        three = n_inside == 3
+        two = n_inside == 2
+        edges = np.concatenate([
+            tetra_corners[one][:, [[0, 1], [0, 2], [0, 3]]],
+            tetra_corners[three][:, [[3, 0], [3, 1], [3, 2]]],
+            tetra_corners[two][:, [[0, 2], [0, 3], [1, 3]]],
+            tetra_corners[two][:, [[0, 2], [1, 3], [1, 2]]]])
+
+        # a vertex per edge of the voxel grid crossing zero
+        corner_keys = pack_voxels(corners)
+        edge_keys = np.sort(corner_keys[edges.reshape(-1, 2)], axis=1)
+        order = np.lexsort(edge_keys.T[::-1])
+        edge_keys = edge_keys[order]
+        is_first = np.r_[True, np.any(edge_keys[1:] != edge_keys[:-1], axis=1)]
+        vertex = np.empty(len(order), dtype=np.int64)
+        vertex[order] = np.cumsum(is_first) - 1
+        a, b = edges.reshape(-1, 2)[order[is_first]].T
+        value_a = values.ravel()[a]
+        value_b = values.ravel()[b]
+        t = (value_a / (value_a - value_b))[:, None]
+        xyz = ((corners[a] + 0.5) + t * (corners[b] - corners[a])) * self.voxel_size
+
+        faces = vertex.reshape(-1, 3)
+        # orient towards the outside (positive) corners
+        tetra_ijk = corners[tetra_corners].astype(np.float64)
+        outwards = tetra_ijk[:, 2:].mean(1) - tetra_ijk[:, :2].mean(1)
+        outwards[one] = tetra_ijk[one][:, 1:].mean(1) - tetra_ijk[one][:, 0]
+        outwards[three] = tetra_ijk[three][:, 3] - tetra_ijk[three][:, :3].mean(1)
+        direction = np.concatenate([outwards[one], outwards[three], outwards[two], outwards[two]])
+        v1, v2, v3 = xyz[faces[:, 0]], xyz[faces[:, 1]], xyz[faces[:, 2]]
+        flip = np.einsum("ij,ij->i", np.cross(v2 - v1, v3 - v1), direction) < 0
+        faces[flip] = faces[flip][:, [0, 2, 1]]
+
+        points = pd.DataFrame(xyz, columns=["x", "y", "z"])
+        mesh = pd.DataFrame(faces, columns=["v1", "v2", "v3"])
+        return points, mesh
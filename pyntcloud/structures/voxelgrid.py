@@ -1,3 +1,6 @@
+from copy import copy
+from io import BytesIO
+
 import numpy as np
 
 try:
@@ -6,22 +9,115 @@ try:
 except ImportError:
     is_matplotlib_avaliable = False
 
+from scipy.ndimage import maximum_filter1d
+from scipy.sparse import coo_matrix
 from scipy.spatial import cKDTree
 
 from .base import Structure
 from ..plot import plot_voxelgrid
 from ..utils.array import cartesian
 
-try:
-    from ..utils.numba import groupby_max, groupby_count, groupby_sum
-    is_numba_avaliable = True
-except ImportError:
-    is_numba_avaliable = False
+MEAN_MODES = {"x_mean": 0, "y_mean": 1, "z_mean": 2}
+MAX_MODES = {"x_max": 0, "y_max": 1, "z_max": 2}
+
+
+def query_voxelgrid(points, segments, x_y_z, clip=True):
+    """Find the voxel where each point lies.
+
+    Parameters
+    ----------
+    points: (N, 3) ndarray
+    segments: list of 3 ndarray
+        Edges of the voxels along each axis, as in VoxelGrid.segments.
+    x_y_z: list of 3 int
+        Number of voxels along each axis.
+    clip: bool, optional
+        Default: True
+        If True, points outside the grid are assigned to the closest voxel
+        along each axis. If False, they get -1.
+
+    Returns
+    -------
+    voxel_n: (N,) ndarray of int
+        Index of the voxel in the 3D array of voxels using 'C' order.
+    """
+    voxel_xyz = []
+    outside = np.zeros(len(points), dtype=bool)
+    for i in range(3):
+        voxel = np.searchsorted(segments[i], points[:, i]) - 1
+        if not clip:
+            outside |= (points[:, i] < segments[i][0]) | (points[:, i] > segments[i][-1])
+        # points on the first edge fall in the first voxel
+        voxel_xyz.append(np.clip(voxel, 0, x_y_z[i] - 1))
+    voxel_n = np.ravel_multi_index(voxel_xyz, x_y_z)
+    if not clip:
+        voxel_n[outside] = -1
+    return voxel_n
+
+
+class VoxelGridSpec(object):
+    """Geometry of a VoxelGrid, without the points it was built from.
+
+    Use it to voxelize new points against a fixed reference grid.
+    """
+
+    def __init__(self, segments, x_y_z):
+        """
+        Parameters
+        ----------
+        segments: list of 3 ndarray
+            Edges of the voxels along each axis, as in VoxelGrid.segments.
+        x_y_z: list of 3 int
+            Number of voxels along each axis.
+        """
+        self.segments = [np.asarray(x, dtype=np.float64) for x in segments]
+        self.x_y_z = [int(x) for x in x_y_z]
+
+    @property
+    def n_voxels(self):
+        return self.x_y_z[0] * self.x_y_z[1] * self.x_y_z[2]
+
+    def query(self, points, clip=True):
+        """Return the voxel_n of each point. See query_voxelgrid."""
+        return query_voxelgrid(points, self.segments, self.x_y_z, clip=clip)
+
+    def to_bytes(self):
+        buffer = BytesIO()
+        np.savez(
+            buffer,
+            segments_x=self.segments[0],
+            segments_y=self.segments[1],
+            segments_z=self.segments[2],
+            x_y_z=np.array(self.x_y_z, dtype=np.int64))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(BytesIO(data), allow_pickle=False) as f:
+            return cls([f["segments_x"], f["segments_y"], f["segments_z"]], f["x_y_z"])
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls.from_bytes(f.read())
 
 
 class VoxelGrid(Structure):
 
-    def __init__(self, *, points, n_x=1, n_y=1, n_z=1, size_x=None, size_y=None, size_z=None, regular_bounding_box=True):
+    #: ndarray attributes placed in shared memory by PyntCloud.to_shared
+    #: and memory-mapped when loaded from a structures cache. None ones are skipped
+    SHARED_ARRAYS = ["voxel_x", "voxel_y", "voxel_z", "voxel_n", "voxel_centers",
+                     "voxel_occupied", "voxel_inverse"]
+
+    #: subset keeps the bounding box of the original points
+    derives_exactly = False
+
+    def __init__(self, *, points, n_x=1, n_y=1, n_z=1, size_x=None, size_y=None, size_z=None, regular_bounding_box=True,
+                 sparse=False):
         """Grid of voxels with support for different build methods.
 
         Parameters
@@ -39,11 +135,27 @@ class VoxelGrid(Structure):
             Default: True
             If True, the bounding box of the point cloud will be adjusted
             in order to have all the dimensions of equal length.
+        sparse : bool, optional
+            Default: False
+            If True, only the occupied voxels are stored, so memory scales with
+            them instead of with n_x * n_y * n_z:
+            voxel_centers is not computed (see get_voxel_centers), voxel_occupied
+            holds the sorted unique voxel_n, voxel_inverse maps each point to
+            its position in voxel_occupied, and get_feature_vector returns
+            a scipy.sparse.coo_matrix.
         """
         super().__init__(points=points)
         self.x_y_z = [n_x, n_y, n_z]
         self.sizes = [size_x, size_y, size_z]
         self.regular_bounding_box = regular_bounding_box
+        self.sparse = sparse
+        self._occupancy = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # rebuilt on demand
+        state["_occupancy"] = None
+        return state
 
     def compute(self):
         """ABC API."""
@@ -81,6 +193,8 @@ class VoxelGrid(Structure):
         self.n_voxels = self.x_y_z[0] * self.x_y_z[1] * self.x_y_z[2]
 
         self.id = "V({},{},{})".format(self.x_y_z, self.sizes, self.regular_bounding_box)
+        if self.sparse:
+            self.id = self.id[:-1] + ",sparse)"
 
         # find where each point lies in corresponding segmented axis
         # -1 so index are 0-based; clip for edge cases
@@ -89,25 +203,63 @@ class VoxelGrid(Structure):
         self.voxel_z = np.clip(np.searchsorted(self.segments[2], self._points[:, 2]) - 1, 0,  self.x_y_z[2])
         self.voxel_n = np.ravel_multi_index([self.voxel_x, self.voxel_y, self.voxel_z], self.x_y_z)
 
-        # compute center of each voxel
-        midsegments = [(self.segments[i][1:] + self.segments[i][:-1]) / 2 for i in range(3)]
-        self.voxel_centers = cartesian(midsegments).astype(np.float32)
+        if self.sparse:
+            self.voxel_centers = None
+            self.voxel_occupied, self.voxel_inverse = np.unique(self.voxel_n, return_inverse=True)
+        else:
+            # compute center of each voxel
+            midsegments = [(self.segments[i][1:] + self.segments[i][:-1]) / 2 for i in range(3)]
+            self.voxel_centers = cartesian(midsegments).astype(np.float32)
+            self.voxel_occupied = None
+            self.voxel_inverse = None
+
+    def subset(self, points, boolean_array):
+        """Reuse the grid geometry and keep the voxel indices of the kept points."""
+        voxelgrid = copy(self)
+        voxelgrid._points = points
+        voxelgrid.voxel_x = self.voxel_x[boolean_array]
+        voxelgrid.voxel_y = self.voxel_y[boolean_array]
+        voxelgrid.voxel_z = self.voxel_z[boolean_array]
+        voxelgrid.voxel_n = self.voxel_n[boolean_array]
+        if self.sparse:
+            voxelgrid.voxel_occupied, voxelgrid.voxel_inverse = np.unique(voxelgrid.voxel_n, return_inverse=True)
+        voxelgrid._occupancy = None
+        return voxelgrid
+
+    def get_voxel_centers(self, voxels=None):
+        """Compute the center of the given voxels.
+
+        Parameters
+        ----------
+        voxels: (M,) ndarray of int, optional
+            Default: None
+            Indices (as in voxel_n) of the voxels. If None, the occupied voxels
+            in ascending order.
 
-    def query(self, points):
+        Returns
+        -------
+        centers: (M, 3) ndarray, dtype float32
+        """
+        if voxels is None:
+            voxels = self.voxel_occupied if self.sparse else np.unique(self.voxel_n)
+        voxels = np.asarray(voxels)
+        if self.voxel_centers is not None:
+            return self.voxel_centers[voxels]
+        ijk = np.unravel_index(voxels, self.x_y_z)
+        return np.column_stack([
+            (self.segments[i][ijk[i]] + self.segments[i][ijk[i] + 1]) / 2 for i in range(3)
+        ]).astype(np.float32)
+
+    def query(self, points, clip=True):
         """ABC API. Query structure.
 
-        TODO Make query_voxelgrid an independent function, and add a light
-        save mode where only segments and x_y_z are saved.
+        See query_voxelgrid. Use get_spec to query without keeping the grid.
         """
-        voxel_x = np.clip(np.searchsorted(
-            self.segments[0], points[:, 0]) - 1, 0, self.x_y_z[0])
-        voxel_y = np.clip(np.searchsorted(
-            self.segments[1], points[:, 1]) - 1, 0, self.x_y_z[1])
-        voxel_z = np.clip(np.searchsorted(
-            self.segments[2], points[:, 2]) - 1, 0, self.x_y_z[2])
-        voxel_n = np.ravel_multi_index([voxel_x, voxel_y, voxel_z], self.x_y_z)
+        return query_voxelgrid(points, self.segments, self.x_y_z, clip=clip)
 
-        return voxel_n
+    def get_spec(self):
+        """Return a VoxelGridSpec with the geometry of this grid."""
+        return VoxelGridSpec(self.segments, self.x_y_z)
 
     def get_feature_vector(self, mode="binary"):
         """Return a vector of size self.n_voxels. See mode options below.
@@ -121,6 +273,8 @@ class VoxelGrid(Structure):
         -------
         feature_vector: [n_x, n_y, n_z] ndarray
             See Notes.
+            If the grid is sparse, a (1, n_voxels) scipy.sparse.coo_matrix
+            with values only for the occupied voxels, with column = voxel_n.
 
         Notes
         -----
@@ -135,7 +289,9 @@ class VoxelGrid(Structure):
         TDF
             Truncated Distance Function. Value between 0 and 1 indicating the distance
             between the voxel's center and the closest point. 1 on the surface,
-            0 on voxels further than 2 * voxel side.
+            0 on voxels further than 2 * voxel side (the longest side if voxels
+            are not cubic). Only voxels within that distance of an occupied
+            voxel are queried.
 
         x_max, y_max, z_max
             Maximum coordinate value of points inside each voxel.
@@ -143,83 +299,225 @@ class VoxelGrid(Structure):
         x_mean, y_mean, z_mean
             Mean coordinate value of points inside each voxel.
         """
-        vector = np.zeros(self.n_voxels)
-
-        if mode == "binary":
-            vector[np.unique(self.voxel_n)] = 1
-
-        elif mode == "density":
-            count = np.bincount(self.voxel_n)
-            vector[:len(count)] = count
-            vector /= len(self.voxel_n)
-
-        elif mode == "TDF":
-            # truncation = np.linalg.norm(self.shape)
-            kdt = cKDTree(self._points)
-            vector, i = kdt.query(self.voxel_centers, n_jobs=-1)
-
-        elif mode.endswith("_max"):
-            if not is_numba_avaliable:
-                raise ImportError("numba is required to compute {}".format(mode))
-            axis = {"x_max": 0, "y_max": 1, "z_max": 2}
-            vector = groupby_max(self._points, self.voxel_n, axis[mode], vector)
-
-        elif mode.endswith("_mean"):
-            if not is_numba_avaliable:
-                raise ImportError("numba is required to compute {}".format(mode))
-            axis = {"x_mean": 0, "y_mean": 1, "z_mean": 2}
-            voxel_sum = groupby_sum(self._points, self.voxel_n, axis[mode], np.zeros(self.n_voxels))
-            voxel_count = groupby_count(self._points, self.voxel_n, np.zeros(self.n_voxels))
-            vector = np.nan_to_num(voxel_sum / voxel_count)
+        if self.sparse:
+            if mode == "TDF":
+                voxels, values = self._compute_tdf()
+            else:
+                voxels = self.voxel_occupied
+                values = self._compute_channels([mode], self.voxel_inverse, len(voxels))[0]
+            return coo_matrix(
+                (values, (np.zeros(len(values), dtype=np.int64), voxels)),
+                shape=(1, self.n_voxels))
+
+        if mode == "TDF":
+            vector = np.zeros(self.n_voxels)
+            voxels, values = self._compute_tdf()
+            vector[voxels] = values
+            return vector.reshape(self.x_y_z)
+
+        return self.get_feature_vectors([mode])[0]
+
+    def get_feature_vectors(self, modes=["binary"]):
+        """Compute several feature vectors at once, stacked as channels.
+
+        Intermediate results (point counts, points sorted by voxel) are
+        shared between the modes.
+
+        Parameters
+        ----------
+        modes: list of str
+            Default: ["binary"]
+            See get_feature_vector.
+
+        Returns
+        -------
+        feature_vectors: (len(modes), n_x, n_y, n_z) ndarray
+            Dense, even if the grid is sparse.
+        """
+        vectors = np.zeros((len(modes), self.n_voxels))
+        others = [i for i, mode in enumerate(modes) if mode != "TDF"]
+        if others:
+            vectors[others] = self._compute_channels([modes[i] for i in others], self.voxel_n, self.n_voxels)
+        tdf = [i for i, mode in enumerate(modes) if mode == "TDF"]
+        if tdf:
+            # get_feature_vector("TDF") is a coo_matrix in sparse grids
+            voxels, values = self._compute_tdf()
+            vectors[np.ix_(tdf, voxels)] = values
+        return vectors.reshape([len(modes)] + list(self.x_y_z))
+
+    def _compute_tdf(self, chunk_size=1000000):
+        """Compute the truncated distance function inside the truncation band.
+
+        Parameters
+        ----------
+        chunk_size: int, optional
+            Default: 1000000
+            Number of candidate voxels (occupied voxels times neighbors
+            within reach) generated at once, to bound memory in sparse grids.
 
+        Returns
+        -------
+        voxels: (M,) ndarray of int
+            Voxels with TDF greater than 0, in ascending order.
+        values: (M,) ndarray
+        """
+        truncation = 2 * max(self.shape)
+        # a point inside voxel v is closer than truncation to the center of
+        # voxel c only if |c - v| <= truncation / side + 1/2 along each axis
+        reach = np.ceil(truncation / np.array(self.shape) + 0.5).astype(np.int64)
+
+        if self.sparse:
+            offsets = cartesian([np.arange(-r, r + 1) for r in reach])
+            candidates = []
+            step = max(1, chunk_size // len(offsets))
+            for start in range(0, len(self.voxel_occupied), step):
+                ijk = np.column_stack(np.unravel_index(self.voxel_occupied[start:start + step], self.x_y_z))
+                ijk = (ijk[:, None, :] + offsets[None, :, :]).reshape(-1, 3)
+                ijk = ijk[np.all((ijk >= 0) & (ijk < self.x_y_z), axis=1)]
+                candidates.append(np.unique(np.ravel_multi_index(ijk.T, self.x_y_z)))
+            voxels = np.unique(np.concatenate(candidates)) if candidates else np.array([], dtype=np.int64)
         else:
-            raise NotImplementedError("{} is not a supported feature vector mode".format(mode))
+            band = np.zeros(self.n_voxels, dtype=np.uint8)
+            band[self.voxel_n] = 1
+            band = band.reshape(self.x_y_z)
+            for axis in range(3):
+                band = maximum_filter1d(band, size=2 * reach[axis] + 1, axis=axis, mode="constant")
+            voxels = np.flatnonzero(band)
 
-        return vector.reshape(self.x_y_z)
+        kdt = cKDTree(self._points)
+        distances, i = kdt.query(
+            self.get_voxel_centers(voxels), distance_upper_bound=truncation, workers=-1)
+        values = np.clip(1 - distances / truncation, 0, 1)
 
-    def get_voxel_neighbors(self, voxel):
-        """Get valid, non-empty 26 neighbors of voxel.
+        inside = values > 0
+        return voxels[inside], values[inside]
+
+    def _compute_channels(self, modes, index, n):
+        """Compute the value of each mode for each of the n groups of points given by index.
+
+        Empty groups get 0 in every mode.
+        """
+        count = np.bincount(index, minlength=n)
+        order = None
+
+        channels = []
+        for mode in modes:
+            if mode == "binary":
+                values = (count > 0).astype(np.float64)
+
+            elif mode == "density":
+                values = count / len(index)
+
+            elif mode in MEAN_MODES:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    values = np.bincount(index, self._points[:, MEAN_MODES[mode]], n) / count
+                values[count == 0] = 0
+
+            elif mode in MAX_MODES:
+                if order is None:
+                    # sort once, shared by all the max modes
+                    order = np.argsort(index, kind="mergesort")
+                    sorted_index = index[order]
+                    starts = np.flatnonzero(np.r_[True, sorted_index[1:] != sorted_index[:-1]])
+                    groups = sorted_index[starts]
+                values = np.zeros(n)
+                if len(order):
+                    values[groups] = np.maximum.reduceat(self._points[order, MAX_MODES[mode]], starts)
+
+            else:
+                raise NotImplementedError("{} is not a supported feature vector mode".format(mode))
+
+            channels.append(values)
+
+        return channels
+
+    def is_occupied(self, voxels):
+        """Check which voxels contain at least one point.
+
+        The occupancy index (a bitmap over all voxels, or the sorted occupied
+        voxels if the grid is sparse) is built on the first call.
 
         Parameters
         ----------
-        voxel: int in self.set_voxel_n
+        voxels: (M,) ndarray of int
+            Indices (as in voxel_n) of the voxels.
 
         Returns
         -------
-        neighbors: list of int
-            Indices of the valid, non-empty 26 neighborhood around voxel.
+        occupied: (M,) ndarray, dtype bool
         """
+        voxels = np.asarray(voxels)
+        if self._occupancy is None:
+            if self.sparse:
+                self._occupancy = self.voxel_occupied
+            else:
+                self._occupancy = np.zeros(self.n_voxels, dtype=bool)
+                self._occupancy[self.voxel_n] = True
+
+        if self.sparse:
+            if len(self._occupancy) == 0:
+                return np.zeros(voxels.shape, dtype=bool)
+            position = np.minimum(np.searchsorted(self._occupancy, voxels), len(self._occupancy) - 1)
+            return self._occupancy[position] == voxels
+        return self._occupancy[voxels]
+
+    def get_voxel_neighbors_batch(self, voxels, connectivity=26):
+        """Get the valid, non-empty neighbors of many voxels at once.
 
-        x, y, z = np.unravel_index(voxel, self.x_y_z)
+        Parameters
+        ----------
+        voxels: (M,) ndarray of int
+            Indices (as in voxel_n) of the voxels.
+        connectivity: int in [6, 18, 26], optional
+            Default: 26
+            Neighbors sharing a face (6), a face or an edge (18), or a face,
+            an edge or a corner (26).
 
-        valid_x = []
-        valid_y = []
-        valid_z = []
-        if x - 1 >= 0:
-            valid_x.append(x - 1)
-        if y - 1 >= 0:
-            valid_y.append(y - 1)
-        if z - 1 >= 0:
-            valid_z.append(z - 1)
+        Returns
+        -------
+        neighbors: (M, connectivity) ndarray of int
+            neighbors[i] holds the indices of the non-empty neighbors of
+            voxels[i], padded with -1. The voxel itself is not included.
+        """
+        offsets = cartesian(([-1, 0, 1], [-1, 0, 1], [-1, 0, 1]))
+        distance = np.abs(offsets).sum(1)
+        if connectivity == 6:
+            offsets = offsets[distance == 1]
+        elif connectivity == 18:
+            offsets = offsets[(distance == 1) | (distance == 2)]
+        elif connectivity == 26:
+            offsets = offsets[distance > 0]
+        else:
+            raise ValueError("connectivity must be 6, 18 or 26")
 
-        valid_x.append(x)
-        valid_y.append(y)
-        valid_z.append(z)
+        voxels = np.asarray(voxels, dtype=np.int64)
+        ijk = np.column_stack(np.unravel_index(voxels, self.x_y_z))
+        candidates = ijk[:, None, :] + offsets[None, :, :]
+        valid = np.all((candidates >= 0) & (candidates < self.x_y_z), axis=2)
 
-        if x + 1 < self.x_y_z[0]:
-            valid_x.append(x + 1)
-        if y + 1 < self.x_y_z[1]:
-            valid_y.append(y + 1)
-        if z + 1 < self.x_y_z[2]:
-            valid_z.append(z + 1)
+        neighbors = np.full(valid.shape, -1, dtype=np.int64)
+        neighbors[valid] = np.ravel_multi_index(candidates[valid].T, self.x_y_z)
+        neighbors[valid] = np.where(self.is_occupied(neighbors[valid]), neighbors[valid], -1)
+        return neighbors
 
-        valid_neighbor_indices = cartesian((valid_x, valid_y, valid_z))
+    def get_voxel_neighbors(self, voxel):
+        """Get valid, non-empty 26 neighbors of voxel.
 
-        ravel_indices = np.ravel_multi_index((valid_neighbor_indices[:, 0],
-                                              valid_neighbor_indices[:, 1],
-                                              valid_neighbor_indices[:, 2]), self.x_y_z)
+        Parameters
+        ----------
+        voxel: int in self.set_voxel_n
 
-        return [x for x in ravel_indices if x in np.unique(self.voxel_n)]
+        Returns
+        -------
+        neighbors: list of int
+            Indices of the valid, non-empty 26 neighborhood around voxel.
+            The voxel itself is included if it is not empty.
+        """
+        neighbors = self.get_voxel_neighbors_batch([voxel])[0]
+        neighbors = neighbors[neighbors >= 0]
+        if self.is_occupied([voxel])[0]:
+            neighbors = np.append(neighbors, voxel)
+        return sorted(neighbors)
 
     def plot(self,
              d=2,
@@ -229,6 +527,8 @@ class VoxelGrid(Structure):
              output_name=None,
              width=800,
              height=500):
+        if self.sparse:
+            raise ValueError("Sparse VoxelGrids can't be plotted")
         feature_vector = self.get_feature_vector(mode)
 
         if d == 2:
@@ -0,0 +1,198 @@
+import numpy as np
+
+from scipy.sparse import coo_matrix
+
+from .base import Structure
+from .octree import MAX_LEVEL, morton_decode, morton_encode
+from .voxelgrid import MAX_MODES, MEAN_MODES
+
+
+class VoxelPyramid(Structure):
+
+    def __init__(self, *, points, max_level=6):
+        """Voxel grids of 2 ** level voxels per axis, for every level up to max_level.
+
+        Parameters
+        ----------
+        points: (N, 3) numpy.array
+        max_level: int, optional
+            Default: 6
+            The finest grid has 2 ** max_level voxels per axis. At most 21.
+
+        Notes
+        -----
+        The voxel of each point is found once, at max_level, as a Morton key
+        of its integer coordinates. The key of the voxel at any coarser level
+        is obtained by a bit shift, and as the occupied voxels are sorted by
+        key, the voxels merged at each level are contiguous. So the occupied
+        voxels and per-voxel values of every level are derived from those of
+        max_level, in O(occupied voxels) instead of O(points).
+
+        The bounding box is adjusted to have all sides of equal length, so
+        each level is equivalent to a VoxelGrid with n_x = n_y = n_z =
+        2 ** level and regular_bounding_box=True.
+        """
+        super().__init__(points=points)
+        if not 0 < max_level <= MAX_LEVEL:
+            raise ValueError("max_level must be between 1 and {}".format(MAX_LEVEL))
+        self.max_level = max_level
+
+    def compute(self):
+        """ABC API."""
+        xyzmin = self._points.min(0)
+        xyzmax = self._points.max(0)
+        #: adjust to obtain a minimum bounding box with all sides of equal length
+        margin = max(xyzmax - xyzmin) - (xyzmax - xyzmin)
+        self.xyzmin = xyzmin - margin / 2
+        self.xyzmax = xyzmax + margin / 2
+        self.id = "VP({})".format(self.max_level)
+
+        side = max(self.xyzmax - self.xyzmin)
+        #: side of the voxels at each level, starting at level 0
+        self.sizes = side / 2 ** np.arange(self.max_level + 1)
+
+        n_cells = 2 ** self.max_level
+        if side > 0:
+            ijk = np.floor((self._points - self.xyzmin) / self.sizes[-1]).astype(np.int64)
+        else:
+            ijk = np.zeros(self._points.shape, dtype=np.int64)
+        np.clip(ijk, 0, n_cells - 1, out=ijk)
+
+        keys = morton_encode(ijk)
+        #: points sorted by voxel
+        self.order = np.argsort(keys, kind="mergesort")
+        sorted_keys = keys[self.order]
+        self.starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        #: Morton keys of the occupied voxels at max_level, in ascending order
+        self.keys = sorted_keys[self.starts]
+        self.counts = np.diff(np.r_[self.starts, len(keys)])
+        #: position in self.keys of the voxel of each point
+        self.inverse = np.empty(len(keys), dtype=np.int64)
+        self.inverse[self.order] = np.repeat(np.arange(len(self.keys)), self.counts)
+
+    def _check_level(self, level):
+        if not 0 <= level <= self.max_level:
+            raise ValueError("level must be between 0 and {}".format(self.max_level))
+
+    def get_shape(self, level):
+        """Return the number of voxels along each axis at the given level."""
+        self._check_level(level)
+        return [2 ** level] * 3
+
+    def _groups(self, level):
+        """Group the occupied voxels of max_level by their voxel at level.
+
+        Returns
+        -------
+        keys: (M,) ndarray of uint64
+            Morton keys of the occupied voxels at level, in ascending order.
+        first: (M,) ndarray of int
+            Position in self.keys of the first voxel of max_level inside
+            each of them.
+        """
+        self._check_level(level)
+        keys = self.keys >> np.uint64(3 * (self.max_level - level))
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        return keys[first], first
+
+    def get_occupied(self, level):
+        """Return the occupied voxels at the given level.
+
+        Returns
+        -------
+        voxels: (M,) ndarray of int
+            Indices of the voxels in the 3D array of voxels using 'C' order,
+            as VoxelGrid.voxel_n. Sorted by Morton key, not by index.
+        counts: (M,) ndarray of int
+            Number of points inside each voxel.
+        """
+        keys, first = self._groups(level)
+        voxels = np.ravel_multi_index(morton_decode(keys).T, self.get_shape(level))
+        return voxels, np.add.reduceat(self.counts, first)
+
+    def get_voxel_map(self, level):
+        """Return the position in get_occupied(level) of each occupied voxel of max_level."""
+        keys, first = self._groups(level)
+        is_first = np.zeros(len(self.keys), dtype=bool)
+        is_first[first] = True
+        return np.cumsum(is_first) - 1
+
+    def get_voxel_n(self, level):
+        """Return the voxel of each point at the given level, as VoxelGrid.voxel_n.
+
+        The voxels are derived for the occupied voxels and then gathered
+        for the points, without looking at the coordinates again.
+        """
+        voxels, counts = self.get_occupied(level)
+        return voxels[self.get_voxel_map(level)][self.inverse]
+
+    def get_voxel_centers(self, level, voxels=None):
+        """Compute the center of the given voxels at the given level.
+
+        Parameters
+        ----------
+        level: int
+        voxels: (M,) ndarray of int, optional
+            Default: None
+            Indices of the voxels, as in get_occupied. If None, the occupied
+            voxels, in the order of get_occupied.
+
+        Returns
+        -------
+        centers: (M, 3) ndarray
+        """
+        if voxels is None:
+            voxels = self.get_occupied(level)[0]
+        ijk = np.column_stack(np.unravel_index(np.asarray(voxels), self.get_shape(level)))
+        return self.xyzmin + (ijk + 0.5) * self.sizes[level]
+
+    def get_feature_vector(self, level, mode="binary", sparse=False):
+        """Return the feature vector of the grid at the given level.
+
+        Parameters
+        ----------
+        level: int
+        mode: str, optional
+            Default: "binary"
+            One of the modes of VoxelGrid.get_feature_vector, except TDF.
+        sparse: bool, optional
+            Default: False
+            If True, return a (1, n_voxels) scipy.sparse.coo_matrix with
+            values only for the occupied voxels, with column = voxel index.
+
+        Returns
+        -------
+        feature_vector: (2 ** level, 2 ** level, 2 ** level) ndarray
+        """
+        keys, first = self._groups(level)
+        counts = np.add.reduceat(self.counts, first)
+
+        if mode == "binary":
+            values = np.ones(len(keys))
+
+        elif mode == "density":
+            values = counts / len(self._points)
+
+        elif mode in MEAN_MODES:
+            if getattr(self, "_sums", None) is None:
+                self._sums = np.add.reduceat(self._points[self.order], self.starts, axis=0)
+            values = np.add.reduceat(self._sums[:, MEAN_MODES[mode]], first) / counts
+
+        elif mode in MAX_MODES:
+            if getattr(self, "_maxs", None) is None:
+                self._maxs = np.maximum.reduceat(self._points[self.order], self.starts, axis=0)
+            values = np.maximum.reduceat(self._maxs[:, MAX_MODES[mode]], first)
+
+        else:
+            raise NotImplementedError("{} is not a supported feature vector mode".format(mode))
+
+        shape = self.get_shape(level)
+        voxels = np.ravel_multi_index(morton_decode(keys).T, shape)
+        if sparse:
+            return coo_matrix(
+                (values, (np.zeros(len(values), dtype=np.int64), voxels)),
+                shape=(1, int(np.prod(shape))))
+
+        vector = np.zeros(int(np.prod(shape)))
+        vector[voxels] = values
+        return vector.reshape(shape)
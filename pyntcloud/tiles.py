@@ -0,0 +1,310 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from scipy.stats import zscore
+
+from .core_class import PyntCloud
+from .filters import ALL_FILTERS
+from .scalar_fields import ALL_SF
+
+#: scalar fields whose value for one point depends on points far away from it
+NON_LOCAL_SF = [
+    "custom_fit",
+    "euclidean_clusters",
+    "plane_fit",
+    "sphere_fit",
+    "voxel_n",
+    "voxel_x",
+    "voxel_y",
+    "voxel_z"
+]
+
+KDTREE_FILTERS = ["ROR", "SOR"]
+
+
+def _neighborhood_is_complete(xyz, radius, box_min, box_max, bounds_min, bounds_max):
+    """Check that the sphere of given radius around each point lies inside the box.
+
+    Box sides that reach the bounds of the whole cloud are not checked,
+    as there are no points beyond them.
+    """
+    box_min = np.where(box_min <= bounds_min, -np.inf, box_min)
+    box_max = np.where(box_max >= bounds_max, np.inf, box_max)
+    radius = radius[:, None]
+    return bool(np.all(xyz - radius >= box_min) and np.all(xyz + radius <= box_max))
+
+
+def _process_tile(job):
+    """Run one operation over the points of one tile (core + halo).
+
+    Returns None if the halo is not big enough to compute the exact result
+    for the core points. Otherwise, the result for the core points.
+    """
+    points, n_core, box_min, box_max, bounds_min, bounds_max, method, name, kwargs = job
+
+    cloud = PyntCloud(points)
+    kwargs = dict(kwargs)
+    radius = None
+
+    covers_cloud = np.all(box_min <= bounds_min) and np.all(box_max >= bounds_max)
+
+    if method == "add_scalar_field" and "k_neighbors" in kwargs:
+        if len(cloud.xyz) <= kwargs["k_neighbors"] and not covers_cloud:
+            return None
+        k_neighbors = cloud.get_neighbors(k=kwargs["k_neighbors"])
+        core = cloud.xyz[:n_core]
+        radius = np.linalg.norm(cloud.xyz[k_neighbors[:n_core]] - core[:, None], axis=2).max(1)
+        kwargs["k_neighbors"] = k_neighbors
+
+    elif method == "get_filter" and name in KDTREE_FILTERS:
+        kwargs["kdtree_id"] = cloud.add_structure("kdtree")
+        kdtree = cloud.structures[kwargs["kdtree_id"]]
+        distances = kdtree.query(cloud.xyz, k=kwargs["k"])[0]
+        radius = distances[:n_core, -1]
+
+    if radius is not None and not _neighborhood_is_complete(
+            cloud.xyz[:n_core], radius, box_min, box_max, bounds_min, bounds_max):
+        return None
+
+    if method == "add_scalar_field":
+        added = cloud.add_scalar_field(name, **kwargs)
+        added = added if isinstance(added, list) else [added]
+        return OrderedDict((x, cloud.points[x].values[:n_core]) for x in added)
+
+    if name == "SOR":
+        # the z score is computed over the whole cloud after stitching
+        return np.mean(distances[:n_core], axis=1)
+
+    return cloud.get_filter(name, **kwargs)[:n_core]
+
+
+class TiledPyntCloud(object):
+    """Process a point cloud by spatial tiles with halo overlap.
+
+    The cloud is partitioned into cubic tiles. Each tile is processed
+    independently (in a pool of processes) together with the points lying
+    within `halo` distance of it, so neighborhood based operations see the
+    same neighbors as in the whole cloud. The results of the halo points are
+    discarded and the results of each tile are stitched back.
+
+    If the halo of a tile is not big enough for some of its points (i.e. the
+    neighborhood of a point reaches beyond the halo) the tile is processed
+    again with a doubled halo, so per point results are the same as
+    computing over the whole cloud in memory.
+    """
+
+    def __init__(self, points, tile_size, halo, n_jobs=None):
+        """
+        Parameters
+        ----------
+        points: pd.DataFrame, PyntCloud, structured ndarray or str
+            The point cloud. Must have x, y and z columns / fields.
+            If str, path to the file to be read. ".npy" files storing a
+            structured array are memory-mapped instead of loaded.
+        tile_size: float or list of 3 float
+            Side of the tiles along each axis.
+        halo: float
+            Distance around each tile from where the extra points will be taken.
+        n_jobs: int, optional
+            Default: None
+            Number of worker processes. If None, the number of processors.
+            If 1, tiles are processed in the current process.
+        """
+        if isinstance(points, str):
+            if points.lower().endswith(".npy"):
+                points = np.load(points, mmap_mode="r")
+            else:
+                points = PyntCloud.from_file(points).points
+        elif isinstance(points, PyntCloud):
+            points = points.points
+
+        self.points = points
+        self.scalar_fields = OrderedDict()
+        self.tile_size = np.broadcast_to(np.asarray(tile_size, dtype=np.float64), (3,))
+        self.halo = halo
+        self.n_jobs = n_jobs
+
+        self._partition()
+
+    @property
+    def columns(self):
+        if isinstance(self.points, pd.DataFrame):
+            columns = list(self.points.columns)
+        else:
+            columns = list(self.points.dtype.names)
+        return columns + [x for x in self.scalar_fields if x not in columns]
+
+    def _get_column(self, name, indices):
+        if name in self.scalar_fields:
+            return self.scalar_fields[name][indices]
+        return np.asarray(self.points[name])[indices]
+
+    def _get_xyz(self, indices):
+        return np.column_stack([self._get_column(x, indices) for x in ["x", "y", "z"]])
+
+    def _partition(self, chunk_size=10000000):
+        n = len(self.points)
+        self.n_points = n
+
+        bounds_min = np.full(3, np.inf)
+        bounds_max = np.full(3, -np.inf)
+        for start in range(0, n, chunk_size):
+            xyz = self._get_xyz(slice(start, start + chunk_size))
+            bounds_min = np.minimum(bounds_min, xyz.min(0))
+            bounds_max = np.maximum(bounds_max, xyz.max(0))
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+        self.n_tiles = (np.floor((bounds_max - bounds_min) / self.tile_size).astype(np.int64) + 1)
+
+        keys = np.empty(n, dtype=np.int64)
+        for start in range(0, n, chunk_size):
+            xyz = self._get_xyz(slice(start, start + chunk_size))
+            ijk = np.floor((xyz - bounds_min) / self.tile_size).astype(np.int64)
+            ijk = np.minimum(ijk, self.n_tiles - 1)
+            keys[start:start + chunk_size] = np.ravel_multi_index(ijk.T, self.n_tiles)
+
+        # stable, so points inside each tile keep their original order
+        self._order = np.argsort(keys, kind="mergesort")
+        self.tiles, self._starts = np.unique(keys[self._order], return_index=True)
+        self._ends = np.append(self._starts[1:], n)
+
+    def _tile_indices(self, t, halo):
+        """Return the indices of the core points and the halo points of the tile t."""
+        key = self.tiles[t]
+        core = self._order[self._starts[t]:self._ends[t]]
+
+        ijk = np.array(np.unravel_index(key, self.n_tiles))
+        box_min = self.bounds_min + ijk * self.tile_size
+        box_max = box_min + self.tile_size
+
+        reach = np.ceil(halo / self.tile_size).astype(np.int64)
+        candidates = []
+        for offset in product(*[range(-r, r + 1) for r in reach]):
+            other = ijk + offset
+            if not np.any(offset) or np.any(other < 0) or np.any(other >= self.n_tiles):
+                continue
+            other_key = np.ravel_multi_index(other, self.n_tiles)
+            other_t = np.searchsorted(self.tiles, other_key)
+            if other_t < len(self.tiles) and self.tiles[other_t] == other_key:
+                candidates.append(self._order[self._starts[other_t]:self._ends[other_t]])
+
+        if candidates:
+            candidates = np.sort(np.concatenate(candidates))
+            xyz = self._get_xyz(candidates)
+            inside = np.all((xyz >= box_min - halo) & (xyz <= box_max + halo), axis=1)
+            halo_points = candidates[inside]
+        else:
+            halo_points = np.array([], dtype=np.int64)
+
+        return core, halo_points, box_min - halo, box_max + halo
+
+    def _job(self, t, halo, method, name, kwargs):
+        core, halo_points, box_min, box_max = self._tile_indices(t, halo)
+        indices = np.concatenate([core, halo_points])
+        points = pd.DataFrame(OrderedDict((x, self._get_column(x, indices)) for x in self.columns))
+        return (points, len(core), box_min, box_max, self.bounds_min, self.bounds_max, method, name, kwargs)
+
+    def _run(self, method, name, kwargs):
+        """Process all the tiles, growing the halo of the tiles where needed."""
+        results = {}
+        halos = {t: self.halo for t in range(len(self.tiles))}
+        pending = list(halos)
+
+        if self.n_jobs == 1:
+            executor = None
+            map_ = map
+        else:
+            executor = ProcessPoolExecutor(max_workers=self.n_jobs)
+            map_ = executor.map
+
+        try:
+            while pending:
+                jobs = (self._job(t, halos[t], method, name, kwargs) for t in pending)
+                retry = []
+                for t, result in zip(pending, map_(_process_tile, jobs)):
+                    if result is None:
+                        halos[t] *= 2
+                        retry.append(t)
+                    else:
+                        results[t] = result
+                pending = retry
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return results
+
+    def add_scalar_field(self, name, **kwargs):
+        """Compute a scalar field by tiles and store it in self.scalar_fields.
+
+        Parameters
+        ----------
+        name: str
+            One of the names in PyntCloud.add_scalar_field that only depend
+            on each point's neighborhood.
+        kwargs
+            Same as in PyntCloud.add_scalar_field, except for:
+
+            k_neighbors: int
+                The number of neighbors, which will be computed for each tile.
+
+        Returns
+        -------
+        sf_added: list of str
+            The name of each of the scalar fields added.
+        """
+        if name not in ALL_SF:
+            raise ValueError("Unsupported scalar field. Check docstring")
+        if name in NON_LOCAL_SF:
+            raise ValueError("{} depends on the whole cloud and can't be computed by tiles".format(name))
+
+        results = self._run("add_scalar_field", name, kwargs)
+
+        sf_added = []
+        for t, result in results.items():
+            core = self._order[self._starts[t]:self._ends[t]]
+            for key, val in result.items():
+                if key not in sf_added:
+                    sf_added.append(key)
+                    self.scalar_fields[key] = np.empty(self.n_points, dtype=val.dtype)
+                self.scalar_fields[key][core] = val
+
+        if len(sf_added) == 1:
+            return sf_added[0]
+        return sf_added
+
+    def get_filter(self, name, **kwargs):
+        """Compute a filter by tiles.
+
+        Parameters
+        ----------
+        name: str
+            One of the names in PyntCloud.get_filter.
+        kwargs
+            Same as in PyntCloud.get_filter. The kdtree_id argument is not
+            used, as a KDTree is built for each tile.
+
+        Returns
+        -------
+        filter: boolean array
+        """
+        if name not in ALL_FILTERS:
+            raise ValueError("Unsupported filter. Check docstring")
+        kwargs.pop("kdtree_id", None)
+
+        results = self._run("get_filter", name, kwargs)
+
+        if name == "SOR":
+            values = np.empty(self.n_points)
+        else:
+            values = np.empty(self.n_points, dtype=bool)
+        for t, result in results.items():
+            values[self._order[self._starts[t]:self._ends[t]]] = result
+
+        if name == "SOR":
+            return abs(zscore(values, ddof=1)) < kwargs["z_max"]
+        return values
@@ -1,23 +1,354 @@
+import numpy as np
 from numba import jit
 
 
-@jit
-def groupby_count(xyz, indices, out):
-    for i in range(xyz.shape[0]):
-        out[indices[i]] += 1
+@jit(nopython=True)
+def ranges_knn(points, queries, starts, ends, distances, indices):
+    """Keep the k nearest points among points[starts[i, j]:ends[i, j]] for each query i.
+
+    distances (squared, initialized to inf) and indices are (n_queries, k),
+    sorted by distance.
+    """
+    k = distances.shape[1]
+    for i in range(queries.shape[0]):
+        for j in range(starts.shape[1]):
+            for p in range(starts[i, j], ends[i, j]):
+                d = 0.0
+                for a in range(3):
+                    diff = queries[i, a] - points[p, a]
+                    d += diff * diff
+                if d >= distances[i, k - 1]:
+                    continue
+                n = k - 1
+                while n > 0 and distances[i, n - 1] > d:
+                    distances[i, n] = distances[i, n - 1]
+                    indices[i, n] = indices[i, n - 1]
+                    n -= 1
+                distances[i, n] = d
+                indices[i, n] = p
+    return distances, indices
+
+
+@jit(nopython=True)
+def ranges_count_within(points, queries, starts, ends, r2, out):
+    for i in range(queries.shape[0]):
+        for j in range(starts.shape[1]):
+            for p in range(starts[i, j], ends[i, j]):
+                d = 0.0
+                for a in range(3):
+                    diff = queries[i, a] - points[p, a]
+                    d += diff * diff
+                if d <= r2:
+                    out[i] += 1
     return out
 
 
-@jit
-def groupby_sum(xyz, indices, N, out):
-    for i in range(xyz.shape[0]):
-        out[indices[i]] += xyz[i][N]
+@jit(nopython=True)
+def ranges_within(points, queries, starts, ends, r2, offsets, out):
+    for i in range(queries.shape[0]):
+        n = offsets[i]
+        for j in range(starts.shape[1]):
+            for p in range(starts[i, j], ends[i, j]):
+                d = 0.0
+                for a in range(3):
+                    diff = queries[i, a] - points[p, a]
+                    d += diff * diff
+                if d <= r2:
+                    out[n] = p
+                    n += 1
     return out
 
 
-@jit
-def groupby_max(xyz, indices, N, out):
-    for i in range(xyz.shape[0]):
-        if xyz[i][N] > out[indices[i]]:
-            out[indices[i]] = xyz[i][N]
+@jit(nopython=True)
+def closest_point_on_segment(p, a, b):
+    """Return the weight t of b (1 - t of a) of the point of the segment ab closest to p, and its squared distance."""
+    abx, aby, abz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    apx, apy, apz = p[0] - a[0], p[1] - a[1], p[2] - a[2]
+    length2 = abx * abx + aby * aby + abz * abz
+    t = 0.0
+    if length2 > 0:
+        t = min(max((abx * apx + aby * apy + abz * apz) / length2, 0.0), 1.0)
+    dx, dy, dz = apx - t * abx, apy - t * aby, apz - t * abz
+    return t, dx * dx + dy * dy + dz * dz
+
+
+@jit(nopython=True)
+def closest_point_on_triangle(p, a, b, c):
+    """Return the barycentric weights (of a, b, c) of the point of the triangle abc closest to p.
+
+    Ericson, Real-Time Collision Detection, 5.1.5. Written with scalars to
+    avoid allocating temporary arrays. For degenerate (zero area)
+    triangles, the closest point of their edges.
+    """
+    abx, aby, abz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    acx, acy, acz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+    nx, ny, nz = aby * acz - abz * acy, abz * acx - abx * acz, abx * acy - aby * acx
+    if nx * nx + ny * ny + nz * nz == 0:
+        t, d2 = closest_point_on_segment(p, a, b)
+        wa, wb, wc = 1 - t, t, 0.0
+        t, d2_bc = closest_point_on_segment(p, b, c)
+        if d2_bc < d2:
+            wa, wb, wc, d2 = 0.0, 1 - t, t, d2_bc
+        t, d2_ca = closest_point_on_segment(p, c, a)
+        if d2_ca < d2:
+            wa, wb, wc = t, 0.0, 1 - t
+        return wa, wb, wc
+    # from here on, every denominator is the squared length of an edge or
+    # of the normal, so it is not 0
+    apx, apy, apz = p[0] - a[0], p[1] - a[1], p[2] - a[2]
+    d1 = abx * apx + aby * apy + abz * apz
+    d2 = acx * apx + acy * apy + acz * apz
+    if d1 <= 0 and d2 <= 0:
+        return 1.0, 0.0, 0.0
+    bpx, bpy, bpz = p[0] - b[0], p[1] - b[1], p[2] - b[2]
+    d3 = abx * bpx + aby * bpy + abz * bpz
+    d4 = acx * bpx + acy * bpy + acz * bpz
+    if d3 >= 0 and d4 <= d3:
+        return 0.0, 1.0, 0.0
+    vc = d1 * d4 - d3 * d2
+    if vc <= 0 and d1 >= 0 and d3 <= 0:
+        v = d1 / (d1 - d3)
+        return 1 - v, v, 0.0
+    cpx, cpy, cpz = p[0] - c[0], p[1] - c[1], p[2] - c[2]
+    d5 = abx * cpx + aby * cpy + abz * cpz
+    d6 = acx * cpx + acy * cpy + acz * cpz
+    if d6 >= 0 and d5 <= d6:
+        return 0.0, 0.0, 1.0
+    vb = d5 * d2 - d1 * d6
+    if vb <= 0 and d2 >= 0 and d6 <= 0:
+        w = d2 / (d2 - d6)
+        return 1 - w, 0.0, w
+    va = d3 * d6 - d5 * d4
+    if va <= 0 and (d4 - d3) >= 0 and (d5 - d6) >= 0:
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        return 0.0, 1 - w, w
+    denom = 1 / (va + vb + vc)
+    v = vb * denom
+    w = vc * denom
+    return 1 - v - w, v, w
+
+
+@jit(nopython=True)
+def _box_distance2(p, box_min, box_max):
+    d2 = 0.0
+    for a in range(3):
+        if p[a] < box_min[a]:
+            d2 += (box_min[a] - p[a]) ** 2
+        elif p[a] > box_max[a]:
+            d2 += (p[a] - box_max[a]) ** 2
+    return d2
+
+
+@jit(nopython=True)
+def bvh_closest_point(node_min, node_max, n_internal, leaf_starts, triangles, queries,
+                      distances, closest_triangle, closest_point):
+    """Find the closest triangle to each query point traversing the BVH depth first, nearest child first."""
+    stack = np.empty(128, dtype=np.int64)
+    for q in range(queries.shape[0]):
+        p = queries[q]
+        best = np.inf
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            if _box_distance2(p, node_min[node], node_max[node]) >= best:
+                continue
+            if node >= n_internal:
+                leaf = node - n_internal
+                for t in range(leaf_starts[leaf], leaf_starts[leaf + 1]):
+                    wa, wb, wc = closest_point_on_triangle(p, triangles[t, 0], triangles[t, 1], triangles[t, 2])
+                    d2 = 0.0
+                    for a in range(3):
+                        x = wa * triangles[t, 0, a] + wb * triangles[t, 1, a] + wc * triangles[t, 2, a]
+                        d2 += (x - p[a]) ** 2
+                    if d2 < best:
+                        best = d2
+                        closest_triangle[q] = t
+                        for a in range(3):
+                            x = wa * triangles[t, 0, a] + wb * triangles[t, 1, a]
+                            closest_point[q, a] = x + wc * triangles[t, 2, a]
+            else:
+                left = 2 * node + 1
+                right = left + 1
+                d_left = _box_distance2(p, node_min[left], node_max[left])
+                d_right = _box_distance2(p, node_min[right], node_max[right])
+                # the nearest child is pushed last, so it is visited first
+                if d_left < d_right:
+                    left, right = right, left
+                    d_left, d_right = d_right, d_left
+                if d_left < best:
+                    stack[top] = left
+                    top += 1
+                if d_right < best:
+                    stack[top] = right
+                    top += 1
+        distances[q] = np.sqrt(best)
+    return distances, closest_triangle, closest_point
+
+
+@jit(nopython=True)
+def _ray_box(origin, inv_direction, box_min, box_max, t_max):
+    """Return the distance along the ray to the box, or inf if the ray misses it before t_max."""
+    t_near = 0.0
+    t_far = t_max
+    for a in range(3):
+        if box_min[a] > box_max[a]:
+            # empty node
+            return np.inf
+        t1 = (box_min[a] - origin[a]) * inv_direction[a]
+        t2 = (box_max[a] - origin[a]) * inv_direction[a]
+        if t1 > t2:
+            t1, t2 = t2, t1
+        # comparisons with nan (origin on the slab, parallel ray) are ignored
+        if t1 > t_near:
+            t_near = t1
+        if t2 < t_far:
+            t_far = t2
+    if t_near > t_far:
+        return np.inf
+    return t_near
+
+
+@jit(nopython=True)
+def bvh_raycast(node_min, node_max, n_internal, leaf_starts, triangles, origins, directions, inv_directions,
+                hit_t, hit_triangle):
+    """Find the first triangle hit by each ray (Moller-Trumbore), traversing the BVH nearest child first."""
+    stack = np.empty(128, dtype=np.int64)
+    for r in range(origins.shape[0]):
+        o = origins[r]
+        d = directions[r]
+        inv = inv_directions[r]
+        best = np.inf
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            if _ray_box(o, inv, node_min[node], node_max[node], best) == np.inf:
+                continue
+            if node >= n_internal:
+                leaf = node - n_internal
+                for t in range(leaf_starts[leaf], leaf_starts[leaf + 1]):
+                    ax, ay, az = triangles[t, 0, 0], triangles[t, 0, 1], triangles[t, 0, 2]
+                    e1x, e1y, e1z = triangles[t, 1, 0] - ax, triangles[t, 1, 1] - ay, triangles[t, 1, 2] - az
+                    e2x, e2y, e2z = triangles[t, 2, 0] - ax, triangles[t, 2, 1] - ay, triangles[t, 2, 2] - az
+                    # pvec = d x e2
+                    px, py, pz = d[1] * e2z - d[2] * e2y, d[2] * e2x - d[0] * e2z, d[0] * e2y - d[1] * e2x
+                    det = e1x * px + e1y * py + e1z * pz
+                    if det == 0:
+                        continue
+                    inv_det = 1 / det
+                    tx, ty, tz = o[0] - ax, o[1] - ay, o[2] - az
+                    u = (tx * px + ty * py + tz * pz) * inv_det
+                    if u < 0 or u > 1:
+                        continue
+                    # qvec = tvec x e1
+                    qx, qy, qz = ty * e1z - tz * e1y, tz * e1x - tx * e1z, tx * e1y - ty * e1x
+                    v = (d[0] * qx + d[1] * qy + d[2] * qz) * inv_det
+                    if v < 0 or u + v > 1:
+                        continue
+                    distance = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+                    if 0 <= distance < best:
+                        best = distance
+                        hit_triangle[r] = t
+            else:
+                left = 2 * node + 1
+                right = left + 1
+                t_left = _ray_box(o, inv, node_min[left], node_max[left], best)
+                t_right = _ray_box(o, inv, node_min[right], node_max[right], best)
+                if t_left < t_right:
+                    left, right = right, left
+                    t_left, t_right = t_right, t_left
+                if t_left < np.inf:
+                    stack[top] = left
+                    top += 1
+                if t_right < np.inf:
+                    stack[top] = right
+                    top += 1
+        hit_t[r] = best
+    return hit_t, hit_triangle
+
+
+@jit(nopython=True)
+def dda_init(origin, end, start, stop, voxel_size, step, t_max, t_delta, remaining):
+    """Initialize the state of the 3D DDA along the segment from origin (in voxel start) to end (in voxel stop)."""
+    for a in range(3):
+        remaining[a] = abs(stop[a] - start[a])
+        d = end[a] - origin[a]
+        if stop[a] > start[a]:
+            step[a] = 1
+            t_max[a] = ((start[a] + 1) * voxel_size - origin[a]) / d
+        else:
+            step[a] = -1
+            t_max[a] = (start[a] * voxel_size - origin[a]) / d if remaining[a] else np.inf
+        t_delta[a] = voxel_size / abs(d) if remaining[a] else np.inf
+
+
+@jit(nopython=True)
+def dda_step(step, t_max, t_delta, remaining):
+    """Advance the 3D DDA across the nearest voxel boundary and return the axis crossed."""
+    axis = -1
+    for a in range(3):
+        if remaining[a] > 0 and (axis < 0 or t_max[a] < t_max[axis]):
+            axis = a
+    t_max[axis] += t_delta[axis]
+    remaining[axis] -= 1
+    return axis
+
+
+@jit(nopython=True)
+def dda_traverse(origin, ends, start, stop, voxel_size, offsets, out):
+    """Write in out[offsets[r]:offsets[r + 1]] the voxels crossed by the segment from origin to ends[r].
+
+    start is the voxel of origin and stop (N, 3) the voxel of each end.
+    Each step moves to the neighbor across the nearest voxel boundary,
+    only along the axes not yet at stop, so the segment takes exactly
+    sum(abs(stop - start)) steps. The voxels are written packed as in
+    structures.tsdf.pack_voxels, so start and stop must be in its range.
+    """
+    offset = 2 ** 20
+    ijk = np.empty(3, dtype=np.int64)
+    step = np.empty(3, dtype=np.int64)
+    remaining = np.empty(3, dtype=np.int64)
+    t_max = np.empty(3)
+    t_delta = np.empty(3)
+    for r in range(ends.shape[0]):
+        dda_init(origin, ends[r], start, stop[r], voxel_size, step, t_max, t_delta, remaining)
+        for a in range(3):
+            ijk[a] = start[a] + offset
+        out[offsets[r]] = (ijk[0] << 42) | (ijk[1] << 21) | ijk[2]
+        for m in range(offsets[r] + 1, offsets[r + 1]):
+            axis = dda_step(step, t_max, t_delta, remaining)
+            ijk[axis] += step[axis]
+            out[m] = (ijk[0] << 42) | (ijk[1] << 21) | ijk[2]
     return out
+
+
+@jit(nopython=True)
+def dda_mark(origin, ends, start, stop, voxel_size, hit, lo, flags):
+    """Mark in flags the voxels crossed by the segments from origin to each end, as dda_traverse.
+
+    flags is a grid of the voxels from lo to the maximum of start and stop.
+    The voxel of ends[r] is set to 2 if hit[r], and the other voxels
+    crossed are set to 1 unless they are already 2.
+    """
+    ijk = np.empty(3, dtype=np.int64)
+    step = np.empty(3, dtype=np.int64)
+    remaining = np.empty(3, dtype=np.int64)
+    t_max = np.empty(3)
+    t_delta = np.empty(3)
+    for r in range(ends.shape[0]):
+        dda_init(origin, ends[r], start, stop[r], voxel_size, step, t_max, t_delta, remaining)
+        for a in range(3):
+            ijk[a] = start[a] - lo[a]
+        for m in range(remaining[0] + remaining[1] + remaining[2]):
+            if flags[ijk[0], ijk[1], ijk[2]] == 0:
+                flags[ijk[0], ijk[1], ijk[2]] = 1
+            axis = dda_step(step, t_max, t_delta, remaining)
+            ijk[axis] += step[axis]
+        if hit[r]:
+            flags[ijk[0], ijk[1], ijk[2]] = 2
+        elif flags[ijk[0], ijk[1], ijk[2]] == 0:
+            flags[ijk[0], ijk[1], ijk[2]] = 1
+    return flags
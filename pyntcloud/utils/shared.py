@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from copy import copy
+
+import numpy as np
+import pandas as pd
+
+from ..structures import KDTree, VoxelGrid
+
+try:
+    from multiprocessing import shared_memory
+    is_shared_memory_avaliable = True
+except ImportError:
+    is_shared_memory_avaliable = False
+
+
+class SharedArrays(object):
+    """Picklable handle to a group of ndarrays stored in shared memory.
+
+    Only the name, dtype and shape of each array are pickled, so sending the
+    handle to other processes is cheap. Arrays are attached on first access.
+    """
+
+    def __init__(self):
+        if not is_shared_memory_avaliable:
+            raise ImportError("multiprocessing.shared_memory (Python >= 3.8) is required")
+        self.specs = OrderedDict()
+        self._blocks = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_blocks"] = {}
+        return state
+
+    def put(self, key, array):
+        """Copy array into a new shared memory block and return the shared view."""
+        array = np.ascontiguousarray(array)
+        # size 0 blocks are not allowed
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        self._blocks[key] = block
+        self.specs[key] = (block.name, array.dtype.str, array.shape)
+        return shared
+
+    def get(self, key, read_only=True):
+        """Return the shared array stored under key, without copying it."""
+        name, dtype, shape = self.specs[key]
+        if key not in self._blocks:
+            self._blocks[key] = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=dtype, buffer=self._blocks[key].buf)
+        if read_only:
+            array.flags.writeable = False
+        return array
+
+    def close(self):
+        """Detach this process from the shared memory blocks.
+
+        Arrays returned by get must not be used after calling close.
+        """
+        for block in self._blocks.values():
+            block.close()
+        self._blocks = {}
+
+    def unlink(self):
+        """Free the shared memory blocks. Only the process that created them should call it."""
+        for key, (name, dtype, shape) in self.specs.items():
+            block = self._blocks.pop(key, None) or shared_memory.SharedMemory(name=name)
+            block.unlink()
+            block.close()
+
+
+class SharedPyntCloudHandle(SharedArrays):
+    """Returned by PyntCloud.to_shared. See PyntCloud.from_shared."""
+
+    def __init__(self, pyntcloud):
+        super().__init__()
+        points = pyntcloud.points
+        self.put("xyz", pyntcloud.xyz)
+        self.centroid = pyntcloud.centroid
+
+        self.columns = []
+        for column in points.columns:
+            self.columns.append(column)
+            if column not in ["x", "y", "z"]:
+                self.put("points/{}".format(column), points[column].values)
+
+        if pyntcloud.mesh is None:
+            self.mesh_columns = None
+        else:
+            self.mesh_columns = list(pyntcloud.mesh.columns)
+            for column in self.mesh_columns:
+                self.put("mesh/{}".format(column), pyntcloud.mesh[column].values)
+
+        self.structures = OrderedDict()
+        for key, structure in pyntcloud.structures.items():
+            if isinstance(structure, VoxelGrid):
+                # the arrays go to shared memory, the rest is pickled
+                shell = copy(structure)
+                shell._points = None
+                for attr in VoxelGrid.SHARED_ARRAYS:
+                    if getattr(structure, attr, None) is not None:
+                        self.put("structures/{}/{}".format(key, attr), getattr(structure, attr))
+                    setattr(shell, attr, None)
+                self.structures[key] = shell
+            elif isinstance(structure, KDTree):
+                # rebuilt over the shared xyz by each process, when used
+                self.structures[key] = {
+                    "leafsize": structure._leafsize,
+                    "compact_nodes": structure._compact_nodes,
+                    "balanced_tree": structure._balanced_tree
+                }
+
+    def get_points(self):
+        xyz = self.get("xyz")
+        data = OrderedDict()
+        for column in self.columns:
+            if column in ["x", "y", "z"]:
+                data[column] = xyz[:, "xyz".index(column)]
+            else:
+                data[column] = self.get("points/{}".format(column))
+        return xyz, pd.DataFrame(data, copy=False)
+
+    def get_mesh(self):
+        if self.mesh_columns is None:
+            return None
+        return pd.DataFrame(OrderedDict(
+            (x, self.get("mesh/{}".format(x))) for x in self.mesh_columns), copy=False)
+
+    def get_structures(self, xyz):
+        structures = OrderedDict()
+        for key, shell in self.structures.items():
+            if isinstance(shell, dict):
+                structure = KDTree(points=xyz, **shell)
+                structure.id = key
+                structure._deferred = True
+            else:
+                structure = copy(shell)
+                structure._points = xyz
+                for attr in shell.SHARED_ARRAYS:
+                    if "structures/{}/{}".format(key, attr) in self.specs:
+                        setattr(structure, attr, self.get("structures/{}/{}".format(key, attr)))
+            structures[key] = structure
+        return structures
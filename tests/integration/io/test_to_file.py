@@ -34,4 +34,53 @@ def test_to_file(tmpdir, diamond, extension, color, mesh):
 
 def test_to_bin_raises_ValueError_if_invalid_kwargs(tmpdir, diamond):
     with pytest.raises(ValueError):
-        diamond.to_file(str(tmpdir.join("written.bin")), also_save=["mesh"])
\ No newline at end of file
+        diamond.to_file(str(tmpdir.join("written.bin")), also_save=["mesh"])
+
+
+def test_to_file_also_save_structures(tmpdir, diamond):
+    voxelgrid_id = diamond.add_structure("voxelgrid", n_x=2, n_y=2, n_z=2)
+    kdtree_id = diamond.add_structure("kdtree")
+    filename = str(tmpdir.join("written.ply"))
+
+    diamond.to_file(filename, also_save=["structures"])
+
+    # loading is opt-in
+    assert len(PyntCloud.from_file(filename).structures) == 0
+
+    written_file = PyntCloud.from_file(filename, load_structures=True)
+
+    assert set(written_file.structures) == {voxelgrid_id, kdtree_id}
+    voxelgrid = written_file.structures[voxelgrid_id]
+    assert (voxelgrid.voxel_n == diamond.structures[voxelgrid_id].voxel_n).all()
+    assert voxelgrid.n_voxels == 8
+    kdtree = written_file.structures[kdtree_id]
+    assert kdtree.n == 6
+    assert kdtree.query(written_file.xyz[0])[1] == 0
+
+    # the same requests reuse the loaded structures
+    assert written_file.add_structure("voxelgrid", n_x=2, n_y=2, n_z=2) == voxelgrid_id
+    assert written_file.structures[voxelgrid_id] is voxelgrid
+    assert written_file.structures.hits == 1
+
+    # explicit directory
+    structures_dir = str(tmpdir.join("cache"))
+    diamond.to_file(filename, also_save=["structures"], structures_dir=structures_dir)
+    assert set(PyntCloud.from_file(filename, structures_dir=structures_dir).structures) == {voxelgrid_id, kdtree_id}
+
+    # other content, no structures loaded
+    diamond.points = diamond.points.iloc[:5]
+    diamond.to_file(filename)
+    assert len(PyntCloud.from_file(filename, load_structures=True).structures) == 0
+
+
+def test_to_file_structures_need_same_xyz(tmpdir, diamond):
+    # values that can't be stored as float32 are changed by the file
+    points = diamond.points.copy()
+    points[["x", "y", "z"]] = points[["x", "y", "z"]].astype("float64") + 1e-9
+    diamond.points = points
+    diamond.add_structure("kdtree")
+    filename = str(tmpdir.join("written.ply"))
+
+    diamond.to_file(filename, also_save=["structures"])
+
+    assert len(PyntCloud.from_file(filename, load_structures=True).structures) == 0
@@ -3,6 +3,7 @@ import pytest
 import numpy as np
 import pandas as pd
 from shutil import rmtree
+from scipy.spatial import ConvexHull
 from pyntcloud import PyntCloud
 
 path = os.path.abspath(os.path.dirname(__file__))
@@ -94,3 +95,172 @@ def test_split_on():
     assert len(output) == 8
 
     rmtree("tmp_out")
+
+
+def test_apply_filter_lazy():
+    """PyntCloud.apply_filter(lazy=True).
+
+    - xyz and centroid must be updated without compacting points
+    - Chained lazy filters must be composed
+    - Reading points must give the same result as eager filtering
+
+    """
+    points = pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"])
+    points["foo"] = np.arange(100)
+
+    eager = PyntCloud(points.copy())
+    lazy = PyntCloud(points.copy())
+
+    for cloud, is_lazy in [(eager, False), (lazy, True)]:
+        cloud.apply_filter(cloud.xyz[:, 0] > 0.2, lazy=is_lazy)
+        cloud.apply_filter(cloud.xyz[:, 1] < 0.8, lazy=is_lazy)
+
+    assert lazy._selection is not None
+    np.testing.assert_array_equal(lazy.xyz, eager.xyz)
+    np.testing.assert_allclose(lazy.centroid, eager.centroid)
+
+    pd.testing.assert_frame_equal(lazy.points, eager.points)
+    assert lazy._selection is None
+
+    with pytest.raises(ValueError):
+        lazy.apply_filter(np.ones(len(lazy.xyz) + 1, dtype=bool), lazy=True)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_apply_filter_keeps_structures(lazy):
+    """PyntCloud.apply_filter.
+
+    - VoxelGrids must be derived for the kept points reusing the grid geometry
+    - KDTrees must be rebuilt over the kept points when accessed, by any accessor
+    - add_structure must give what a fresh build gives
+
+    """
+    points = pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"])
+    cloud = PyntCloud(points)
+
+    voxelgrid_id = cloud.add_structure("voxelgrid", n_x=4, n_y=4, n_z=4)
+    kdtree_id = cloud.add_structure("kdtree")
+    voxel_n = cloud.structures[voxelgrid_id].voxel_n
+    segments = cloud.structures[voxelgrid_id].segments
+
+    mask = cloud.xyz[:, 0] > 0.5
+    cloud.apply_filter(mask, lazy=lazy)
+
+    assert len(cloud.structures) == 2
+    voxelgrid = cloud.structures[voxelgrid_id]
+    np.testing.assert_array_equal(voxelgrid.voxel_n, voxel_n[mask])
+    assert voxelgrid.segments is segments
+
+    kdtree = cloud.structures[kdtree_id]
+    assert kdtree.n == mask.sum()
+    np.testing.assert_array_equal(kdtree.data, cloud.xyz)
+
+    for accessor in [
+            lambda structures: structures.get(kdtree_id),
+            lambda structures: dict(structures.items())[kdtree_id],
+            lambda structures: [x for x in structures.values() if x.id == kdtree_id][0]]:
+        filtered = PyntCloud(points)
+        filtered.add_structure("kdtree")
+        filtered.apply_filter(mask, lazy=lazy)
+        kdtree = accessor(filtered.structures)
+        assert not kdtree._deferred
+        np.testing.assert_array_equal(kdtree.query(filtered.xyz)[1], np.arange(mask.sum()))
+
+    assert cloud.add_structure("kdtree") == kdtree_id
+    assert cloud.structures.hits == 1
+    assert cloud.add_structure("voxelgrid", n_x=4, n_y=4, n_z=4) == voxelgrid_id
+    assert cloud.structures.hits == 1
+    voxelgrid = cloud.structures[voxelgrid_id]
+    fresh = PyntCloud(pd.DataFrame(cloud.xyz, columns=["x", "y", "z"]))
+    fresh = fresh.structures[fresh.add_structure("voxelgrid", n_x=4, n_y=4, n_z=4)]
+    np.testing.assert_array_equal(voxelgrid.voxel_n, fresh.voxel_n)
+    for axis in range(3):
+        np.testing.assert_array_equal(voxelgrid.segments[axis], fresh.segments[axis])
+
+
+def test_add_points_extends_structures():
+    """PyntCloud.add_points.
+
+    - Incremental ConvexHulls and Delaunay3Ds must include the new points
+    - KDTrees must be rebuilt over all the points when accessed
+    - Other structures must be removed
+
+    """
+    points = pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"])
+    new_points = pd.DataFrame(np.random.rand(50, 3) * 2, columns=["x", "y", "z"])
+    cloud = PyntCloud(points)
+
+    hull_id = cloud.add_structure("convex_hull", incremental=True)
+    delaunay_id = cloud.add_structure("delanuay3D", incremental=True)
+    kdtree_id = cloud.add_structure("kdtree")
+    cloud.add_structure("voxelgrid")
+
+    cloud.add_points(new_points)
+
+    assert len(cloud.xyz) == 150
+    assert set(cloud.structures) == {hull_id, delaunay_id, kdtree_id}
+    assert cloud.add_structure("convex_hull", incremental=True) == hull_id
+
+    all_points = np.concatenate([points.values, new_points.values])
+    expected = ConvexHull(all_points)
+    assert set(cloud.structures[hull_id].vertices) == set(expected.vertices)
+    assert cloud.structures[delaunay_id].find_simplex(all_points).min() >= 0
+    np.testing.assert_array_equal(cloud.structures[kdtree_id].data, all_points)
+
+    with pytest.raises(ValueError):
+        cloud.add_points(new_points.assign(red=0))
+
+
+def test_add_scalar_field_memoization(monkeypatch):
+    """PyntCloud.add_scalar_field.
+
+    - Same name and inputs must not be recomputed while the columns exist
+    - Different inputs writing the same columns must be recomputed
+
+    """
+    from pyntcloud.scalar_fields.k_neighbors import EigenValues
+
+    calls = []
+    compute = EigenValues.compute
+    monkeypatch.setattr(EigenValues, "compute", lambda self: calls.append(1) or compute(self))
+
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(50, 3), columns=["x", "y", "z"]))
+    k_neighbors = cloud.get_neighbors(k=4)
+    ev = cloud.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+    assert cloud.add_scalar_field("eigen_values", k_neighbors=k_neighbors.copy()) == ev
+    assert len(calls) == 1
+
+    cloud.add_scalar_field("eigen_values", k_neighbors=k_neighbors[::-1].copy())
+    cloud.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+    assert len(calls) == 3
+
+    cloud.points = cloud.points.drop(ev, axis=1)
+    cloud.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+    assert len(calls) == 4
+
+
+def test_add_scalar_field_disk_cache(tmpdir, monkeypatch):
+    """PyntCloud.add_scalar_field with sf_cache.
+
+    - Values must be reused from disk by other clouds with the same inputs
+    - Least recently used entries must be evicted above max_bytes
+
+    """
+    from pyntcloud.scalar_fields import ScalarFieldCache
+    from pyntcloud.scalar_fields.xyz import SphericalCoordinates
+
+    points = pd.DataFrame(np.random.rand(50, 3), columns=["x", "y", "z"])
+    cache = ScalarFieldCache(str(tmpdir), max_bytes=10 ** 6)
+
+    cloud = PyntCloud(points.copy(), sf_cache=cache)
+    added = cloud.add_scalar_field("spherical_coords")
+    assert len(tmpdir.listdir()) == 1
+
+    monkeypatch.setattr(SphericalCoordinates, "compute", None)
+    other = PyntCloud(points.copy(), sf_cache=cache)
+    assert other.add_scalar_field("spherical_coords") == added
+    np.testing.assert_array_equal(other.points[added].values, cloud.points[added].values)
+
+    cache.max_bytes = 1
+    cloud.add_scalar_field("cylindrical_coords")
+    assert len(tmpdir.listdir()) == 1
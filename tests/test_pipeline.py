@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from pyntcloud import PyntCloud
+
+
+def random_cloud(n=200):
+    return PyntCloud(pd.DataFrame(np.random.rand(n, 3), columns=["x", "y", "z"]))
+
+
+def test_pipeline_matches_eager_execution():
+    cloud = random_cloud()
+    eager = PyntCloud(cloud.points.copy())
+
+    bbox = {"min_x": 0.1, "max_x": 0.9}
+
+    eager.get_filter("BBOX", and_apply=True, **bbox)
+    kdtree = eager.add_structure("kdtree")
+    k_neighbors = eager.get_neighbors(k=5, kdtree=kdtree)
+    ev = eager.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+    planarity = eager.add_scalar_field("planarity", ev=ev)
+
+    pipeline = cloud.pipeline()
+    pipeline.get_filter("BBOX", and_apply=True, **bbox)
+    kdtree = pipeline.add_structure("kdtree")
+    k_neighbors = pipeline.get_neighbors(k=5, kdtree=kdtree)
+    ev = pipeline.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+    result = pipeline.execute(pipeline.add_scalar_field("planarity", ev=ev))
+
+    assert result == planarity
+    np.testing.assert_allclose(cloud.points[planarity], eager.points[planarity])
+    # intermediates are released
+    assert list(cloud.points.columns) == ["x", "y", "z", planarity]
+    assert len(cloud.structures) == 0
+
+
+def test_pipeline_skips_unused_steps_and_shares_neighbors():
+    cloud = random_cloud()
+    pipeline = cloud.pipeline()
+    pipeline.add_structure("voxelgrid", n_x=4, n_y=4, n_z=4)
+    kdtree = pipeline.add_structure("kdtree")
+    k3 = pipeline.get_neighbors(k=3, kdtree=kdtree)
+    k8 = pipeline.get_neighbors(k=8, kdtree=kdtree)
+    k8_again = pipeline.get_neighbors(k=8, kdtree=kdtree)
+
+    explanation = pipeline.explain(k3, k8, k8_again)
+    assert "0 add_structure(voxelgrid) -> skipped" in explanation
+    assert "same as step 3" in explanation
+    assert "shared query with k=8" in explanation
+    assert "Estimated peak memory" in explanation
+
+    k3, k8, k8_again = pipeline.execute(k3, k8, k8_again)
+
+    assert k3.shape == (200, 3)
+    assert k8.shape == (200, 8)
+    assert k8_again is k8
+    np.testing.assert_array_equal(k3, k8[:, :3])
+    assert cloud.structures.n_voxelgrids == 0
@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyntcloud import PyntCloud
+from pyntcloud.utils.shared import is_shared_memory_avaliable
+
+pytestmark = pytest.mark.skipif(
+    not is_shared_memory_avaliable, reason="requires multiprocessing.shared_memory")
+
+
+def count_voxel_points(args):
+    handle, voxelgrid_id = args
+    cloud = PyntCloud.from_shared(handle)
+    voxelgrid = cloud.structures[voxelgrid_id]
+    result = np.bincount(voxelgrid.voxel_n, minlength=voxelgrid.n_voxels), cloud.points["foo"].sum()
+    handle.close()
+    return result
+
+
+def test_from_shared_returns_views_of_shared_memory():
+    points = pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"])
+    points["foo"] = np.arange(100)
+    cloud = PyntCloud(points)
+    voxelgrid_id = cloud.add_structure("voxelgrid", n_x=2, n_y=2, n_z=2)
+    kdtree_id = cloud.add_structure("kdtree")
+
+    handle = cloud.to_shared()
+    try:
+        shared = PyntCloud.from_shared(handle)
+
+        pd.testing.assert_frame_equal(shared.points, cloud.points)
+        np.testing.assert_array_equal(shared.xyz, cloud.xyz)
+        assert np.shares_memory(shared.xyz, shared.points["x"].values)
+        assert not shared.xyz.flags.writeable
+
+        voxelgrid = shared.structures[voxelgrid_id]
+        np.testing.assert_array_equal(voxelgrid.voxel_n, cloud.structures[voxelgrid_id].voxel_n)
+        assert not voxelgrid.voxel_n.flags.writeable
+
+        assert shared.structures[kdtree_id].n == 100
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(count_voxel_points, [(handle, voxelgrid_id)] * 2))
+
+        expected = np.bincount(cloud.structures[voxelgrid_id].voxel_n, minlength=8)
+        for counts, foo_sum in results:
+            np.testing.assert_array_equal(counts, expected)
+            assert foo_sum == points["foo"].sum()
+        del shared, voxelgrid
+    finally:
+        handle.unlink()
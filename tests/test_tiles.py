@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyntcloud import PyntCloud
+from pyntcloud.tiles import TiledPyntCloud
+
+
+@pytest.fixture()
+def random_cloud():
+    np.random.seed(0)
+    return PyntCloud(pd.DataFrame(np.random.rand(2000, 3), columns=["x", "y", "z"]))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_tiled_k_neighbors_scalar_field_matches_in_memory(random_cloud, n_jobs):
+    # small halo, so some tiles must be reprocessed with a bigger one
+    tiled = TiledPyntCloud(random_cloud, tile_size=0.3, halo=0.01, n_jobs=n_jobs)
+    assert len(tiled.tiles) > 1
+    ev = tiled.add_scalar_field("eigen_values", k_neighbors=8)
+
+    k_neighbors = random_cloud.get_neighbors(k=8)
+    expected = random_cloud.add_scalar_field("eigen_values", k_neighbors=k_neighbors)
+
+    assert ev == expected
+    for name in ev:
+        np.testing.assert_array_equal(tiled.scalar_fields[name], random_cloud.points[name].values)
+
+
+@pytest.mark.parametrize("name, kwargs", [
+    ("BBOX", {"min_x": 0.2, "max_y": 0.7}),
+    ("ROR", {"k": 5, "r": 0.06}),
+    ("SOR", {"k": 5, "z_max": 1.5}),
+])
+def test_tiled_filters_match_in_memory(random_cloud, name, kwargs):
+    tiled = TiledPyntCloud(random_cloud.points, tile_size=0.25, halo=0.05, n_jobs=1)
+    result = tiled.get_filter(name, **kwargs)
+
+    if name != "BBOX":
+        kwargs["kdtree_id"] = random_cloud.add_structure("kdtree")
+    expected = random_cloud.get_filter(name, **kwargs)
+
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_tiled_non_local_scalar_field_raises(random_cloud):
+    tiled = TiledPyntCloud(random_cloud, tile_size=0.5, halo=0.1, n_jobs=1)
+    with pytest.raises(ValueError):
+        tiled.add_scalar_field("plane_fit")
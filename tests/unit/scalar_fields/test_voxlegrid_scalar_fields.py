@@ -1,7 +1,9 @@
 import pytest
 
 import numpy as np
+import pandas as pd
 
+from pyntcloud import PyntCloud
 from pyntcloud.scalar_fields.voxelgrid import (
     EuclideanClusters,
     VoxelgridScalarField,
@@ -76,4 +78,32 @@ def test_EuclideanClusters_values(pyntcloud_with_clusters_and_voxelgrid_id):
     with np.errstate(divide='ignore', invalid='ignore'):
         scalar_field.compute()
     scalar_field_values = next(iter(scalar_field.to_be_added.values()))
-    assert all(scalar_field_values[:5] != scalar_field_values[5:])
\ No newline at end of file
+    assert all(scalar_field_values[:5] != scalar_field_values[5:])
+
+
+@pytest.mark.parametrize("connectivity, n_clusters", [
+    (6, 3),
+    (18, 2),
+    (26, 1)
+])
+def test_EuclideanClusters_connectivity(connectivity, n_clusters):
+    # voxels (0, 0, 0), (1, 1, 0) and (2, 2, 1) only touch by edges / corners
+    points = np.array([
+        [0.5, 0.5, 0.5],
+        [1.5, 1.5, 0.5],
+        [2.5, 2.5, 1.5],
+        [2.5, 2.5, 1.6],
+        [0.0, 0.0, 0.0],
+        [3.0, 3.0, 3.0]])
+    cloud = PyntCloud(pd.DataFrame(points[[5, 2, 0, 3, 1, 4]], columns=["x", "y", "z"]))
+    voxelgrid_id = cloud.add_structure("voxelgrid", n_x=3, n_y=3, n_z=3)
+    scalar_field = EuclideanClusters(
+        pyntcloud=cloud,
+        voxelgrid_id=voxelgrid_id,
+        connectivity=connectivity)
+    scalar_field.extract_info()
+    scalar_field.compute()
+    clusters = next(iter(scalar_field.to_be_added.values()))
+    assert len(np.unique(clusters)) == n_clusters
+    # first cluster is the one containing the lowest voxel
+    assert clusters[cloud.structures[voxelgrid_id].voxel_n.argmin()] == 0
@@ -0,0 +1,86 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from scipy.spatial import ConvexHull
+
+from pyntcloud import PyntCloud
+from pyntcloud.structures import bvh
+from pyntcloud.structures.bvh import closest_point_on_triangles, ray_triangle_intersection
+
+
+@pytest.fixture(params=[True, False], ids=["numba", "numpy"])
+def sphere(request, monkeypatch):
+    if request.param and not bvh.is_numba_avaliable:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(bvh, "is_numba_avaliable", request.param)
+    points = np.random.randn(300, 3)
+    points /= np.linalg.norm(points, axis=1)[:, None]
+    mesh = pd.DataFrame(ConvexHull(points).simplices, columns=["v1", "v2", "v3"])
+    cloud = PyntCloud(pd.DataFrame(points, columns=["x", "y", "z"]), mesh=mesh)
+    cloud.add_structure("bvh", leaf_size=3)
+    return cloud
+
+
+def test_closest_point_matches_brute_force(sphere):
+    structure = sphere.structures["B(3)"]
+    points = np.random.randn(200, 3) * 0.8
+    distances, triangles, closest = structure.closest_point(points, chunk_size=64)
+
+    a, b, c = sphere.get_mesh_vertices()
+    n = len(a)
+    all_closest = closest_point_on_triangles(
+        np.repeat(points, n, axis=0), np.tile(a, (len(points), 1)), np.tile(b, (len(points), 1)),
+        np.tile(c, (len(points), 1))).reshape(len(points), n, 3)
+    all_distances = np.linalg.norm(all_closest - points[:, None], axis=2)
+    np.testing.assert_allclose(distances, all_distances.min(1))
+    np.testing.assert_allclose(distances, all_distances[np.arange(len(points)), triangles])
+    np.testing.assert_allclose(np.linalg.norm(closest - points, axis=1), distances)
+
+
+def test_raycast_matches_brute_force(sphere):
+    structure = sphere.structures["B(3)"]
+    origins = np.random.randn(200, 3) * 0.3
+    directions = np.random.randn(200, 3)
+    # rays pointing away from the sphere miss it
+    origins[:50] = directions[:50] / np.linalg.norm(directions[:50], axis=1)[:, None] * 2
+    t, triangles = structure.raycast(origins, directions, chunk_size=64)
+
+    a, b, c = sphere.get_mesh_vertices()
+    n = len(a)
+    all_t = ray_triangle_intersection(
+        np.repeat(origins, n, axis=0), np.repeat(directions, n, axis=0),
+        np.tile(a, (len(origins), 1)), np.tile(b, (len(origins), 1)),
+        np.tile(c, (len(origins), 1))).reshape(len(origins), n)
+    np.testing.assert_allclose(t, all_t.min(1))
+    assert np.all(triangles[:50] == -1)
+    np.testing.assert_allclose(t[50:], all_t[np.arange(50, len(origins)), triangles[50:]])
+
+
+def test_closest_point_on_triangles_regions():
+    a, b, c = np.array([0., 0, 0]), np.array([1., 0, 0]), np.array([0., 1, 0])
+    points = np.array([[-1, -1, 1], [2, -0.5, 0], [0.5, -1, 0], [0.2, 0.2, 3], [1, 1, -1]])
+    expected = np.array([[0, 0, 0], [1, 0, 0], [0.5, 0, 0], [0.2, 0.2, 0], [0.5, 0.5, 0]])
+    n = len(points)
+    closest = closest_point_on_triangles(points, np.tile(a, (n, 1)), np.tile(b, (n, 1)), np.tile(c, (n, 1)))
+    np.testing.assert_allclose(closest, expected)
+
+
+@pytest.mark.parametrize("use_numba", [True, False], ids=["numba", "numpy"])
+def test_closest_point_degenerate_triangles(monkeypatch, use_numba):
+    if use_numba and not bvh.is_numba_avaliable:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(bvh, "is_numba_avaliable", use_numba)
+    points = np.array([[0., 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 1]])
+    # a segment and a point
+    mesh = pd.DataFrame([[0, 1, 2], [3, 3, 1], [3, 3, 3]], columns=["v1", "v2", "v3"])
+    cloud = PyntCloud(pd.DataFrame(points, columns=["x", "y", "z"]), mesh=mesh)
+    structure = cloud.structures[cloud.add_structure("bvh")]
+
+    queries = np.array([[1.5, 0.5, 0.5], [1, 1, 2], [0.2, 0.2, 0.1]])
+    distances, triangles, closest = structure.closest_point(queries)
+
+    np.testing.assert_allclose(closest, [[1, 0.5, 0.5], [1, 1, 1], [0.2, 0.2, 0]])
+    np.testing.assert_allclose(distances, [0.5, 1, 0.1])
+    np.testing.assert_array_equal(triangles[[0, 2]], [1, 0])
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from scipy.spatial import ConvexHull, Delaunay
+
+from pyntcloud import PyntCloud
+from pyntcloud.structures.delanuay import tetrahedra_circumradii, tetrahedra_faces
+
+
+def test_tetrahedra_faces_are_unique():
+    points = np.random.rand(100, 3)
+    simplices = Delaunay(points).simplices
+    faces = tetrahedra_faces(simplices)
+    sorted_faces = set(map(tuple, np.sort(faces, axis=1)))
+    assert len(sorted_faces) == len(faces)
+    expected = set(
+        tuple(sorted(tetra[list(x)])) for tetra in simplices
+        for x in [[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+    assert sorted_faces == expected
+
+
+def test_boundary_faces_are_the_convex_hull_oriented_outwards():
+    points = np.random.rand(100, 3)
+    faces = tetrahedra_faces(Delaunay(points).simplices, points, boundary=True)
+    hull = ConvexHull(points)
+    assert set(map(tuple, np.sort(faces, axis=1))) == set(map(tuple, np.sort(hull.simplices, axis=1)))
+
+    a, b, c = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]]
+    normals = np.cross(b - a, c - a)
+    assert np.all(np.einsum("ij,ij->i", normals, a - points.mean(0)) > 0)
+
+
+def test_tetrahedra_circumradii():
+    points = np.random.rand(50, 3)
+    simplices = Delaunay(points).simplices
+    radii = tetrahedra_circumradii(points, simplices)
+    for tetra, radius in zip(simplices[:10], radii[:10]):
+        a, b, c, d = points[tetra]
+        # the circumcenter is equidistant to the 4 vertices
+        center = np.linalg.solve(2 * np.array([b - a, c - a, d - a]),
+                                 [b @ b - a @ a, c @ c - a @ a, d @ d - a @ a])
+        np.testing.assert_allclose(np.linalg.norm(points[tetra] - center, axis=1), radius)
+
+    flat = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]], dtype=float)
+    assert np.isinf(tetrahedra_circumradii(flat, np.array([[0, 1, 2, 3]])))
+
+
+def test_alpha_shape_of_all_tetrahedra_is_the_convex_hull():
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"]))
+    delaunay = cloud.structures[cloud.add_structure("delanuay3D")]
+    hull = cloud.structures[cloud.add_structure("convex_hull")]
+
+    shapes = dict(delaunay.iter_alpha_shapes([0, np.inf]))
+    assert len(shapes[0]) == 0
+    np.testing.assert_array_equal(shapes[np.inf].values, delaunay.get_mesh(boundary=True).values)
+    assert set(map(tuple, np.sort(shapes[np.inf].values, axis=1))) == \
+        set(map(tuple, np.sort(hull.get_mesh().values, axis=1)))
+
+
+def test_incremental_structures_have_their_own_id():
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"]))
+    for name in ["delanuay3D", "convex_hull"]:
+        static_id = cloud.add_structure(name)
+        incremental_id = cloud.add_structure(name, incremental=True)
+        assert static_id != incremental_id
+        assert cloud.add_structure(name) == static_id
+        assert not cloud.structures[static_id]._incremental
+        assert cloud.structures[incremental_id]._incremental
+    assert cloud.structures.n_delanuays == 2
+    assert cloud.structures.n_convex_hulls == 2
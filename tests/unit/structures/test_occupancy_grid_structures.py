@@ -0,0 +1,128 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from pyntcloud import PyntCloud
+from pyntcloud.structures import occupancy_grid
+from pyntcloud.structures.occupancy_grid import FREE, OCCUPIED, UNKNOWN, OccupancyGrid, traverse
+from pyntcloud.structures.tsdf import unpack_voxels
+
+
+@pytest.fixture(params=[True, False], ids=["numba", "numpy"])
+def use_numba(request, monkeypatch):
+    if request.param and not occupancy_grid.is_numba_avaliable:
+        pytest.skip("numba is not installed")
+    monkeypatch.setattr(occupancy_grid, "is_numba_avaliable", request.param)
+
+
+def wall_scan(x=2.0, n=5000, seed=0):
+    yz = np.random.RandomState(seed).uniform(-1, 1, (n, 2))
+    return np.column_stack([np.full(n, x), yz])
+
+
+def test_traverse_matches_dense_sampling(use_numba):
+    rng = np.random.RandomState(0)
+    origin = rng.uniform(-0.5, 0.5, 3)
+    ends = rng.uniform(-3, 3, (200, 3))
+    keys, offsets = traverse(origin, ends, 0.1)
+    voxels = unpack_voxels(keys)
+    for r in range(len(ends)):
+        ray = voxels[offsets[r]:offsets[r + 1]]
+        np.testing.assert_array_equal(ray[0], np.floor(origin / 0.1))
+        np.testing.assert_array_equal(ray[-1], np.floor(ends[r] / 0.1))
+        # face neighbors
+        assert np.all(np.abs(np.diff(ray, axis=0)).sum(1) == 1)
+        # sampling may miss voxels where the ray only clips a corner
+        samples = origin + np.linspace(0, 1, 10001)[:, None] * (ends[r] - origin)
+        sampled = np.unique(np.floor(samples / 0.1).astype(np.int64), axis=0)
+        assert len(np.unique(np.concatenate([ray, sampled]), axis=0)) == len(ray)
+        assert len(sampled) >= len(ray) - 2
+
+
+def test_traverse_out_of_range(use_numba):
+    with pytest.raises(ValueError):
+        traverse(np.zeros(3), np.array([[1, 0, 0], [1e6, 0, 0]]), 0.1)
+    with pytest.raises(ValueError):
+        traverse(np.array([0, -1e6, 0]), np.ones((1, 3)), 0.1)
+    grid = OccupancyGrid(points=np.zeros((1, 3)), voxel_size=0.1)
+    grid.compute()
+    with pytest.raises(ValueError):
+        grid.integrate(np.array([[1e6, 0, 0]]), origin=[0, 0, 0])
+    assert grid.n_blocks == 0
+
+
+def test_free_occupied_unknown(use_numba):
+    grid = OccupancyGrid(points=np.zeros((1, 3)), voxel_size=0.1)
+    grid.compute()
+    for seed in range(3):
+        grid.integrate(wall_scan(seed=seed), origin=[0, 0, 0])
+    xyz = np.array([[2.05, 0, 0], [1, 0, 0], [3, 0, 0], [-1, 0, 0]])
+    np.testing.assert_array_equal(grid.get_state(xyz), [OCCUPIED, FREE, UNKNOWN, UNKNOWN])
+    probability = grid.get_probability(xyz)
+    assert probability[0] > 0.9 and probability[1] < 0.3
+    np.testing.assert_array_equal(probability[2:], 0.5)
+
+    ijk, probability = grid.get_voxels(OCCUPIED)
+    assert np.all(ijk[:, 0] == 20)
+    assert np.all(probability > 0.5)
+
+
+def test_change_detection(use_numba):
+    grid = OccupancyGrid(points=np.zeros((1, 3)), voxel_size=0.1)
+    grid.compute()
+    grid.integrate(wall_scan(x=2), origin=[0, 0, 0])
+    # the wall is moved further away
+    for seed in range(5):
+        grid.integrate(wall_scan(x=3, seed=seed), origin=[0, 0, 0])
+    xyz = np.array([[2.05, 0, 0], [3.05, 0, 0]])
+    np.testing.assert_array_equal(grid.get_state(xyz), [FREE, OCCUPIED])
+    # clamped
+    assert grid.get_voxels()[1].max() <= 0.97 + 1e-6
+
+
+def test_chunks_and_max_range(use_numba):
+    scan = wall_scan(x=2)
+    a = OccupancyGrid(points=scan, voxel_size=0.1, origin=[0, 0, 0], max_range=1.5)
+    a.compute()
+    b = OccupancyGrid(points=scan, voxel_size=0.1, max_range=1.5)
+    b.compute()
+    b.integrate(scan, origin=[0, 0, 0], chunk_size=100)
+    ijk, probability = a.get_voxels()
+    assert len(b.get_voxels()[0]) == len(ijk)
+    np.testing.assert_array_equal(b.get_probability(a.get_voxel_centers(ijk)), probability)
+    assert np.all(probability < 0.5)
+    assert np.all(a.get_voxel_centers(a.get_voxels()[0])[:, 0] < 1.6)
+
+
+def test_dense_and_sparse_marking_match(use_numba, monkeypatch):
+    scan = wall_scan(n=2000)
+    grids = []
+    for max_scan_voxels in [occupancy_grid.MAX_SCAN_VOXELS, 0]:
+        monkeypatch.setattr(occupancy_grid, "MAX_SCAN_VOXELS", max_scan_voxels)
+        # some points are beyond max_range
+        grid = OccupancyGrid(points=scan, voxel_size=0.1, max_range=2.2)
+        grid.compute()
+        for seed in range(3):
+            grid.integrate(wall_scan(n=2000, seed=seed), origin=[0.05, 0.1, 0], chunk_size=500)
+        grids.append(grid)
+    dense, sparse = grids
+    ijk, probability = dense.get_voxels()
+    assert len(sparse.get_voxels()[0]) == len(ijk)
+    np.testing.assert_array_equal(sparse.get_probability(dense.get_voxel_centers(ijk)), probability)
+    assert len(dense.get_voxels(OCCUPIED)[0]) > 0
+    assert len(dense.get_voxels(FREE)[0]) > 0
+
+
+def test_add_structure():
+    scan = wall_scan(n=1000)
+    cloud = PyntCloud(pd.DataFrame(scan, columns=["x", "y", "z"]))
+    pose = np.eye(4)
+    pose[:3, 3] = [-1, 0, 0]
+    grid_id = cloud.add_structure("occupancy_grid", voxel_size=0.1, pose=pose)
+    octree_id = cloud.add_structure("octree")
+    assert cloud.structures.n_occupancy_grids == 1
+    assert cloud.structures.n_octrees == 1
+    grid = cloud.structures[grid_id]
+    np.testing.assert_array_equal(grid.get_state([[1.05, 0, 0], [0, 0, 0]]), [OCCUPIED, FREE])
+    assert octree_id != grid_id
@@ -0,0 +1,145 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from pyntcloud import PyntCloud
+from pyntcloud.structures import Octree
+
+
+@pytest.fixture()
+def octree():
+    points = np.random.rand(500, 3)
+    octree = Octree(points=points, max_level=4)
+    octree.compute()
+    return octree
+
+
+def test_level_keys_are_the_child_codes_of_each_level(octree):
+    points = octree._points
+    mid_points = np.broadcast_to((octree.xyzmin + octree.xyzmax) / 2, points.shape)
+    expected = np.zeros(len(points), dtype=np.uint64)
+    for level in range(1, octree.max_level + 1):
+        bigger = points >= mid_points
+        code = bigger[:, 0] + 2 * bigger[:, 1] + 4 * bigger[:, 2]
+        expected = expected * np.uint64(8) + code.astype(np.uint64)
+        np.testing.assert_array_equal(octree.get_level(level), expected)
+        half = octree.sizes[level - 1] / 2
+        mid_points = np.where(bigger, mid_points + half, mid_points - half)
+
+
+def test_node_range_holds_the_points_of_the_node(octree):
+    for level in [0, 2, 4]:
+        keys = octree.get_level(level)
+        nodes, starts, counts = octree.get_nodes(level)
+        start, end = octree.get_node_range(level, nodes)
+        np.testing.assert_array_equal(start, starts)
+        np.testing.assert_array_equal(end - start, counts)
+        for node in nodes[:5]:
+            np.testing.assert_array_equal(
+                np.sort(octree.get_node_points(level, node)),
+                np.flatnonzero(keys == node))
+    start, end = octree.get_node_range(4, int(nodes.max()) + 1)
+    assert start == end
+
+
+def test_get_centroids(octree):
+    nodes, starts, counts = octree.get_nodes(2)
+    keys = octree.get_level(2)
+    centroids = octree.get_centroids(2)
+    for node, centroid in zip(nodes, centroids):
+        np.testing.assert_allclose(centroid, octree._points[keys == node].mean(0))
+
+
+def test_octree_is_added_as_structure_and_subset():
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"]))
+    octree_id = cloud.add_structure("octree", max_level=3)
+    assert octree_id == "O(3)"
+    assert cloud.structures.n_octrees == 1
+
+    octree = cloud.structures[octree_id]
+    mask = cloud.xyz[:, 0] > 0.5
+    subset = octree.subset(cloud.xyz[mask], mask)
+    np.testing.assert_array_equal(subset.keys, octree.keys[mask])
+    np.testing.assert_array_equal(subset.sorted_keys, np.sort(octree.keys[mask]))
+
+
+def test_eigen_decomposition_matches_per_node_covariance():
+    points = np.random.rand(300, 3) * [1, 1, 0.1] + 100
+    octree = Octree(points=points, max_level=4)
+    octree.compute()
+    level = 3
+
+    e1, e2, e3, ev1, ev2, ev3 = octree.eigen_decomposition(level)
+
+    for node in np.unique(octree.get_level(level)):
+        inside = octree.get_level(level) == node
+        group_level = level
+        group = inside
+        # fallback to the closest ancestor with at least 3 points
+        while group.sum() < 3:
+            group_level -= 1
+            group = octree.get_level(group_level) == (node >> np.uint64(3 * (level - group_level)))
+        expected = np.linalg.eigvalsh(np.cov(points[group].T))[::-1]
+        np.testing.assert_allclose(np.c_[e1, e2, e3][inside], np.tile(expected, (inside.sum(), 1)), atol=1e-9)
+        cov = np.cov(points[group].T)
+        np.testing.assert_allclose(cov.dot(ev1[inside][0]), e1[inside][0] * ev1[inside][0], atol=1e-9)
+
+
+def test_queries_match_cKDTree():
+    from scipy.spatial import cKDTree
+
+    points = np.random.rand(2000, 3)
+    # a dense cluster, so node sizes vary a lot
+    points[:200] *= 0.01
+    octree = Octree(points=points, max_level=6)
+    octree.compute()
+    kdtree = cKDTree(points)
+    queries = np.random.rand(200, 3) * 1.2 - 0.1
+
+    distances, indices = octree.query_knn(queries, k=6)
+    np.testing.assert_allclose(distances, kdtree.query(queries, k=6)[0])
+
+    for found, expected in zip(octree.query_radius(queries, 0.1), kdtree.query_ball_point(queries, 0.1)):
+        np.testing.assert_array_equal(found, np.sort(expected))
+
+    min_xyz, max_xyz = [0.2, -np.inf, 0.005], [0.7, 0.5, np.inf]
+    np.testing.assert_array_equal(
+        octree.query_box(min_xyz, max_xyz),
+        np.flatnonzero(np.all((points > min_xyz) & (points < max_xyz), axis=1)))
+
+
+def test_octree_can_be_used_instead_of_kdtree():
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(300, 3), columns=["x", "y", "z"]))
+    octree_id = cloud.add_structure("octree", max_level=4)
+    kdtree_id = cloud.add_structure("kdtree")
+
+    np.testing.assert_array_equal(
+        cloud.get_neighbors(k=4, kdtree=octree_id),
+        cloud.get_neighbors(k=4, kdtree=kdtree_id))
+    np.testing.assert_array_equal(
+        cloud.get_filter("BBOX", min_x=0.3, max_z=0.6, octree_id=octree_id),
+        cloud.get_filter("BBOX", min_x=0.3, max_z=0.6))
+    np.testing.assert_array_equal(
+        cloud.get_filter("SOR", kdtree_id=octree_id, k=4, z_max=1),
+        cloud.get_filter("SOR", kdtree_id=kdtree_id, k=4, z_max=1))
+
+
+@pytest.mark.parametrize("representative", ["centroid", "first", "random"])
+def test_lod_has_one_point_per_node(octree, representative):
+    for level, nodes, xyz in octree.iter_lod(representative=representative):
+        expected_nodes = octree.get_nodes(level)[0]
+        np.testing.assert_array_equal(nodes, expected_nodes)
+        lod_nodes, lod_xyz = octree.get_lod(level, representative=representative)
+        np.testing.assert_array_equal(lod_nodes, nodes)
+        if representative == "centroid":
+            np.testing.assert_allclose(xyz, octree.get_centroids(level))
+            np.testing.assert_allclose(lod_xyz, xyz)
+        else:
+            keys = octree.get_level(level)
+            for node, point in zip(nodes, xyz):
+                node_points = octree._points[keys == node]
+                assert np.any(np.all(node_points == point, axis=1))
+                if representative == "first":
+                    first = octree.get_node_points(level, node)[0]
+                    np.testing.assert_array_equal(point, octree._points[first])
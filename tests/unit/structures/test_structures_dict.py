@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from pyntcloud import PyntCloud
+from pyntcloud.structures import KDTree, VoxelGrid
+from pyntcloud.structures.base import StructuresDict
+
+
+def test_StructuresDict_evicts_least_recently_used_over_budget(simple_pyntcloud):
+    structures = StructuresDict()
+    voxelgrids = []
+    for n in [2, 3, 4]:
+        voxelgrid = VoxelGrid(points=simple_pyntcloud.xyz, n_x=n, n_y=n, n_z=n)
+        voxelgrid.compute()
+        voxelgrids.append(voxelgrid)
+        structures[voxelgrid.id] = voxelgrid
+
+    assert structures.nbytes == sum(x.nbytes for x in voxelgrids)
+
+    # touch the first one, so the second one is the least recently used
+    structures[voxelgrids[0].id]
+    structures.max_bytes = voxelgrids[0].nbytes + voxelgrids[2].nbytes
+    kdtree = KDTree(points=simple_pyntcloud.xyz)
+    kdtree.compute()
+    structures[kdtree.id] = kdtree
+
+    assert list(structures) == [voxelgrids[0].id, kdtree.id]
+    assert structures.nbytes <= structures.max_bytes
+    assert structures.n_voxelgrids == 1
+    assert structures.evictions == 2
+
+
+def test_StructuresDict_bookkeeping_in_every_method(simple_pyntcloud):
+    structures = StructuresDict()
+    built = []
+    for n in [2, 3, 4]:
+        voxelgrid = VoxelGrid(points=simple_pyntcloud.xyz, n_x=n, n_y=n, n_z=n)
+        voxelgrid.compute()
+        built.append(voxelgrid)
+    kdtree = KDTree(points=simple_pyntcloud.xyz)
+    kdtree.compute()
+    built.append(kdtree)
+
+    def check():
+        assert list(structures._lru) == list(structures)
+        assert structures.nbytes == sum(x.nbytes for x in dict.values(structures))
+        assert structures.n_voxelgrids == sum(isinstance(x, VoxelGrid) for x in dict.values(structures))
+        assert structures.n_kdtrees == sum(isinstance(x, KDTree) for x in dict.values(structures))
+
+    structures.update({x.id: x for x in built[:2]})
+    check()
+    assert structures.setdefault(built[2].id, built[2]) is built[2]
+    assert structures.setdefault(built[2].id, built[0]) is built[2]
+    check()
+    structures.update([(kdtree.id, kdtree)])
+    check()
+    assert structures.pop(built[1].id) is built[1]
+    assert structures.pop(built[1].id, None) is None
+    check()
+    assert structures.popitem() == (built[0].id, built[0])
+    check()
+    del structures[kdtree.id]
+    check()
+    structures.clear()
+    check()
+    assert structures.nbytes == 0 and not structures._lru
+
+    structures.max_bytes = built[0].nbytes
+    structures.update({x.id: x for x in built[:2]})
+    assert list(structures) == [built[1].id]
+    assert structures.evictions == 1
+    check()
+
+
+def test_add_structure_reuses_structures_with_same_arguments():
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(100, 3), columns=["x", "y", "z"]))
+
+    first = cloud.add_structure("voxelgrid", size_x=0.2, size_y=0.2, size_z=0.2)
+    structure = cloud.structures[first]
+    second = cloud.add_structure("voxelgrid", size_x=0.2, size_y=0.2, size_z=0.2)
+
+    assert first == second
+    assert cloud.structures[second] is structure
+    assert cloud.structures.hits == 1
+    assert cloud.structures.misses == 1
+
+    cloud.get_neighbors(k=2)
+    cloud.get_neighbors(k=3)
+    assert cloud.structures.n_kdtrees == 1
+    assert cloud.structures.hits == 2
+
+
+def test_request_key_uses_array_content():
+    a = np.zeros(2000)
+    b = np.zeros(2000)
+    b[1000] = 1
+    # same abbreviated repr
+    assert repr(a) == repr(b)
+    assert StructuresDict._request_key("x", {"v": a}) != StructuresDict._request_key("x", {"v": b})
+    assert StructuresDict._request_key("x", {"v": a}) == StructuresDict._request_key("x", {"v": a.copy()})
+
+
+def test_add_structure_does_not_reuse_mutable_structures():
+    cloud = PyntCloud(pd.DataFrame(np.random.rand(100, 3) + [0, 0, 2], columns=["x", "y", "z"]))
+
+    first = cloud.add_structure("tsdf", voxel_size=0.1, origin=np.zeros(3))
+    volume = cloud.structures[first]
+    volume.integrate(np.random.rand(100, 3) + [0, 0, 2], origin=np.zeros(3))
+    second = cloud.add_structure("tsdf", voxel_size=0.1, origin=np.zeros(3))
+
+    assert first == second
+    assert cloud.structures[second] is not volume
+    assert cloud.structures.hits == 0
@@ -0,0 +1,135 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from pyntcloud import PyntCloud
+from pyntcloud.structures import TSDFVolume
+from pyntcloud.structures.tsdf import pack_voxels, unpack_voxels
+
+
+def sphere_scan(origin, radius=1.0, n=20000, seed=0):
+    """Points of a sphere centered at (0, 0, 0) visible from origin."""
+    points = np.random.RandomState(seed).normal(size=(n, 3))
+    points *= radius / np.linalg.norm(points, axis=1)[:, None]
+    return points[np.einsum("ij,ij->i", points, origin - points) > 0]
+
+
+def scanned_volume(voxel_size=0.05):
+    volume = TSDFVolume(points=np.zeros((1, 3)), voxel_size=voxel_size)
+    volume.compute()
+    for origin in np.eye(3).tolist() + (-np.eye(3)).tolist():
+        origin = 3 * np.array(origin)
+        volume.integrate(sphere_scan(origin, seed=len(volume.block_keys)), origin=origin)
+    return volume
+
+
+def test_extract_points_on_surface():
+    volume = scanned_volume()
+    points = volume.extract_points()
+    assert len(points) > 1000
+    error = np.abs(np.linalg.norm(points.values, axis=1) - 1)
+    # projective distances are less accurate for rays at grazing angles
+    assert np.median(error) < volume.voxel_size / 4
+    assert error.max() < 2 * volume.voxel_size
+
+
+def edge_counts(faces):
+    edges = np.sort(faces[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1)
+    return np.unique(edges, axis=0, return_counts=True)[1]
+
+
+def test_extract_mesh_outwards():
+    volume = scanned_volume()
+    points, mesh = volume.extract_mesh()
+    xyz = points.values
+    error = np.abs(np.linalg.norm(xyz, axis=1) - 1)
+    assert np.median(error) < volume.voxel_size / 4
+    assert error.max() < 2 * volume.voxel_size
+
+    faces = mesh.values
+    v1, v2, v3 = xyz[faces[:, 0]], xyz[faces[:, 1]], xyz[faces[:, 2]]
+    normals = np.cross(v2 - v1, v3 - v1)
+    assert np.mean(np.einsum("ij,ij->i", normals, v1 + v2 + v3) > 0) > 0.99
+
+    # grazing rays leave a few holes near the silhouettes of the scans
+    counts = edge_counts(faces)
+    assert counts.max() == 2
+    assert np.mean(counts == 2) > 0.98
+
+
+def test_extract_mesh_closed():
+    volume = TSDFVolume(points=np.zeros((1, 3)), voxel_size=0.1)
+    volume.compute()
+    ijk = np.stack(np.meshgrid(*[np.arange(-15, 15)] * 3, indexing="ij"), -1).reshape(-1, 3)
+    slots, local = volume._locate(ijk, allocate=True)
+    distance = np.linalg.norm((ijk + 0.5) * volume.voxel_size, axis=1) - 1
+    volume.tsdf[slots, local] = np.clip(distance / volume.truncation, -1, 1)
+    volume.weight[slots, local] = 1
+
+    points, mesh = volume.extract_mesh()
+    assert np.abs(np.linalg.norm(points.values, axis=1) - 1).max() < 0.01
+    assert np.all(edge_counts(mesh.values) == 2)
+
+
+def test_integrate_with_pose_matches_origin():
+    scan = sphere_scan(np.array([0, 0, 3.0]))
+    pose = np.eye(4)
+    pose[:3, 3] = [0.5, -0.2, 0.1]
+    a = TSDFVolume(points=scan, voxel_size=0.1)
+    a.compute()
+    a.integrate(scan + pose[:3, 3], origin=pose[:3, 3])
+    a.integrate(scan + pose[:3, 3], origin=pose[:3, 3])
+    b = TSDFVolume(points=scan, voxel_size=0.1)
+    b.compute()
+    b.integrate(scan, pose=pose)
+    b.integrate(scan, pose=pose)
+    for x, y in zip(a.get_voxels(), b.get_voxels()):
+        np.testing.assert_allclose(np.sort(x, axis=0), np.sort(y, axis=0), atol=1e-6)
+
+
+def test_weight_counts_scans():
+    scan = sphere_scan(np.array([0, 0, 3.0]), n=2000)
+    a = TSDFVolume(points=scan, voxel_size=0.1)
+    a.compute()
+    b = TSDFVolume(points=scan, voxel_size=0.1)
+    b.compute()
+    for _ in range(2):
+        a.integrate(scan, origin=[0, 0, 3.0])
+        b.integrate(scan, origin=[0, 0, 3.0], chunk_size=100)
+    assert np.all(a.get_voxels()[2] == 2)
+    for x, y in zip(a.get_voxels(), b.get_voxels()):
+        np.testing.assert_allclose(np.sort(x, axis=0), np.sort(y, axis=0), atol=1e-6)
+
+
+def test_blocks_allocated_near_surface():
+    volume = scanned_volume(voxel_size=0.1)
+    ijk, tsdf, weight = volume.get_voxels()
+    assert volume.n_blocks < 0.5 * np.prod(np.ptp(ijk, axis=0) / volume.block_size + 1)
+    values, weights = volume.get_values(ijk)
+    np.testing.assert_array_equal(values, tsdf)
+    np.testing.assert_array_equal(weights, weight)
+    assert np.all(volume.get_values(np.array([[1000, 0, 0]]))[1] == 0)
+
+
+def test_pack_voxels_range():
+    ijk = np.array([[-2 ** 20, 0, 2 ** 20 - 1], [5, -7, 0]])
+    np.testing.assert_array_equal(unpack_voxels(pack_voxels(ijk)), ijk)
+    for bad in [[2 ** 20, 0, 0], [0, -2 ** 20 - 1, 0]]:
+        with pytest.raises(ValueError):
+            pack_voxels(np.array([bad]))
+
+    volume = TSDFVolume(points=np.zeros((1, 3)), voxel_size=0.1)
+    volume.compute()
+    with pytest.raises(ValueError):
+        volume.integrate(np.array([[0, 0, 1e6]]), origin=[0, 0, 0])
+
+
+def test_add_structure():
+    scan = sphere_scan(np.array([0, 0, 3.0]), n=2000)
+    cloud = PyntCloud(pd.DataFrame(scan, columns=["x", "y", "z"]))
+    with pytest.raises(ValueError):
+        cloud.structures[cloud.add_structure("tsdf", voxel_size=0.1)].integrate(scan)
+    tsdf_id = cloud.add_structure("tsdf", voxel_size=0.1, origin=[0, 0, 3.0])
+    assert cloud.structures.n_tsdfs == 2
+    assert len(cloud.structures[tsdf_id].extract_points())
@@ -4,7 +4,7 @@ import numpy as np
 import pandas as pd
 
 from pyntcloud import PyntCloud
-from pyntcloud.structures import VoxelGrid
+from pyntcloud.structures import VoxelGrid, VoxelGridSpec
 
 
 def test_default_number_of_voxels_per_axis(simple_pyntcloud):
@@ -94,3 +94,148 @@ def test_output_shape_of_all_feature_vector_modes(mode, simple_pyntcloud):
     feature_vector = voxelgrid.get_feature_vector(mode=mode)
 
     assert feature_vector.shape == (2, 2, 2)
+
+
+def test_subset_keeps_geometry_and_voxel_indices_of_kept_points(simple_pyntcloud):
+    voxelgrid = VoxelGrid(points=simple_pyntcloud.xyz, n_x=2, n_y=2, n_z=2)
+    voxelgrid.compute()
+    mask = np.array([True, False, True, False, True, False])
+
+    subset = voxelgrid.subset(simple_pyntcloud.xyz[mask], mask)
+
+    assert subset.id == voxelgrid.id
+    assert subset.n_voxels == voxelgrid.n_voxels
+    np.testing.assert_array_equal(subset.voxel_n, voxelgrid.voxel_n[mask])
+    np.testing.assert_array_equal(subset.voxel_x, voxelgrid.voxel_x[mask])
+    np.testing.assert_array_equal(subset.voxel_centers, voxelgrid.voxel_centers)
+
+
+@pytest.mark.parametrize("mode", [
+    "binary",
+    "density",
+    "x_mean",
+    "z_max"
+])
+def test_sparse_feature_vectors_match_dense(mode, simple_pyntcloud):
+    dense = VoxelGrid(points=simple_pyntcloud.xyz, n_x=2, n_y=3, n_z=4)
+    dense.compute()
+    sparse = VoxelGrid(points=simple_pyntcloud.xyz, n_x=2, n_y=3, n_z=4, sparse=True)
+    sparse.compute()
+
+    assert sparse.voxel_centers is None
+    np.testing.assert_array_equal(sparse.voxel_occupied[sparse.voxel_inverse], sparse.voxel_n)
+    np.testing.assert_allclose(sparse.get_voxel_centers(), dense.voxel_centers[np.unique(dense.voxel_n)])
+
+    feature_vector = sparse.get_feature_vector(mode=mode)
+    assert feature_vector.nnz == len(sparse.voxel_occupied)
+    np.testing.assert_allclose(
+        feature_vector.toarray().reshape(sparse.x_y_z),
+        dense.get_feature_vector(mode=mode))
+
+
+def test_sparse_memory_scales_with_occupied_voxels():
+    points = np.random.rand(100, 3) * 2000
+    voxelgrid = VoxelGrid(points=points, size_x=0.05, size_y=0.05, size_z=0.05, sparse=True)
+    voxelgrid.compute()
+
+    assert voxelgrid.n_voxels > 10 ** 13
+    assert voxelgrid.nbytes < 10 ** 5
+    np.testing.assert_allclose(voxelgrid.get_feature_vector("density").data.sum(), 1)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("connectivity, max_distance", [
+    (6, 1),
+    (18, 2),
+    (26, 3)
+])
+def test_get_voxel_neighbors_batch(sparse, connectivity, max_distance):
+    points = np.random.rand(50, 3)
+    voxelgrid = VoxelGrid(points=points, n_x=4, n_y=5, n_z=6, sparse=sparse)
+    voxelgrid.compute()
+    voxels = np.unique(voxelgrid.voxel_n)
+
+    neighbors = voxelgrid.get_voxel_neighbors_batch(voxels, connectivity=connectivity)
+
+    assert neighbors.shape == (len(voxels), connectivity)
+    ijk = np.column_stack(np.unravel_index(voxels, voxelgrid.x_y_z))
+    for i, voxel in enumerate(voxels):
+        distance = np.abs(ijk - ijk[i])
+        expected = voxels[(distance.max(1) == 1) & (distance.sum(1) <= max_distance)]
+        found = neighbors[i][neighbors[i] >= 0]
+        np.testing.assert_array_equal(np.sort(found), expected)
+        if connectivity == 26:
+            assert voxelgrid.get_voxel_neighbors(voxel) == sorted(list(expected) + [voxel])
+
+
+def test_get_feature_vectors_stacks_modes():
+    points = np.random.rand(200, 3) - 0.5
+    voxelgrid = VoxelGrid(points=points, n_x=3, n_y=4, n_z=5)
+    voxelgrid.compute()
+    modes = ["binary", "density", "x_mean", "z_max", "TDF"]
+
+    feature_vectors = voxelgrid.get_feature_vectors(modes)
+
+    assert feature_vectors.shape == (5, 3, 4, 5)
+    for i, mode in enumerate(modes):
+        np.testing.assert_allclose(feature_vectors[i], voxelgrid.get_feature_vector(mode))
+
+    z_max = feature_vectors[3].ravel()
+    for voxel in np.unique(voxelgrid.voxel_n):
+        assert z_max[voxel] == points[voxelgrid.voxel_n == voxel, 2].max()
+
+
+def test_get_feature_vectors_sparse():
+    points = np.random.rand(200, 3) - 0.5
+    voxelgrid = VoxelGrid(points=points, n_x=3, n_y=4, n_z=5)
+    voxelgrid.compute()
+    sparse = VoxelGrid(points=points, n_x=3, n_y=4, n_z=5, sparse=True)
+    sparse.compute()
+    modes = ["binary", "TDF", "x_mean", "TDF"]
+
+    feature_vectors = sparse.get_feature_vectors(modes)
+
+    assert isinstance(feature_vectors, np.ndarray)
+    np.testing.assert_allclose(feature_vectors, voxelgrid.get_feature_vectors(modes))
+
+
+def test_TDF_is_truncated_and_normalized():
+    points = np.random.rand(100, 3)
+    voxelgrid = VoxelGrid(points=points, n_x=16, n_y=16, n_z=16)
+    voxelgrid.compute()
+
+    tdf = voxelgrid.get_feature_vector("TDF").ravel()
+
+    truncation = 2 * max(voxelgrid.shape)
+    distances = np.linalg.norm(voxelgrid.voxel_centers[:, None, :] - points[None, :, :], axis=2).min(1)
+    np.testing.assert_allclose(tdf, np.clip(1 - distances / truncation, 0, 1), atol=1e-6)
+    assert tdf.min() == 0
+
+    sparse = VoxelGrid(points=points, n_x=16, n_y=16, n_z=16, sparse=True)
+    sparse.compute()
+    np.testing.assert_allclose(sparse.get_feature_vector("TDF").toarray().ravel(), tdf, atol=1e-6)
+
+    # chunks smaller than the neighborhood of a voxel still hold one voxel
+    voxels, values = sparse._compute_tdf(chunk_size=10)
+    np.testing.assert_allclose(values, tdf[voxels], atol=1e-6)
+    assert len(voxels) == np.count_nonzero(tdf)
+
+
+def test_spec_queries_new_points_like_the_grid(tmpdir):
+    points = np.random.rand(100, 3)
+    voxelgrid = VoxelGrid(points=points, n_x=3, n_y=4, n_z=5)
+    voxelgrid.compute()
+
+    spec = VoxelGridSpec.from_bytes(voxelgrid.get_spec().to_bytes())
+    spec.save(str(tmpdir.join("spec.npz")))
+    spec = VoxelGridSpec.load(str(tmpdir.join("spec.npz")))
+
+    assert spec.x_y_z == voxelgrid.x_y_z
+    np.testing.assert_array_equal(spec.query(points), voxelgrid.voxel_n)
+
+    new_points = np.random.rand(50, 3) * 2 - 0.5
+    outside = np.any((new_points < voxelgrid.xyzmin) | (new_points > voxelgrid.xyzmax), axis=1)
+    voxel_n = spec.query(new_points, clip=False)
+    assert np.all(voxel_n[outside] == -1)
+    np.testing.assert_array_equal(voxel_n[~outside], voxelgrid.query(new_points[~outside]))
+    assert np.all(spec.query(new_points) < spec.n_voxels)
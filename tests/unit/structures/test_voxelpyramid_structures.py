@@ -0,0 +1,39 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from pyntcloud import PyntCloud
+
+
+@pytest.fixture()
+def cloud():
+    return PyntCloud(pd.DataFrame(np.random.rand(1000, 3) * [1, 2, 3], columns=["x", "y", "z"]))
+
+
+@pytest.mark.parametrize("mode", ["binary", "density", "x_mean", "z_max"])
+def test_levels_match_voxelgrids(cloud, mode):
+    pyramid = cloud.structures[cloud.add_structure("voxelpyramid", max_level=4)]
+    for level in range(5):
+        n = 2 ** level
+        voxelgrid = cloud.structures[cloud.add_structure("voxelgrid", n_x=n, n_y=n, n_z=n)]
+        np.testing.assert_array_equal(pyramid.get_voxel_n(level), voxelgrid.voxel_n)
+        np.testing.assert_allclose(pyramid.get_feature_vector(level, mode), voxelgrid.get_feature_vector(mode))
+        np.testing.assert_allclose(
+            pyramid.get_feature_vector(level, mode, sparse=True).toarray().reshape(n, n, n),
+            voxelgrid.get_feature_vector(mode))
+
+        voxels, counts = pyramid.get_occupied(level)
+        np.testing.assert_array_equal(np.sort(voxels), np.unique(voxelgrid.voxel_n))
+        np.testing.assert_array_equal(counts, np.bincount(voxelgrid.voxel_n)[voxels])
+        np.testing.assert_allclose(pyramid.get_voxel_centers(level, voxels), voxelgrid.voxel_centers[voxels], rtol=1e-6)
+
+
+def test_voxel_map_points_to_parent_voxel(cloud):
+    pyramid = cloud.structures[cloud.add_structure("voxelpyramid", max_level=5)]
+    finest = pyramid.get_occupied(5)[0]
+    for level in [0, 2, 4]:
+        voxels = pyramid.get_occupied(level)[0]
+        parents = voxels[pyramid.get_voxel_map(level)]
+        ijk = np.column_stack(np.unravel_index(finest, pyramid.get_shape(5))) // 2 ** (5 - level)
+        np.testing.assert_array_equal(parents, np.ravel_multi_index(ijk.T, pyramid.get_shape(level)))